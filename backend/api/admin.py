@@ -1,14 +1,18 @@
-import io
+import json
 import logging
 
 from typing import List
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from pptx import Presentation
 
-from core.rag_engine import rag_engine, KnowledgeDoc
-from core.config import METADATA_PATH
+from core.rag_engine import rag_engine
+from services.ingestion import ingestion_queue
+from api.uploads import UPLOAD_OPENAPI, spool_uploads
+from services.answer_cache import answer_cache
+from services.evaluation import parse_items, evaluate
+from core.config import EVAL_CONCURRENCY
 from core.auth import require_admin
 
 logger = logging.getLogger(__name__)
@@ -17,6 +21,7 @@ router = APIRouter(prefix="/admin", tags=["admin"])
 
 class KnowledgeStats(BaseModel):
     docs: int
+    chunks: int = 0
     steps: List[str]
 
 
@@ -27,61 +32,42 @@ def get_knowledge_stats(admin: dict = Depends(require_admin)) -> KnowledgeStats:
     return KnowledgeStats(**stats)
 
 
-@router.post("/upload-pptx")
-async def upload_pptx(
-    step: str = Form(...),
-    files: List[UploadFile] = File(...),
-    admin: dict = Depends(require_admin),
-):
+@router.post("/upload", status_code=202, openapi_extra=UPLOAD_OPENAPI)
+@router.post("/upload-pptx", status_code=202, openapi_extra=UPLOAD_OPENAPI)
+async def upload_pptx(request: Request, admin: dict = Depends(require_admin)):
     """
-    Protegido: Recebe um ou mais PPTX da trilha, extrai textos dos slides
-    e adiciona na base de conhecimento (RAG).
-    Apenas criadores de conteúdo FCJ podem fazer upload.
+    Protegido: Recebe um ou mais arquivos da trilha (PPTX, PDF ou DOCX) e agenda a
+    ingestão em segundo plano (extração, chunking, embeddings e commit na base).
+    Formulário multipart com `step` e `files`, lido direto para o disco em blocos
+    (nunca inteiro na memória), com limite por arquivo e por envio. Retorna imediatamente um job_id; o progresso fica em
+    /admin/jobs/{job_id}. Apenas criadores de conteúdo FCJ podem fazer upload.
     """
-    docs: List[KnowledgeDoc] = []
-
-    for f in files:
-        if not f.filename.lower().endswith(".pptx"):
-            raise HTTPException(status_code=400, detail="Apenas arquivos .pptx são permitidos.")
-
-        content = await f.read()
-        prs = Presentation(io.BytesIO(content))  # type: ignore
-
-        slide_texts = []
-        for idx, slide in enumerate(prs.slides, start=1):
-            texts = []
-            for shp in slide.shapes:
-                if hasattr(shp, "text") and shp.text:
-                    texts.append(shp.text)
-            if texts:
-                joined = " ".join(texts).strip()
-                slide_texts.append(f"Slide {idx}: {joined}")
-
-        if not slide_texts:
-            continue
-
-        full_text = "\n".join(slide_texts)
-        doc = KnowledgeDoc(
-            id=f.filename,
-            step=step,
-            title=f.filename,
-            text=full_text,
-        )
-        docs.append(doc)
-
-    if not docs:
-        raise HTTPException(status_code=400, detail="Não foi possível extrair texto dos PPTX enviados.")
-
-    logger.info(f"Admin {admin.get('sub')} adicionando {len(docs)} documentos à etapa '{step}'")
-    rag_engine.add_documents(docs)
+    fields, spool, saved = await spool_uploads(request)
+    step = fields["step"]
+    job = ingestion_queue.submit(step, admin.get("sub"), saved, spool)
+    logger.info(f"Admin {admin.get('sub')} enviou {len(saved)} arquivo(s) para a etapa '{step}' (job {job.id})")
+    return {
+        "status": "queued",
+        "job_id": job.id,
+        "files": job.filenames,
+    }
 
-    stats = rag_engine.get_stats()
-    logger.info(f"Upload concluído. Base agora tem {stats['docs']} documentos")
+
+@router.get("/jobs/{job_id}")
+def get_job_status(job_id: str, admin: dict = Depends(require_admin)):
+    """Protegido: progresso de um job de ingestão"""
+    job = ingestion_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    return job.to_dict()
+
+
+@router.get("/cache")
+def get_cache_stats(admin: dict = Depends(require_admin)):
+    """Protegido: contadores dos caches de perguntas e de respostas (por worker)"""
     return {
-        "status": "ok",
-        "added": len(docs),
-        "docs_total": stats["docs"],
-        "steps": stats["steps"],
+        "query_embeddings": rag_engine.query_cache.stats(),
+        "answers": answer_cache.stats(),
     }
 
 
@@ -91,3 +77,42 @@ def reload_knowledge(admin: dict = Depends(require_admin)):
     rag_engine.reload()
     stats = rag_engine.get_stats()
     return {"status": "ok", "message": "Base recarregada.", "stats": stats}
+
+
+@router.post("/eval")
+async def evaluate_questions(
+    file: UploadFile = File(...),
+    top_k: int = 5,
+    generate: bool = False,
+    concurrency: int = EVAL_CONCURRENCY,
+    admin: dict = Depends(require_admin),
+):
+    """
+    Protegido: roda um JSONL de perguntas (step, question, expected) pela busca
+    e, com generate=true, pela geração. Responde em NDJSON, uma linha por
+    pergunta (documentos, recall@k, latência, resposta) e o resumo no final.
+    """
+    if not rag_engine.ready:
+        raise HTTPException(status_code=503, detail="A base ainda está carregando.", headers={"Retry-After": "5"})
+    if not 1 <= top_k <= 50 or not 1 <= concurrency <= 32:
+        raise HTTPException(status_code=400, detail="Use top_k entre 1 e 50 e concurrency entre 1 e 32.")
+    try:
+        items = parse_items(await file.read())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # vaga no LLM por admin: o rodízio do controle de admissão não deixa a avaliação atropelar os founders
+    gate_key = "eval\0" + admin.get("sub", "")
+
+    async def generate_with_llm(step, question, docs):
+        from api.agent import generate_answer
+
+        return await generate_answer("avaliação", step, question, docs, gate_key)
+
+    logger.info(f"Admin {admin.get('sub')} iniciou avaliação de {len(items)} perguntas (top_k={top_k}, generate={generate})")
+
+    async def lines():
+        async for result in evaluate(items, top_k, generate_with_llm if generate else None, concurrency):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
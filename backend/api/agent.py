@@ -1,17 +1,42 @@
-from typing import List, Literal
+from typing import List, Literal, Dict, Any, AsyncIterator, Callable, Optional, Tuple
+from dataclasses import dataclass
 from pydantic import BaseModel, Field
 from fastapi import APIRouter, HTTPException, Depends, Request
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+from fastapi.responses import StreamingResponse
+import asyncio
+import json
 import logging
+import time
 
-from core.rag_engine import rag_engine
-from services.openai_client import chat_completion
+import numpy as np
+
+from core.rag_engine import rag_engine, KnowledgeDoc
+from core.shards import knowledge
+from core.config import (
+    OPENAI_MODEL,
+    ANSWER_CACHE_MAX_HISTORY,
+    ANSWER_CACHE_SHARED,
+    RATE_LIMIT_ASK,
+    RATE_LIMIT_UPLOAD,
+    RAG_TENANT_MAX_CHUNKS,
+)
+from services.openai_client import chat_completion, chat_completion_stream, answered_model
+from services.answer_cache import answer_cache, CacheKey
+from services.context_builder import token_counter, pack_context, fit_history, history_budget
+from services.sessions import session_store, session_key
+from services.ingestion import ingestion_queue
+from api.uploads import UPLOAD_OPENAPI, spool_uploads
 from core.auth import verify_founder
+from core.metrics import span, record
+from core.rate_limit import rate_limiter, llm_gate, AdmissionRejected, admission_error
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/agent", tags=["agent"])
-limiter = Limiter(key_func=get_remote_address)
+
+EMPTY_ANSWER_FALLBACK = (
+    "Tive um problema para gerar a resposta agora. "
+    "Tente refazer a pergunta em alguns instantes ou reformule em uma frase mais direta."
+)
 
 
 # ============================================================
@@ -26,7 +51,10 @@ class ChatMessage(BaseModel):
 class AgentRequest(BaseModel):
     startup_id: str = Field(..., description="Nome da startup")
     step: str = Field("todas", description="Etapa da trilha (diagnostico, icp, persona, etc.)")
+    # Legado: o histórico inteiro vindo do cliente. Vazio = usa a sessão no servidor.
     history: List[ChatMessage] = Field(default_factory=list)
+    # Id da conversa (ex.: um por aba); a sessão também é separada por usuário/startup do JWT
+    session_id: Optional[str] = Field(None, max_length=128, description="Id da conversa no servidor")
     user_input: str = Field(..., description="Pergunta do founder")
 
 
@@ -35,48 +63,109 @@ class AgentResponse(BaseModel):
 
 
 # ============================================================
-# ENDPOINT PRINCIPAL DO TR4CTION AGENT
+# MONTAGEM DO PROMPT (compartilhada por /ask e /ask/stream)
 # ============================================================
 
-@router.post("/ask", response_model=AgentResponse)
-@limiter.limit("20/minute")  # 20 requisições por minuto por IP
-async def ask_agent(
-    request: Request,
-    payload: AgentRequest,
-    founder: dict = Depends(verify_founder)
-) -> AgentResponse:
+@dataclass
+class PreparedPrompt:
+    messages: List[Dict[str, Any]]
+    # usados pelo cache de respostas
+    q_emb: Optional[np.ndarray]
+    doc_ids: Tuple[str, ...]
+    tokens: int = 0
+    history_len: int = 0
+    # "<startup>\0<versão>" quando a busca incluiu a base privada da startup
+    private_scope: Optional[str] = None
+
+
+async def _load_history(payload: AgentRequest, founder: dict) -> Tuple[List[Dict[str, str]], Optional[str]]:
     """
-    Endpoint principal para founders (chat protegido).
-    Executa a busca RAG nos documentos + geração de resposta com OpenAI.
-    Apenas founders autenticados podem fazer perguntas.
+    Histórico da conversa e chave da sessão. Se o cliente ainda manda o
+    histórico inteiro (modo legado), ele é usado e a sessão não é tocada.
     """
+    if payload.history:
+        return [m.dict() for m in payload.history], None
+    key = session_key(founder, payload.startup_id, payload.session_id)
+    with span("session.load"):
+        return await asyncio.to_thread(session_store.get, key), key
 
-    if not payload.user_input.strip():
-        raise HTTPException(status_code=400, detail="Pergunta vazia não é permitida.")
 
-    logger.info(f"Nova pergunta de {founder.get('sub')} - Startup: {payload.startup_id}, Step: {payload.step}")
+async def _save_turn(key: Optional[str], question: str, answer: str) -> None:
+    if key is None:
+        return
+    try:
+        with span("session.save"):
+            await asyncio.to_thread(
+                session_store.append,
+                key,
+                [{"role": "user", "content": question}, {"role": "assistant", "content": answer}],
+            )
+    except Exception as e:
+        # perder um turno da sessão não deve derrubar a resposta
+        logger.error(f"Erro ao gravar a sessão: {e}")
+
+
+def _tenant_of(founder: dict) -> Optional[str]:
+    """Startup do JWT (tokens de admin não têm base privada)."""
+    return founder.get("startup") or None
+
+
+def _retrieve(
+    q_emb: np.ndarray, payload: AgentRequest, tenant: Optional[str]
+) -> Tuple[List[KnowledgeDoc], Optional[int]]:
+    """Base global + base da startup (se ela enviou material) e a versão desta."""
+    docs = knowledge.search_by_embedding(q_emb, 6, payload.step, query=payload.user_input, startup=tenant)
+    return docs, knowledge.tenant_version(tenant)
+
+
+async def _build_messages(
+    payload: AgentRequest, history: List[Dict[str, str]], tenant: Optional[str] = None
+) -> PreparedPrompt:
+    """
+    RAG + montagem das mensagens, do mais estável para o mais variável:
+    system (fixo) -> histórico (só cresce) -> pergunta com contexto RAG.
+    Assim o começo do prompt se repete entre turnos e o cache de prefixo
+    do provedor pode reaproveitá-lo.
+    """
+
+    if not rag_engine.ready:
+        # modelo/base ainda carregando em segundo plano (ver main.py)
+        raise HTTPException(
+            status_code=503,
+            detail="O agente está inicializando. Tente novamente em alguns segundos.",
+            headers={"Retry-After": "5"},
+        )
 
     # ----------------------------------------------------------
     # 1) RAG — Recuperação dos documentos relevantes
     # ----------------------------------------------------------
     try:
-        docs = rag_engine.search(payload.user_input, top_k=5, step_filter=payload.step)
+        q_emb = await rag_engine.aencode_query(payload.user_input)
+        with span("rag.search"):
+            docs, tenant_version = await asyncio.to_thread(_retrieve, q_emb, payload, tenant)
         logger.info(f"RAG retornou {len(docs)} documentos relevantes")
     except Exception as e:
         logger.error(f"Erro no RAG engine: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro no motor RAG: {e}")
 
-    if docs:
-        ctx_blocks = []
-        for i, d in enumerate(docs, start=1):
-            # Limita tamanho de cada trecho para evitar estourar tokens
-            snippet = (d.text or "")[:900]
-            ctx_blocks.append(f"[DOC {i}] ({d.step}) {d.title}\n{snippet}")
-        context_text = "\n\n".join(ctx_blocks)
-
-        # Limite de segurança no contexto total
-        if len(context_text) > 6000:
-            context_text = context_text[:6000]
+    prompt = _assemble_prompt(payload, history, q_emb, docs)
+    if tenant_version is not None:
+        prompt.private_scope = f"{tenant}\0{tenant_version}"
+    return prompt
+
+
+def _assemble_prompt(
+    payload: AgentRequest,
+    history: List[Dict[str, str]],
+    q_emb: Optional[np.ndarray],
+    docs: List[KnowledgeDoc],
+) -> PreparedPrompt:
+    """Mensagens para o LLM a partir dos documentos já recuperados."""
+    # Preenche o orçamento de tokens do contexto com chunks inteiros, na ordem de relevância
+    prompt_started = time.perf_counter()
+    packed = pack_context(docs)
+    if packed.docs:
+        context_text = packed.text
     else:
         context_text = (
             "Ainda não há materiais carregados para esta trilha. "
@@ -108,9 +197,6 @@ async def ask_agent(
         ),
     }
 
-    # Histórico enviado pelo frontend
-    history_msgs = [m.dict() for m in payload.history]
-
     # Pergunta do usuário + contexto RAG
     user_msg = {
         "role": "user",
@@ -124,26 +210,320 @@ async def ask_agent(
         ),
     }
 
+    # Histórico enviado pelo frontend: só o que cabe no orçamento (antigas viram resumo)
+    fixed_tokens = token_counter.count_messages([system_msg, user_msg])
+    history_msgs, summarized = fit_history(history, history_budget(fixed_tokens))
+
     messages = [system_msg, *history_msgs, user_msg]
+    prompt_tokens = token_counter.count_messages(messages)
+    record("prompt.build", time.perf_counter() - prompt_started)
+    logger.info(
+        f"Prompt: {prompt_tokens} tokens (contexto {packed.tokens} em {len(packed.docs)}/{len(docs)} docs, "
+        f"histórico {len(history) - summarized}/{len(history)} msgs"
+        f"{f', {summarized} antigas resumidas' if summarized else ''})"
+    )
+
+    return PreparedPrompt(
+        messages=messages,
+        q_emb=q_emb,
+        doc_ids=tuple(d.id for d in packed.docs),
+        tokens=prompt_tokens,
+        history_len=len(history),
+    )
+
+
+async def generate_answer(
+    startup_id: str,
+    step: str,
+    question: str,
+    docs: List[KnowledgeDoc],
+    gate_key: str,
+) -> str:
+    """
+    Resposta do agente para uma pergunta avulsa (sem histórico nem cache)
+    com documentos já recuperados; usado pela avaliação em lote.
+    Passa pelo controle de admissão como as perguntas dos founders.
+    """
+    payload = AgentRequest(startup_id=startup_id, step=step, user_input=question)
+    prompt = _assemble_prompt(payload, [], None, docs)
+    async with llm_gate.slot(gate_key):
+        return await chat_completion(prompt.messages)
+
+
+# ============================================================
+# CACHE SEMÂNTICO DE RESPOSTAS
+# ============================================================
+
+def _store_answer(key: Optional[CacheKey], prompt: PreparedPrompt, answer: str, kb_version: int) -> None:
+    """Guarda a resposta, só se foi o modelo da chave que respondeu (fallback não entra no cache)."""
+    if key is None or answered_model.get() != key[2]:
+        return
+    answer_cache.store(key, prompt.q_emb, answer, kb_version)
+
+
+def _answer_cache_key(payload: AgentRequest, prompt: PreparedPrompt) -> Optional[CacheKey]:
+    """Chave do cache, ou None se a pergunta não pode usar cache (histórico longo)."""
+    if not answer_cache.enabled or prompt.history_len > ANSWER_CACHE_MAX_HISTORY:
+        return None
+    scope = "" if ANSWER_CACHE_SHARED else payload.startup_id
+    if prompt.private_scope is not None:
+        # material privado: nunca compartilhado, e cada upload da startup muda a chave
+        scope = prompt.private_scope
+    return (payload.step, prompt.doc_ids, OPENAI_MODEL, scope)
+
+
+# ============================================================
+# ENDPOINT PRINCIPAL DO TR4CTION AGENT
+# ============================================================
+
+@router.post("/ask", response_model=AgentResponse)
+async def ask_agent(
+    request: Request,
+    payload: AgentRequest,
+    founder: dict = Depends(rate_limiter.limit("ask", RATE_LIMIT_ASK)),  # por usuário, todos os workers
+) -> AgentResponse:
+    """
+    Endpoint principal para founders (chat protegido).
+    Executa a busca RAG nos documentos + geração de resposta com OpenAI.
+    Apenas founders autenticados podem fazer perguntas.
+    """
+
+    if not payload.user_input.strip():
+        raise HTTPException(status_code=400, detail="Pergunta vazia não é permitida.")
+
+    logger.info(f"Nova pergunta de {founder.get('sub')} - Startup: {payload.startup_id}, Step: {payload.step}")
+
+    history, skey = await _load_history(payload, founder)
+    prompt = await _build_messages(payload, history, _tenant_of(founder))
+
+    # ----------------------------------------------------------
+    # 3) Cache semântico — pergunta equivalente já respondida
+    # ----------------------------------------------------------
+    cache_key = _answer_cache_key(payload, prompt)
+    kb_version = rag_engine.version
+    if cache_key is not None:
+        with span("answer_cache.lookup"):
+            cached = answer_cache.lookup(cache_key, prompt.q_emb, kb_version)
+        if cached is not None:
+            logger.info(f"Resposta servida do cache ({len(cached)} caracteres)")
+            await _save_turn(skey, payload.user_input, cached)
+            return AgentResponse(response=cached)
 
     # ----------------------------------------------------------
-    # 3) Chama OpenAI com tratamento de erro
+    # 4) Chama OpenAI com tratamento de erro
     # ----------------------------------------------------------
     try:
-        answer = await chat_completion(messages)
+        async with llm_gate.slot(rate_limiter.key_for(founder)):
+            answer = await chat_completion(prompt.messages)
         logger.info(f"Resposta gerada com sucesso ({len(answer)} caracteres)")
+    except AdmissionRejected as e:
+        logger.warning(f"Pergunta recusada pelo controle de admissão ({e.reason})")
+        raise admission_error(e)
     except Exception as e:
         logger.error(f"Erro ao chamar OpenAI: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao chamar o modelo de IA: {e}")
 
     # Fallback de segurança
     if not answer or not answer.strip():
-        answer = (
-            "Tive um problema para gerar a resposta agora. "
-            "Tente refazer a pergunta em alguns instantes ou reformule em uma frase mais direta."
-        )
+        answer = EMPTY_ANSWER_FALLBACK
+    else:
+        _store_answer(cache_key, prompt, answer, kb_version)
+        await _save_turn(skey, payload.user_input, answer)
 
     # ----------------------------------------------------------
-    # 4) Retorno estruturado
+    # 5) Retorno estruturado
     # ----------------------------------------------------------
     return AgentResponse(response=answer)
+
+
+# ============================================================
+# STREAMING (SSE) — TOKENS CHEGANDO CONFORME SÃO GERADOS
+# ============================================================
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class _GatedStreamingResponse(StreamingResponse):
+    """
+    Libera a vaga do LLM quando a resposta termina, inclusive se o cliente
+    desconectar antes do primeiro byte (o gerador nem chega a rodar).
+    """
+
+    def __init__(self, content, on_close: Callable[[], None], **kwargs) -> None:
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+
+@router.post("/ask/stream")
+async def ask_agent_stream(
+    request: Request,
+    payload: AgentRequest,
+    founder: dict = Depends(rate_limiter.limit("ask", RATE_LIMIT_ASK)),  # mesmo balde do /ask
+) -> StreamingResponse:
+    """
+    Mesma lógica do /ask, mas a resposta chega via Server-Sent Events:
+    - event: token  -> {"text": "..."} a cada trecho gerado
+    - event: done   -> {"ttft_ms": ..., "total_ms": ...}
+    - event: error  -> {"detail": "..."} se o modelo falhar no meio do caminho
+    Erros antes da geração (pergunta vazia, RAG) continuam como HTTP 4xx/5xx.
+    """
+
+    if not payload.user_input.strip():
+        raise HTTPException(status_code=400, detail="Pergunta vazia não é permitida.")
+
+    logger.info(f"Nova pergunta (stream) de {founder.get('sub')} - Startup: {payload.startup_id}, Step: {payload.step}")
+
+    started = time.perf_counter()
+    history, skey = await _load_history(payload, founder)
+    prompt = await _build_messages(payload, history, _tenant_of(founder))
+
+    cache_key = _answer_cache_key(payload, prompt)
+    kb_version = rag_engine.version
+    cached = None
+    if cache_key is not None:
+        with span("answer_cache.lookup"):
+            cached = answer_cache.lookup(cache_key, prompt.q_emb, kb_version)
+
+    # a vaga no LLM é reservada antes de abrir o stream: sem vaga, ainda dá para responder 429
+    gate_key = rate_limiter.key_for(founder)
+    if cached is None:
+        try:
+            await llm_gate.acquire(gate_key)
+        except AdmissionRejected as e:
+            logger.warning(f"Pergunta (stream) recusada pelo controle de admissão ({e.reason})")
+            raise admission_error(e)
+    admitted = time.monotonic()
+
+    def release_slot() -> None:
+        if cached is None:
+            llm_gate.release(time.monotonic() - admitted)
+
+    async def events() -> AsyncIterator[str]:
+        if cached is not None:
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+            logger.info(f"Resposta (stream) servida do cache ({len(cached)} caracteres)")
+            yield _sse("token", {"text": cached})
+            await _save_turn(skey, payload.user_input, cached)
+            yield _sse("done", {"ttft_ms": elapsed_ms, "total_ms": elapsed_ms, "cached": True})
+            return
+
+        ttft_ms = None
+        parts: List[str] = []
+        try:
+            async for delta in chat_completion_stream(prompt.messages):
+                if ttft_ms is None:
+                    ttft_ms = round((time.perf_counter() - started) * 1000, 1)
+                parts.append(delta)
+                yield _sse("token", {"text": delta})
+        except Exception as e:
+            logger.error(f"Erro ao chamar OpenAI (stream): {str(e)}")
+            yield _sse("error", {"detail": f"Erro ao chamar o modelo de IA: {e}"})
+            return
+
+        answer = "".join(parts).strip()
+        # Fallback de segurança
+        if not answer:
+            yield _sse("token", {"text": EMPTY_ANSWER_FALLBACK})
+        else:
+            _store_answer(cache_key, prompt, answer, kb_version)
+            await _save_turn(skey, payload.user_input, answer)
+
+        total_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"Resposta (stream) gerada: {len(answer)} caracteres, TTFT {ttft_ms}ms, total {total_ms}ms")
+        yield _sse("done", {"ttft_ms": ttft_ms, "total_ms": total_ms, "cached": False})
+
+    return _GatedStreamingResponse(
+        events(),
+        on_close=release_slot,
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # nginx não deve bufferizar o stream
+        },
+    )
+
+
+# ============================================================
+# SESSÃO DE CONVERSA NO SERVIDOR
+# ============================================================
+
+@router.get("/session")
+async def get_session(
+    startup_id: str,
+    session_id: Optional[str] = None,
+    founder: dict = Depends(verify_founder),
+):
+    """Histórico guardado da conversa (para restaurar o chat ao recarregar a página)."""
+    key = session_key(founder, startup_id, session_id)
+    return {"messages": await asyncio.to_thread(session_store.get, key)}
+
+
+@router.delete("/session")
+async def clear_session(
+    startup_id: str,
+    session_id: Optional[str] = None,
+    founder: dict = Depends(verify_founder),
+):
+    """Apaga o histórico da conversa (nova conversa)."""
+    key = session_key(founder, startup_id, session_id)
+    await asyncio.to_thread(session_store.clear, key)
+    return {"status": "ok"}
+
+
+# ============================================================
+# MATERIAL PRÓPRIO DA STARTUP (base privada)
+# ============================================================
+
+def _require_startup(founder: dict) -> str:
+    startup = _tenant_of(founder)
+    if startup is None:
+        raise HTTPException(status_code=403, detail="Token sem startup: só founders podem enviar material próprio.")
+    return startup
+
+
+@router.post("/knowledge/upload", status_code=202, openapi_extra=UPLOAD_OPENAPI)
+async def upload_startup_material(
+    request: Request,
+    founder: dict = Depends(rate_limiter.limit("upload", RATE_LIMIT_UPLOAD)),
+):
+    """
+    Material da própria startup (PPTX, PDF ou DOCX): mesma ingestão do admin,
+    mas numa base privada, consultada só nas perguntas desta startup junto
+    com a base da trilha. Limite de RAG_TENANT_MAX_CHUNKS chunks por startup.
+    Formulário multipart com `step` e `files`, como no upload do admin.
+    """
+    startup = _require_startup(founder)
+    fields, spool, saved = await spool_uploads(request)
+    step = fields["step"]
+    job = ingestion_queue.submit(step, founder.get("sub"), saved, spool, tenant=startup)
+    logger.info(f"Founder {founder.get('sub')} ({startup}) enviou {len(saved)} arquivo(s) para '{step}' (job {job.id})")
+    return {
+        "status": "queued",
+        "job_id": job.id,
+        "files": job.filenames,
+    }
+
+
+@router.get("/knowledge")
+async def get_startup_knowledge(founder: dict = Depends(verify_founder)):
+    """Resumo da base privada da startup do token."""
+    startup = _require_startup(founder)
+    engine = await asyncio.to_thread(knowledge.tenant, startup)
+    stats = engine.get_stats() if engine is not None else {"docs": 0, "chunks": 0, "steps": []}
+    return {"startup": startup, **stats, "max_chunks": RAG_TENANT_MAX_CHUNKS}
+
+
+@router.get("/knowledge/jobs/{job_id}")
+def get_startup_job(job_id: str, founder: dict = Depends(verify_founder)):
+    """Progresso de um upload da própria startup (jobs de outras startups não aparecem)."""
+    job = ingestion_queue.get(job_id)
+    if job is None or job.tenant is None or job.tenant != _tenant_of(founder):
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    return job.to_dict()
@@ -0,0 +1,231 @@
+import asyncio
+import shutil
+
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Request
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from core.config import UPLOAD_MAX_FILE_MB, UPLOAD_MAX_TOTAL_MB
+from core.extractors import check_header, extension, supported_extensions
+from core.metrics import span
+from services.ingestion import ingestion_queue
+
+# bytes do corpo lidos antes de cada passada do parser (fora do event loop)
+_SPOOL_CHUNK = 1024 * 1024
+# bytes iniciais conferidos com a assinatura do formato
+_HEAD_BYTES = 8
+# folga para boundaries, headers das partes e campos de texto do formulário
+_FORM_OVERHEAD = 64 * 1024
+# campos de texto (ex.: step) ficam na memória: limite por campo
+_MAX_FIELD_BYTES = 4096
+
+# corpo do formulário na documentação (/docs), já que a rota lê o stream direto
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["step", "files"],
+                    "properties": {
+                        "step": {"type": "string"},
+                        "files": {"type": "array", "items": {"type": "string", "format": "binary"}},
+                    },
+                }
+            }
+        },
+    }
+}
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Upload grande demais: limite de {UPLOAD_MAX_FILE_MB:g} MB por arquivo "
+        f"e {UPLOAD_MAX_TOTAL_MB:g} MB por envio.",
+    )
+
+
+class _SpoolParser:
+    """
+    Callbacks do python-multipart: cada arquivo vai direto do corpo da
+    requisição para o spool, com a assinatura conferida nos primeiros bytes
+    e os limites por arquivo e por envio conferidos enquanto chega.
+    Campos de texto ficam em `fields`; arquivos só são aceitos no campo
+    `file_field` (outro campo com arquivo recusa o upload).
+    """
+
+    def __init__(
+        self, spool: Path, allowed: List[str], max_file: int, max_total: int, file_field: str = "files"
+    ) -> None:
+        self.spool = spool
+        self.file_field = file_field
+        self.allowed = allowed
+        self.max_file = max_file
+        self.remaining = max_total
+        self.fields: Dict[str, str] = {}
+        self.saved: List[Tuple[str, Path]] = []
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._name = ""
+        self._filename: Optional[str] = None
+        self._ext = ""
+        self._out = None
+        self._dest: Optional[Path] = None
+        self._head = b""
+        self._size = 0
+        self._value = bytearray()
+
+    # ---------- headers da parte ----------
+    def on_part_begin(self) -> None:
+        self._disposition = b""
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._disposition)
+        self._name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        self._size = 0
+        self._head = b""
+        self._value = bytearray()
+        if filename is None:
+            self._filename = None
+            return
+        self._filename = filename.decode("utf-8", "replace")
+        if self._name != self.file_field:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Campo inesperado com arquivo: '{self._name}'. Envie os arquivos em '{self.file_field}'.",
+            )
+        self._ext = extension(self._filename)
+        if self._ext not in self.allowed:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Formato não suportado: {self._filename}. Envie {', '.join(self.allowed)}.",
+            )
+        self._dest = self.spool / f"{len(self.saved):04d}{self._ext}"
+        self._out = open(self._dest, "wb")
+
+    # ---------- conteúdo ----------
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        chunk = data[start:end]
+        if self._filename is None:
+            self._value += chunk
+            if len(self._value) > _MAX_FIELD_BYTES:
+                raise HTTPException(status_code=400, detail=f"Campo grande demais: {self._name}.")
+            return
+        self._size += len(chunk)
+        if self._size > min(self.max_file, self.remaining):
+            raise _too_large()
+        if len(self._head) < _HEAD_BYTES:
+            self._head += chunk[:_HEAD_BYTES - len(self._head)]
+            if len(self._head) == _HEAD_BYTES:
+                self._check_head()
+        self._out.write(chunk)
+
+    def on_part_end(self) -> None:
+        if self._filename is None:
+            self.fields[self._name] = self._value.decode("utf-8", "replace")
+            return
+        self._out.close()
+        self._out = None
+        if self._size == 0:
+            # sem bytes não há assinatura a conferir
+            raise HTTPException(status_code=400, detail=f"Arquivo vazio: {self._filename}.")
+        if len(self._head) < _HEAD_BYTES:
+            self._check_head()
+        self.remaining -= self._size
+        self.saved.append((self._filename, self._dest))
+
+    def _check_head(self) -> None:
+        if not check_header(self._ext, self._head):
+            raise HTTPException(status_code=400, detail=f"Arquivo inválido: {self._filename} não é {self._ext}.")
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+    def close(self) -> None:
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+
+
+async def spool_uploads(
+    request: Request, required: Sequence[str] = ("step",), file_field: str = "files"
+) -> Tuple[Dict[str, str], Path, List[Tuple[str, Path]]]:
+    """
+    Lê o formulário multipart do upload (PPTX, PDF ou DOCX) direto do corpo
+    da requisição para um diretório novo, em blocos (nunca inteiros na
+    memória e sem cópia intermediária). Um Content-Length acima do limite
+    por envio é recusado antes de ler o corpo; sem ele, o limite por arquivo
+    e por envio corta o upload assim que é ultrapassado.
+    Devolve os campos de texto, o diretório (a ingestão apaga no fim do job)
+    e os pares (nome, caminho). Só o campo `file_field` pode trazer arquivos.
+    Usado pelo upload do admin (base global) e dos founders (base da startup).
+    """
+    max_total = int(UPLOAD_MAX_TOTAL_MB * 2**20)
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if boundary is None:
+        raise HTTPException(status_code=400, detail="Envie os arquivos como multipart/form-data.")
+    try:
+        declared = int(request.headers.get("content-length", "0"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Content-Length inválido.")
+    if declared > max_total + _FORM_OVERHEAD:
+        raise _too_large()
+
+    spool = ingestion_queue.spool_dir()
+    handler = _SpoolParser(spool, supported_extensions(), int(UPLOAD_MAX_FILE_MB * 2**20), max_total, file_field)
+    parser = MultipartParser(boundary, handler.callbacks())
+    try:
+        with span("upload.read"):
+            read = 0
+            buffer = bytearray()
+            async for chunk in request.stream():
+                read += len(chunk)
+                if read > max_total + _FORM_OVERHEAD:
+                    raise _too_large()
+                buffer += chunk
+                if len(buffer) >= _SPOOL_CHUNK:
+                    await asyncio.to_thread(parser.write, bytes(buffer))
+                    buffer.clear()
+            if buffer:
+                await asyncio.to_thread(parser.write, bytes(buffer))
+            parser.finalize()
+        missing = [name for name in required if not handler.fields.get(name)]
+        if missing:
+            raise HTTPException(status_code=422, detail=f"Campo obrigatório: {', '.join(missing)}.")
+        if not handler.saved:
+            raise HTTPException(status_code=400, detail="Nenhum arquivo enviado.")
+    except BaseException as e:
+        handler.close()
+        shutil.rmtree(spool, ignore_errors=True)
+        if isinstance(e, MultipartParseError):
+            raise HTTPException(status_code=400, detail=f"Formulário multipart inválido: {e}") from e
+        raise
+    return handler.fields, spool, handler.saved
@@ -0,0 +1,132 @@
+"""
+Paridade e vazão dos runtimes do modelo de embedding (RAG_EMBEDDING_RUNTIME)
+contra a referência: torch float32 com lotes de tamanho fixo.
+
+Mede, nos mesmos textos:
+- cosseno entre o embedding do runtime e o da referência (mínimo e médio);
+- recall@k da busca com o runtime contra a busca da referência, e da busca
+  "mista" (perguntas no runtime novo, base ainda com os embeddings antigos),
+  que é o que acontece ao trocar o runtime sem reprocessar a base;
+- textos/s no encode em lote (lotes por orçamento de tokens x fixos).
+
+Termina com código 1 se o cosseno mínimo ficar abaixo de --min-cosine ou o
+recall abaixo de --min-recall: rode antes de trocar o runtime em produção.
+
+Uso (a partir de backend/):
+    python -m benchmarks.bench_embedder --runtime torch-int8
+    python -m benchmarks.bench_embedder --runtime onnx --threads 4 --texts trechos.txt
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from benchmarks.synthetic_kb import generate_decks, generate_queries
+from core.config import RAG_EMBEDDING_BATCH_TOKENS, RAG_EMBEDDING_MODEL, RAG_EMBEDDING_THREADS
+from core.embedder import EMBEDDING_RUNTIMES, LocalEmbedder
+from core.scoring import _normalize_rows
+
+
+def sample_texts(decks: int, queries: int) -> Tuple[List[str], List[str]]:
+    """Trechos de 1 a 4 slides (tamanhos variados, como os chunks) e perguntas sintéticas."""
+    texts = []
+    for deck in generate_decks(decks, slides=8):
+        bodies = [text for _, text in deck.slides]
+        for i, start in enumerate(range(0, len(bodies), 2)):
+            texts.append("\n".join(bodies[start:start + 1 + i % 4]))
+    return texts, [q for _, q in generate_queries(queries)]
+
+
+def timed_encode(embedder: LocalEmbedder, texts: List[str], batch_size: int) -> Tuple[np.ndarray, float]:
+    started = time.perf_counter()
+    embs = embedder.encode(texts, batch_size=batch_size)
+    return _normalize_rows(np.asarray(embs, dtype=np.float32)), time.perf_counter() - started
+
+
+def recall_at_k(queries: np.ndarray, docs: np.ndarray, truth: np.ndarray, k: int) -> float:
+    found = np.argsort(-(queries @ docs.T), axis=1)[:, :k]
+    return round(float(np.mean([len(np.intersect1d(f, t)) / k for f, t in zip(found, truth)])), 4)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=RAG_EMBEDDING_MODEL)
+    parser.add_argument("--runtime", default="torch-int8", choices=EMBEDDING_RUNTIMES)
+    parser.add_argument("--threads", type=int, default=RAG_EMBEDDING_THREADS)
+    parser.add_argument("--batch-tokens", type=int, default=RAG_EMBEDDING_BATCH_TOKENS)
+    parser.add_argument("--batch-size", type=int, default=32, help="lote fixo da referência")
+    parser.add_argument("--texts", help="arquivo com um texto por linha (padrão: decks sintéticos)")
+    parser.add_argument("--decks", type=int, default=60)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--min-recall", type=float, default=0.9)
+    parser.add_argument("--json", action="store_true", help="imprime o relatório em JSON")
+    args = parser.parse_args()
+
+    texts, queries = sample_texts(args.decks, args.queries)
+    if args.texts:
+        with open(args.texts, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+
+    reference = LocalEmbedder(args.model, runtime="torch", threads=args.threads, batch_tokens=0)
+    candidate = LocalEmbedder(
+        args.model, runtime=args.runtime, threads=args.threads, batch_tokens=args.batch_tokens
+    )
+    for embedder in (reference, candidate):
+        embedder.load()
+        embedder.encode(texts[:8], batch_size=8)  # aquecimento
+
+    ref_docs, ref_seconds = timed_encode(reference, texts, args.batch_size)
+    docs, seconds = timed_encode(candidate, texts, args.batch_size)
+    ref_queries, _ = timed_encode(reference, queries, len(queries))
+    cand_queries, _ = timed_encode(candidate, queries, len(queries))
+
+    cosines = np.sum(ref_docs * docs, axis=1)
+    k = min(args.k, len(texts))
+    truth = np.argsort(-(ref_queries @ ref_docs.T), axis=1)[:, :k]
+    report: Dict[str, object] = {
+        "model": args.model,
+        "runtime": candidate.active_runtime,
+        "texts": len(texts),
+        "queries": len(queries),
+        "k": k,
+        "cosine_min": round(float(cosines.min()), 5),
+        "cosine_mean": round(float(cosines.mean()), 5),
+        "query_cosine_min": round(float(np.sum(ref_queries * cand_queries, axis=1).min()), 5),
+        "recall": recall_at_k(cand_queries, docs, truth, k),
+        "recall_mixed": recall_at_k(cand_queries, ref_docs, truth, k),
+        "reference_texts_per_s": round(len(texts) / ref_seconds, 1),
+        "texts_per_s": round(len(texts) / seconds, 1),
+        "speedup": round(ref_seconds / seconds, 2),
+    }
+
+    failed = []
+    if report["cosine_min"] < args.min_cosine:
+        failed.append(f"cosseno mínimo {report['cosine_min']} < {args.min_cosine}")
+    for name in ("recall", "recall_mixed"):
+        if report[name] < args.min_recall:
+            failed.append(f"{name} {report[name]} < {args.min_recall}")
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['model']} ({report['runtime']}) x torch float32, {len(texts)} textos, {len(queries)} perguntas")
+        print(f"cosseno   min={report['cosine_min']}  médio={report['cosine_mean']}  perguntas min={report['query_cosine_min']}")
+        print(f"recall@{k}  {report['recall']}  (misto: {report['recall_mixed']})")
+        print(
+            f"vazão     {report['texts_per_s']} textos/s  "
+            f"(referência {report['reference_texts_per_s']}, {report['speedup']}x)"
+        )
+    if failed:
+        print(f"Paridade insuficiente: {'; '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark de recall@k x latência dos índices vetoriais do RAGEngine.
+
+Gera vetores sintéticos agrupados (parecidos com embeddings de chunks de
+decks) e compara a busca exata com o IVF para vários valores de nprobe.
+
+Uso (a partir de backend/):
+    python -m benchmarks.bench_index --rows 100000 --dim 384 --queries 200
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from core.scoring import _normalize_rows
+from core.vector_index import ExactIndex, IVFIndex
+
+
+def synthetic_embeddings(rows: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, rows)
+    noise = rng.standard_normal((rows, dim)).astype(np.float32) * 0.6
+    return _normalize_rows(centers[labels] + noise)
+
+
+def _percentile_ms(samples: List[float], q: float) -> float:
+    return round(float(np.percentile(samples, q)) * 1000, 3)
+
+
+def run_index(index, embeddings: np.ndarray, queries: np.ndarray, k: int) -> Dict[str, object]:
+    results = []
+    latencies = []
+    for q in queries:
+        t0 = time.perf_counter()
+        results.append(index.search(embeddings, q, k))
+        latencies.append(time.perf_counter() - t0)
+    return {
+        "results": results,
+        "p50_ms": _percentile_ms(latencies, 50),
+        "p95_ms": _percentile_ms(latencies, 95),
+    }
+
+
+def recall_at_k(truth: List[np.ndarray], found: List[np.ndarray]) -> float:
+    hits = sum(len(set(t.tolist()) & set(f.tolist())) for t, f in zip(truth, found))
+    total = sum(len(t) for t in truth)
+    return round(hits / total, 4) if total else 0.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--nlist", type=int, default=0, help="0 = automático")
+    parser.add_argument("--json", type=str, default="", help="grava os resultados neste arquivo")
+    args = parser.parse_args()
+
+    embeddings = synthetic_embeddings(args.rows, args.dim, args.clusters)
+    rng = np.random.default_rng(1)
+    queries = embeddings[rng.choice(args.rows, args.queries, replace=False)]
+    queries = _normalize_rows(queries + rng.standard_normal(queries.shape).astype(np.float32) * 0.05)
+
+    exact = run_index(ExactIndex(), embeddings, queries, args.k)
+    report = {
+        "rows": args.rows,
+        "dim": args.dim,
+        "k": args.k,
+        "exact": {"p50_ms": exact["p50_ms"], "p95_ms": exact["p95_ms"]},
+        "ivf": [],
+    }
+    print(f"exact          recall@{args.k}=1.0000  p50={exact['p50_ms']}ms  p95={exact['p95_ms']}ms")
+
+    ivf = IVFIndex(nlist=args.nlist, min_rows=0)
+    t0 = time.perf_counter()
+    ivf.build(embeddings)
+    build_s = round(time.perf_counter() - t0, 3)
+    report["ivf_build_s"] = build_s
+    report["ivf_nlist"] = int(ivf.centroids.shape[0])
+    print(f"ivf build      nlist={report['ivf_nlist']}  {build_s}s")
+
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        res = run_index(ivf, embeddings, queries, args.k)
+        recall = recall_at_k(exact["results"], res["results"])
+        report["ivf"].append(
+            {"nprobe": nprobe, "recall": recall, "p50_ms": res["p50_ms"], "p95_ms": res["p95_ms"]}
+        )
+        print(
+            f"ivf nprobe={nprobe:<3} recall@{args.k}={recall:.4f}  "
+            f"p50={res['p50_ms']}ms  p95={res['p95_ms']}ms"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
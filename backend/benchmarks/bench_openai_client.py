@@ -0,0 +1,122 @@
+"""
+Latência de ponta a ponta do chat_completion contra o servidor mock
+(benchmarks/mock_openai.py), com e sem hedging, sob concorrência.
+
+O modelo principal tem uma cauda lenta (--tail-rate/--tail-ms) e erros
+ocasionais; o fallback é um pouco mais lento, mas estável. Sem hedging a
+cauda do principal vai direto para o p99; com hedging o fallback é
+disparado após o p95 medido do principal.
+
+Uso (a partir de backend/):
+    python -m benchmarks.bench_openai_client --requests 400 --concurrency 20
+    python -m benchmarks.bench_openai_client --error-rate 0.3   # retries + circuit breaker
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Dict, List
+
+os.environ.setdefault("OPENAI_API_KEY", "mock")
+
+import httpx
+import numpy as np
+
+from benchmarks.mock_openai import MockProfile, add_profile_args, create_app, profiles_from_args, serve_in_thread
+import services.openai_client as oc
+
+MESSAGES = [
+    {"role": "system", "content": "Você é o agente TR4CTION."},
+    {"role": "user", "content": "Como valido meu problema com clientes?"},
+]
+
+
+async def run_scenario(base_url: str, model: str, hedge: bool, requests: int, concurrency: int, timeout: float) -> Dict[str, object]:
+    oc.client = oc.build_client(base_url=base_url, http2=False)
+    oc.reset_stats()
+    async with httpx.AsyncClient() as http:
+        await http.post(base_url.removesuffix("/v1") + "/stats/reset")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    failures = 0
+
+    async def one() -> None:
+        nonlocal failures
+        async with semaphore:
+            t0 = time.perf_counter()
+            try:
+                await oc.chat_completion(MESSAGES, model=model, timeout=timeout, hedge=hedge)
+                latencies.append(time.perf_counter() - t0)
+            except RuntimeError:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    async with httpx.AsyncClient() as http:
+        server_stats = (await http.get(base_url.removesuffix("/v1") + "/stats")).json()
+    await oc.close_client()
+
+    pct = lambda q: round(float(np.percentile(latencies, q)) * 1000, 1) if latencies else None
+    return {
+        "hedge": hedge,
+        "ok": len(latencies),
+        "failed": failures,
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "max_ms": pct(100),
+        "req_per_s": round(requests / elapsed, 1),
+        "server_calls": server_stats["calls"],
+        "breakers": oc.client_stats(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--primary", default="gpt-4o", help="modelo principal")
+    parser.add_argument("--fallback", default=oc.FALLBACK_MODEL or "gpt-4o-mini", help="padrão: OPENAI_FALLBACK_MODEL")
+    parser.add_argument("--fallback-latency-ms", type=float, default=400.0)
+    parser.add_argument("--json", action="store_true", help="imprime o relatório em JSON")
+    add_profile_args(parser)
+    parser.set_defaults(tail_rate=0.03, tail_ms=4000.0, error_rate=0.02)
+    args = parser.parse_args()
+
+    default, models = profiles_from_args(args)
+    oc.FALLBACK_MODEL = args.fallback
+    if args.primary == oc.FALLBACK_MODEL:
+        raise SystemExit("O modelo principal precisa ser diferente do fallback para haver hedging.")
+    models.setdefault(oc.FALLBACK_MODEL, MockProfile(latency_ms=args.fallback_latency_ms, jitter_ms=args.jitter_ms))
+    server, base_url = serve_in_thread(create_app(default, models))
+
+    report = {"model": args.primary, "fallback": oc.FALLBACK_MODEL, "scenarios": []}
+    try:
+        for hedge in (False, True):
+            report["scenarios"].append(
+                asyncio.run(run_scenario(base_url, args.primary, hedge, args.requests, args.concurrency, args.timeout))
+            )
+    finally:
+        server.should_exit = True
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"principal={report['model']} fallback={report['fallback']}")
+    for r in report["scenarios"]:
+        print(
+            f"hedge={'on ' if r['hedge'] else 'off'}  ok={r['ok']} falhas={r['failed']}  "
+            f"p50={r['p50_ms']}ms p95={r['p95_ms']}ms p99={r['p99_ms']}ms max={r['max_ms']}ms  "
+            f"{r['req_per_s']} req/s  chamadas={r['server_calls']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Recall@k, latência e memória dos modos de armazenamento dos embeddings
+(float32, float16 e int8 com escala por linha), com e sem o re-rank
+exato em float32 dos candidatos, contra a busca exata em float32.
+
+Termina com código 1 se algum modo com re-rank ficar abaixo de --min-recall,
+então serve de checagem de regressão da quantização.
+
+Uso (a partir de backend/):
+    python -m benchmarks.bench_quantization --rows 100000 --dim 384 --queries 200
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.bench_index import synthetic_embeddings, _percentile_ms
+from core.scoring import Matrix, QuantizedMatrix, _normalize_rows, quantize_int8, rerank_exact
+from core.vector_index import ExactIndex
+
+
+def run_mode(
+    matrix: Matrix,
+    full: Optional[np.ndarray],
+    queries: np.ndarray,
+    truth: List[np.ndarray],
+    k: int,
+    candidates_per_result: int,
+) -> Dict[str, float]:
+    index = ExactIndex()
+    recalls = []
+    latencies = []
+    for q, expected in zip(queries, truth):
+        t0 = time.perf_counter()
+        if full is None:
+            found = index.search(matrix, q, k)
+        else:
+            # como no RAGEngine: k * CANDIDATES_PER_RESULT candidatos, re-rank, top k
+            found = rerank_exact(full, q, index.search(matrix, q, k * candidates_per_result))[:k]
+        latencies.append(time.perf_counter() - t0)
+        recalls.append(len(np.intersect1d(found, expected)) / k)
+    return {
+        "recall": round(float(np.mean(recalls)), 4),
+        "p50_ms": _percentile_ms(latencies, 50),
+        "p95_ms": _percentile_ms(latencies, 95),
+        "mb": round(matrix.nbytes / 2**20, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--candidates", type=int, default=4, help="candidatos por resultado (CANDIDATES_PER_RESULT)")
+    parser.add_argument("--min-recall", type=float, default=0.95)
+    parser.add_argument("--json", action="store_true", help="imprime o relatório em JSON")
+    args = parser.parse_args()
+
+    embeddings = synthetic_embeddings(args.rows, args.dim, args.clusters)
+    rng = np.random.default_rng(1)
+    queries = embeddings[rng.choice(args.rows, args.queries, replace=False)]
+    queries = _normalize_rows(queries + rng.standard_normal(queries.shape).astype(np.float32) * 0.05)
+
+    exact = ExactIndex()
+    truth = [exact.search(embeddings, q, args.k) for q in queries]
+
+    codes, scales = quantize_int8(embeddings)
+    matrices = {
+        "float32": embeddings,
+        "float16": embeddings.astype(np.float16),
+        "int8": QuantizedMatrix(codes, scales),
+    }
+
+    report = {"rows": args.rows, "dim": args.dim, "k": args.k, "modes": {}}
+    for name, matrix in matrices.items():
+        report["modes"][name] = run_mode(matrix, None, queries, truth, args.k, args.candidates)
+        if name != "float32":
+            report["modes"][f"{name}+rerank"] = run_mode(matrix, embeddings, queries, truth, args.k, args.candidates)
+
+    failed = [
+        name for name, r in report["modes"].items()
+        if name.endswith("+rerank") and r["recall"] < args.min_recall
+    ]
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for name, r in report["modes"].items():
+            print(
+                f"{name:<15} recall@{args.k}={r['recall']:.4f}  "
+                f"p50={r['p50_ms']}ms  p95={r['p95_ms']}ms  {r['mb']} MB"
+            )
+    if failed:
+        print(f"Recall abaixo de {args.min_recall}: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
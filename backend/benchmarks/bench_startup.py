@@ -0,0 +1,89 @@
+"""
+Custo de inicialização da API: tempo de import do main, tempo até o RAG
+ficar pronto (modelo + base) e memória residente de cada fase.
+
+Cada rodada usa um processo Python novo (import "frio" dos módulos,
+com o page cache do SO já aquecido a partir da segunda rodada).
+
+Uso (a partir de backend/):
+    python -m benchmarks.bench_startup --runs 3
+    RAG_EMBEDDER_SOCKET=/tmp/tr4ction-embedder.sock python -m benchmarks.bench_startup
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+from typing import Dict, List
+
+import numpy as np
+
+# Roda no processo filho: mede import, load e RSS (em MB) depois de cada fase
+_CHILD = r"""
+import json, resource, sys, time
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+rss_import = rss_mb()
+main.rag_engine.load()
+t2 = time.perf_counter()
+print(json.dumps({
+    "import_s": t1 - t0,
+    "load_s": t2 - t1,
+    "rss_import_mb": rss_import,
+    "rss_ready_mb": rss_mb(),
+    "torch_imported": "torch" in sys.modules,
+}))
+"""
+
+
+def run_once() -> Dict[str, float]:
+    out = subprocess.run(
+        [sys.executable, "-c", _CHILD],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="imprime o relatório em JSON")
+    args = parser.parse_args()
+
+    runs: List[Dict[str, float]] = [run_once() for _ in range(args.runs)]
+
+    def median(key: str) -> float:
+        return round(float(np.median([r[key] for r in runs])), 3)
+
+    report = {
+        "runs": args.runs,
+        "import_s": median("import_s"),
+        "load_s": median("load_s"),
+        "rss_import_mb": median("rss_import_mb"),
+        "rss_ready_mb": median("rss_ready_mb"),
+        # com o sidecar o worker nunca importa torch
+        "torch_in_worker": any(r["torch_imported"] for r in runs),
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"import main    {report['import_s']}s  RSS {report['rss_import_mb']} MB")
+    print(f"rag pronto     +{report['load_s']}s  RSS {report['rss_ready_mb']} MB")
+    print(f"torch no worker: {report['torch_in_worker']}  (mediana de {args.runs} rodadas)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Servidor local compatível com a API de Chat Completions da OpenAI, para
+testar o cliente (pool, retries, circuit breaker, hedging) sem rede e sem custo.
+
+Cada modelo tem um perfil de latência: base + jitter, uma fração de
+chamadas lentas (cauda) e uma fração de erros (500 ou 429). Suporta
+stream=True (SSE). GET /stats devolve quantas chamadas cada modelo recebeu.
+
+Uso (a partir de backend/):
+    python -m benchmarks.mock_openai --port 8099 --latency-ms 300 --tail-rate 0.05 --tail-ms 4000 \\
+        --model gpt-4o-mini:latency_ms=150
+    OPENAI_BASE_URL=http://127.0.0.1:8099/v1 OPENAI_API_KEY=mock uvicorn main:app
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, fields, replace
+from typing import Dict, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class MockProfile:
+    latency_ms: float = 300.0
+    jitter_ms: float = 50.0
+    tail_rate: float = 0.0
+    tail_ms: float = 3000.0
+    error_rate: float = 0.0
+    error_status: int = 500
+    # stream: intervalo entre trechos
+    chunk_ms: float = 20.0
+
+    def delay(self, rng: random.Random) -> float:
+        ms = self.latency_ms + rng.uniform(-self.jitter_ms, self.jitter_ms)
+        if rng.random() < self.tail_rate:
+            ms = self.tail_ms
+        return max(0.0, ms) / 1000
+
+
+ANSWER = "Resposta simulada do servidor mock: foco no problema do cliente antes da solução."
+
+
+def create_app(default: MockProfile, models: Optional[Dict[str, MockProfile]] = None, seed: int = 0) -> FastAPI:
+    app = FastAPI(title="Mock OpenAI")
+    rng = random.Random(seed)
+    models = models or {}
+    calls: Dict[str, int] = {}
+    errors: Dict[str, int] = {}
+
+    def _error(model: str, status: int) -> JSONResponse:
+        errors[model] = errors.get(model, 0) + 1
+        kind = "rate_limit_exceeded" if status == 429 else "server_error"
+        return JSONResponse(
+            status_code=status,
+            content={"error": {"message": f"mock {kind}", "type": kind, "code": kind}},
+            headers={"retry-after": "0"} if status == 429 else None,
+        )
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "")
+        profile = models.get(model, default)
+        calls[model] = calls.get(model, 0) + 1
+
+        await asyncio.sleep(profile.delay(rng))
+        if rng.random() < profile.error_rate:
+            return _error(model, profile.error_status)
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        if not body.get("stream"):
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": ANSWER},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+            }
+
+        async def events():
+            for i, word in enumerate(ANSWER.split(" ")):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(profile.chunk_ms / 1000)
+            done = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            yield f"data: {json.dumps(done)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return {"calls": calls, "errors": errors}
+
+    @app.post("/stats/reset")
+    async def reset():
+        calls.clear()
+        errors.clear()
+        return {"ok": True}
+
+    return app
+
+
+def parse_model(spec: str, default: MockProfile) -> Tuple[str, MockProfile]:
+    """'gpt-4o-mini:latency_ms=150,error_rate=0.1' -> (modelo, perfil)."""
+    name, _, opts = spec.partition(":")
+    types = {f.name: f.type for f in fields(MockProfile)}
+    values = {}
+    for opt in filter(None, opts.split(",")):
+        key, _, value = opt.partition("=")
+        if key not in types:
+            raise SystemExit(f"Opção de perfil desconhecida: {key}")
+        values[key] = int(value) if types[key] in (int, "int") else float(value)
+    return name, replace(default, **values)
+
+
+def serve_in_thread(app: FastAPI, port: int = 0, host: str = "127.0.0.1", path: str = "/v1"):
+    """Sobe o app num thread (uvicorn) e devolve (servidor, URL base + path)."""
+    import socket
+
+    import uvicorn
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind((host, port))
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", access_log=False))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://{host}:{sock.getsockname()[1]}{path}"
+
+
+def add_profile_args(parser: argparse.ArgumentParser) -> None:
+    defaults = MockProfile()
+    for f in fields(MockProfile):
+        parser.add_argument(f"--{f.name.replace('_', '-')}", type=type(getattr(defaults, f.name)), default=getattr(defaults, f.name))
+    parser.add_argument(
+        "--model", action="append", default=[], metavar="NOME:CHAVE=VALOR,...",
+        help="perfil específico de um modelo (demais opções herdam o padrão)",
+    )
+
+
+def profiles_from_args(args: argparse.Namespace) -> Tuple[MockProfile, Dict[str, MockProfile]]:
+    default = MockProfile(**{f.name: getattr(args, f.name) for f in fields(MockProfile)})
+    return default, dict(parse_model(spec, default) for spec in args.model)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--seed", type=int, default=0)
+    add_profile_args(parser)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    default, models = profiles_from_args(args)
+    uvicorn.run(create_app(default, models, args.seed), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
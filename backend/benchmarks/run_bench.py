@@ -0,0 +1,449 @@
+"""
+Suíte de benchmarks reprodutível do backend, com resultados em JSON
+comparáveis entre commits.
+
+Numa base sintética (benchmarks/synthetic_kb.py) de --decks decks com
+--slides slides, distribuídos pelas etapas da trilha, mede:
+
+  ingest  chunking, embeddings e RAGEngine.add_documents (commit)
+  search  latência da busca por step_filter: só recuperação
+          (search_by_embedding) e ponta a ponta com encode (search)
+  load    tempo de load() e memória, num processo novo lendo a base do disco
+  api     /agent/ask concorrente (LLM local: benchmarks/mock_openai.py)
+          enquanto /admin/upload-pptx sobe decks novos em paralelo
+
+Tudo roda num DATA_DIR temporário; caches de perguntas e respostas ficam
+desligados (--with-caches liga) e o rate limit é desativado na fase api.
+Com --embedder hash (padrão) os embeddings são por hashing de palavras,
+sem baixar modelo; --embedder model usa o modelo configurado.
+
+Uso (a partir de backend/):
+    python -m benchmarks.run_bench --decks 300 --out bench-$(git rev-parse --short HEAD).json
+    python -m benchmarks.run_bench compare bench-base.json bench-head.json --threshold 0.15
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Roda no processo filho: load() de uma engine nova sobre a base já gravada
+_LOAD_CHILD = r"""
+import json, sys, time
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    return 0.0
+
+from benchmarks.synthetic_kb import HashEmbedder
+from core.rag_engine import RAGEngine
+before = rss_mb()
+engine = RAGEngine(HashEmbedder() if sys.argv[1] == "hash" else None)
+t0 = time.perf_counter()
+engine.load()
+print(json.dumps({
+    "load_s": time.perf_counter() - t0,
+    "rss_before_mb": before,
+    "rss_after_mb": rss_mb(),
+    "chunks": engine.get_stats()["chunks"],
+}))
+"""
+
+
+# ---------- Utilitários ----------
+def _pct(samples: List[float], q: float) -> Optional[float]:
+    import numpy as np
+
+    if not samples:
+        return None
+    return round(float(np.percentile(samples, q)) * 1000, 3)
+
+
+def _latency(samples: List[float]) -> Dict[str, Any]:
+    return {
+        "count": len(samples),
+        "p50_ms": _pct(samples, 50),
+        "p95_ms": _pct(samples, 95),
+        "p99_ms": _pct(samples, 99),
+    }
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return 0.0
+
+
+def _git(*args: str) -> Optional[str]:
+    try:
+        out = subprocess.run(["git", *args], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def _meta(args: argparse.Namespace) -> Dict[str, Any]:
+    import numpy as np
+
+    return {
+        "commit": _git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--", ".")),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": {k: v for k, v in vars(args).items() if k != "out"},
+    }
+
+
+# ---------- Fases ----------
+def bench_ingest(engine, decks, batch_size: int, commit_decks: int) -> Dict[str, Any]:
+    import numpy as np
+
+    from core.chunking import chunk_slides
+
+    t0 = time.perf_counter()
+    per_deck = [chunk_slides(d.name, d.step, d.name, d.slides) for d in decks]
+    chunk_s = time.perf_counter() - t0
+
+    docs = [doc for chunks in per_deck for doc in chunks]
+    t0 = time.perf_counter()
+    embs = np.vstack([
+        engine.embed_documents(docs[i:i + batch_size], batch_size=batch_size)
+        for i in range(0, len(docs), batch_size)
+    ])
+    embed_s = time.perf_counter() - t0
+
+    commits: List[float] = []
+    row = 0
+    for i in range(0, len(per_deck), commit_decks):
+        group = [doc for chunks in per_deck[i:i + commit_decks] for doc in chunks]
+        t0 = time.perf_counter()
+        engine.add_documents(group, embs[row:row + len(group)])
+        commits.append(time.perf_counter() - t0)
+        row += len(group)
+
+    return {
+        "decks": len(decks),
+        "chunks": len(docs),
+        "chunk_s": round(chunk_s, 3),
+        "embed_s": round(embed_s, 3),
+        "commit_s": round(sum(commits), 3),
+        "commit": _latency(commits),
+        "chunks_per_s": round(len(docs) / max(chunk_s + embed_s + sum(commits), 1e-9), 1),
+    }
+
+
+def bench_search(engine, queries: List[Tuple[str, str]], steps: Tuple[str, ...], top_k: int) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for step_filter in ("todas", *steps):
+        retrieval: List[float] = []
+        end_to_end: List[float] = []
+        for _, text in queries:
+            t0 = time.perf_counter()
+            q_emb = engine.encode_query(text)
+            t1 = time.perf_counter()
+            engine.search_by_embedding(q_emb, top_k, step_filter, query=text)
+            t2 = time.perf_counter()
+            retrieval.append(t2 - t1)
+            end_to_end.append(t2 - t0)
+        out[step_filter] = {"retrieval": _latency(retrieval), "search": _latency(end_to_end)}
+    return out
+
+
+def bench_load(embedder: str, env: Dict[str, str]) -> Dict[str, Any]:
+    proc = subprocess.run(
+        [sys.executable, "-c", _LOAD_CHILD, embedder],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    child = json.loads(proc.stdout.strip().splitlines()[-1])
+    return {
+        "load_s": round(child["load_s"], 3),
+        "rss_mb": child["rss_after_mb"],
+        "rss_delta_mb": round(child["rss_after_mb"] - child["rss_before_mb"], 1),
+        "chunks": child["chunks"],
+    }
+
+
+async def _drive_api(base_url: str, args: argparse.Namespace, queries, uploads) -> Dict[str, Any]:
+    import httpx
+
+    from core.auth import create_access_token
+
+    founder = {"Authorization": f"Bearer {create_access_token({'sub': 'bench', 'startup': 'bench'}, 'founder')}"}
+    admin = {"Authorization": f"Bearer {create_access_token({'sub': 'bench-admin'}, 'admin')}"}
+    limits = httpx.Limits(max_connections=args.concurrency + 4)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as http:
+        semaphore = asyncio.Semaphore(args.concurrency)
+        ask_latencies: List[float] = []
+        statuses: Dict[str, int] = {}
+
+        async def ask(i: int) -> None:
+            step, text = queries[i % len(queries)]
+            body = {"startup_id": "bench", "step": step, "user_input": text, "session_id": f"bench-{i}"}
+            async with semaphore:
+                t0 = time.perf_counter()
+                r = await http.post("/agent/ask", json=body, headers=founder)
+                if r.status_code == 200:
+                    ask_latencies.append(time.perf_counter() - t0)
+                statuses[str(r.status_code)] = statuses.get(str(r.status_code), 0) + 1
+
+        upload_requests: List[float] = []
+        upload_jobs: List[float] = []
+        upload_failed = 0
+
+        async def uploader() -> None:
+            nonlocal upload_failed
+            for step, name, content in uploads:
+                t0 = time.perf_counter()
+                r = await http.post(
+                    "/admin/upload-pptx",
+                    data={"step": step},
+                    files=[("files", (name, content, "application/vnd.openxmlformats-officedocument.presentationml.presentation"))],
+                    headers=admin,
+                )
+                upload_requests.append(time.perf_counter() - t0)
+                if r.status_code != 202:
+                    upload_failed += 1
+                    continue
+                job_id = r.json()["job_id"]
+                while True:
+                    job = (await http.get(f"/admin/jobs/{job_id}", headers=admin)).json()
+                    if job["status"] in ("done", "error"):
+                        break
+                    await asyncio.sleep(0.02)
+                if job["status"] == "done":
+                    upload_jobs.append(time.perf_counter() - t0)
+                else:
+                    upload_failed += 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(uploader(), *(ask(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - t0
+
+    return {
+        "ask": {
+            **_latency(ask_latencies),
+            "statuses": statuses,
+            "req_per_s": round(args.requests / elapsed, 1),
+        },
+        "upload": {
+            "files": len(uploads),
+            "failed": upload_failed,
+            "request": _latency(upload_requests),
+            "job": _latency(upload_jobs),
+        },
+        "concurrency": args.concurrency,
+    }
+
+
+def bench_api(args: argparse.Namespace, embedder, queries, uploads) -> Dict[str, Any]:
+    import httpx
+
+    import main
+    import services.openai_client as oc
+    from core.rate_limit import rate_limiter
+    from benchmarks.mock_openai import MockProfile, create_app, serve_in_thread
+
+    if embedder is not None:
+        main.rag_engine.embedder = embedder
+    rate_limiter.enabled = False
+
+    llm, llm_url = serve_in_thread(create_app(MockProfile(latency_ms=args.llm_latency_ms, jitter_ms=args.llm_latency_ms / 5)))
+    oc.client = oc.build_client(base_url=llm_url, http2=False)
+    api, base_url = serve_in_thread(main.app, path="")
+    try:
+        deadline = time.monotonic() + 300
+        while httpx.get(f"{base_url}/ready").status_code != 200:
+            if time.monotonic() > deadline:
+                raise RuntimeError("API não ficou pronta em 300s")
+            time.sleep(0.05)
+        return asyncio.run(_drive_api(base_url, args, queries, uploads))
+    finally:
+        api.should_exit = True
+        llm.should_exit = True
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    data_dir = Path(tempfile.mkdtemp(prefix="tr4ction-bench-"))
+    # antes de importar o backend: o core.config lê o ambiente no import
+    os.environ["DATA_DIR"] = str(data_dir)
+    for key, value in (("OPENAI_API_KEY", "bench"), ("JWT_SECRET_KEY", "bench"),
+                       ("ADMIN_USERNAME", "bench"), ("ADMIN_PASSWORD", "bench")):
+        os.environ.setdefault(key, value)
+    os.environ["RAG_PRELOAD"] = "false"
+    os.environ["METRICS_SLOW_MS"] = "0"
+    if not args.with_caches:
+        os.environ["RAG_QUERY_CACHE_SIZE"] = "0"
+        os.environ["ANSWER_CACHE_SIZE"] = "0"
+
+    from benchmarks.synthetic_kb import STEPS, HashEmbedder, deck_to_pptx, generate_decks, generate_queries
+    from core.rag_engine import RAGEngine
+
+    embedder = HashEmbedder() if args.embedder == "hash" else None
+    decks = generate_decks(args.decks, args.slides, seed=args.seed)
+    queries = generate_queries(args.queries, seed=args.seed + 1)
+    uploads = [
+        (d.step, f"upload_{d.name}", deck_to_pptx(d))
+        for d in generate_decks(args.uploads, args.slides, seed=args.seed + 2)
+    ]
+
+    report: Dict[str, Any] = {"meta": _meta(args), "results": {}}
+    results = report["results"]
+    try:
+        engine = RAGEngine(embedder)
+        engine.load()
+        rss_start = _rss_mb()
+        results["ingest"] = bench_ingest(engine, decks, args.batch_size, args.commit_decks)
+        results["search"] = bench_search(engine, queries, STEPS, args.top_k)
+        results["memory"] = {
+            "rss_mb": _rss_mb(),
+            "rss_growth_mb": round(_rss_mb() - rss_start, 1),
+            "embeddings_mb": round(engine.embeddings.nbytes / 2**20, 1),
+        }
+        del engine
+        results["load"] = bench_load(args.embedder, dict(os.environ))
+        if not args.skip_api:
+            results["api"] = bench_api(args, embedder, queries, uploads)
+        results["memory"]["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    finally:
+        if args.keep_data:
+            print(f"Base do benchmark mantida em {data_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    return report
+
+
+def _print_report(report: Dict[str, Any]) -> None:
+    r = report["results"]
+    meta = report["meta"]
+    print(f"commit {meta['commit']}{' (modificado)' if meta['dirty'] else ''}  python {meta['python']}  {meta['cpus']} CPUs")
+    i = r["ingest"]
+    print(f"ingest  {i['decks']} decks / {i['chunks']} chunks: chunk {i['chunk_s']}s, embed {i['embed_s']}s, "
+          f"commit {i['commit_s']}s (p95 {i['commit']['p95_ms']}ms)  {i['chunks_per_s']} chunks/s")
+    for step, s in r["search"].items():
+        print(f"search  {step:<12} recuperação p50={s['retrieval']['p50_ms']}ms p95={s['retrieval']['p95_ms']}ms  "
+              f"com encode p50={s['search']['p50_ms']}ms p95={s['search']['p95_ms']}ms")
+    l = r["load"]
+    print(f"load    {l['load_s']}s  RSS {l['rss_mb']} MB (+{l['rss_delta_mb']} MB)")
+    if "api" in r:
+        a, u = r["api"]["ask"], r["api"]["upload"]
+        print(f"ask     p50={a['p50_ms']}ms p95={a['p95_ms']}ms p99={a['p99_ms']}ms  {a['req_per_s']} req/s  status={a['statuses']}")
+        print(f"upload  {u['files']} arquivos: requisição p50={u['request']['p50_ms']}ms, "
+              f"job p50={u['job']['p50_ms']}ms p95={u['job']['p95_ms']}ms, falhas={u['failed']}")
+    m = r["memory"]
+    print(f"memória RSS {m['rss_mb']} MB (+{m['rss_growth_mb']} MB na ingestão), pico {m['peak_rss_mb']} MB, "
+          f"embeddings {m['embeddings_mb']} MB")
+
+
+# ---------- Comparação ----------
+def _flatten(tree: Any, prefix: str = "") -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    if isinstance(tree, dict):
+        for k, v in tree.items():
+            out.update(_flatten(v, f"{prefix}.{k}" if prefix else k))
+    elif isinstance(tree, (int, float)) and not isinstance(tree, bool):
+        out[prefix] = float(tree)
+    return out
+
+
+def _direction(key: str) -> int:
+    """+1 quando maior é pior (tempo, memória), -1 quando maior é melhor (vazão), 0 = só informativo."""
+    leaf = key.rsplit(".", 1)[-1]
+    if leaf.endswith("_per_s"):
+        return -1
+    if leaf.endswith(("_ms", "_s", "_mb")):
+        return 1
+    return 0
+
+
+def compare(args: argparse.Namespace) -> int:
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.head, encoding="utf-8") as f:
+        head = json.load(f)
+    old, new = _flatten(base["results"]), _flatten(head["results"])
+
+    regressions = []
+    print(f"{'métrica':<52} {base['meta'].get('commit') or 'base':>12} {head['meta'].get('commit') or 'head':>12} {'delta':>8}")
+    for key in sorted(old.keys() & new.keys()):
+        direction = _direction(key)
+        a, b = old[key], new[key]
+        if direction == 0 or max(abs(a), abs(b)) < args.noise_floor:
+            continue
+        delta = (b - a) / a if a else 0.0
+        worse = delta * direction > args.threshold
+        if worse:
+            regressions.append(key)
+        print(f"{key:<52} {a:>12.3f} {b:>12.3f} {delta:>+7.1%}{'  <-- regressão' if worse else ''}")
+
+    if regressions:
+        print(f"\n{len(regressions)} métrica(s) piores que {args.threshold:.0%}: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        parser = argparse.ArgumentParser(prog="run_bench compare", description="Compara dois relatórios JSON.")
+        parser.add_argument("base")
+        parser.add_argument("head")
+        parser.add_argument("--threshold", type=float, default=0.15, help="piora relativa tolerada (0.15 = 15%%)")
+        parser.add_argument("--noise-floor", type=float, default=0.5,
+                            help="ignora métricas menores que isso nos dois relatórios (na unidade da métrica)")
+        sys.exit(compare(parser.parse_args(sys.argv[2:])))
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--decks", type=int, default=120)
+    parser.add_argument("--slides", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=120)
+    parser.add_argument("--top-k", type=int, default=6)
+    parser.add_argument("--batch-size", type=int, default=64, help="lote de embeddings na ingestão")
+    parser.add_argument("--commit-decks", type=int, default=10, help="decks por add_documents")
+    parser.add_argument("--embedder", choices=("hash", "model"), default="hash")
+    parser.add_argument("--requests", type=int, default=200, help="requisições /agent/ask na fase api")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--uploads", type=int, default=4, help="decks enviados por /admin/upload-pptx durante a carga")
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0, help="latência do LLM simulado")
+    parser.add_argument("--with-caches", action="store_true", help="mantém os caches de perguntas/respostas ligados")
+    parser.add_argument("--skip-api", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep-data", action="store_true", help="não apaga o DATA_DIR temporário")
+    parser.add_argument("--out", help="grava o relatório JSON neste arquivo")
+    parser.add_argument("--json", action="store_true", help="imprime o relatório em JSON")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        _print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Base de conhecimento sintética e determinística para os benchmarks:
+decks no formato dos PPTX da trilha (lista de slides por etapa),
+perguntas por etapa e um embedder por hashing de palavras.
+
+O HashEmbedder não substitui o modelo: serve para medir o custo de
+ingestão, busca e API sem baixar modelo nem depender de GPU/CPU do
+forward pass, com resultados comparáveis entre commits.
+"""
+from __future__ import annotations
+
+import io
+import random
+import re
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from core.embedder import Embedder
+
+STEPS = ("diagnostico", "icp", "persona", "swot", "metas", "conteudo")
+
+# vocabulário característico de cada etapa da trilha
+STEP_TERMS: Dict[str, Tuple[str, ...]] = {
+    "diagnostico": ("diagnostico", "maturidade", "gargalo", "processo", "tracao", "receita", "churn",
+                    "indicador", "operacao", "financeiro", "caixa", "runway", "burn", "equipe"),
+    "icp": ("icp", "cliente", "ideal", "segmento", "porte", "setor", "ticket", "dor", "decisor",
+            "orcamento", "fit", "mercado", "b2b", "recorrencia"),
+    "persona": ("persona", "comprador", "objecao", "jornada", "motivacao", "cargo", "rotina",
+                "entrevista", "empatia", "canal", "linguagem", "gatilho", "frustracao", "meta"),
+    "swot": ("swot", "forca", "fraqueza", "oportunidade", "ameaca", "concorrente", "diferencial",
+             "vantagem", "risco", "cenario", "regulacao", "barreira", "substituto", "tendencia"),
+    "metas": ("meta", "okr", "kpi", "trimestre", "crescimento", "cac", "ltv", "conversao",
+              "pipeline", "previsao", "cohort", "mrr", "retencao", "funil"),
+    "conteudo": ("conteudo", "marca", "posicionamento", "blog", "linkedin", "autoridade", "seo",
+                 "calendario", "editorial", "narrativa", "newsletter", "case", "video", "alcance"),
+}
+
+COMMON_TERMS = tuple(
+    """
+    startup founder produto venda time estrategia teste hipotese validacao dados resultado
+    semana mes ano plano acao priorizar medir aprender iterar mentoria exemplo pratica
+    problema solucao valor proposta preco canal parceria investimento rodada escala
+    atendimento sucesso onboarding ferramenta planilha reuniao feedback relatorio
+    """.split()
+)
+
+TITLES = ("Fundamentos", "Passo a passo", "Exemplos", "Erros comuns", "Ferramentas", "Checklist")
+
+
+@dataclass
+class SyntheticDeck:
+    step: str
+    name: str
+    slides: List[Tuple[int, str]]
+
+
+def _sentence(rng: random.Random, step: str, words: int) -> str:
+    topic = STEP_TERMS[step]
+    return " ".join(rng.choice(topic) if rng.random() < 0.3 else rng.choice(COMMON_TERMS) for _ in range(words))
+
+
+def generate_decks(decks: int, slides: int, seed: int = 0) -> List[SyntheticDeck]:
+    """`decks` decks distribuídos entre as etapas, cada um com `slides` slides."""
+    rng = random.Random(seed)
+    out: List[SyntheticDeck] = []
+    for i in range(decks):
+        step = STEPS[i % len(STEPS)]
+        deck_slides = []
+        for s in range(1, slides + 1):
+            title = f"{rng.choice(TITLES)} de {step}"
+            body = ". ".join(_sentence(rng, step, rng.randint(10, 20)) for _ in range(rng.randint(2, 4)))
+            deck_slides.append((s, f"Slide {s}: {title} {body}"))
+        out.append(SyntheticDeck(step, f"{step}_{i:05d}.pptx", deck_slides))
+    return out
+
+
+def generate_queries(count: int, seed: int = 1) -> List[Tuple[str, str]]:
+    """Perguntas (etapa, texto) misturando termos da etapa e termos comuns."""
+    rng = random.Random(seed)
+    queries = []
+    for i in range(count):
+        step = STEPS[i % len(STEPS)]
+        terms = rng.sample(STEP_TERMS[step], 2) + rng.sample(COMMON_TERMS, 2)
+        queries.append((step, f"Como usar {terms[0]} e {terms[1]} para {terms[2]} do {terms[3]} #{i}?"))
+    return queries
+
+
+def deck_to_pptx(deck: SyntheticDeck) -> bytes:
+    """Renderiza o deck como PPTX (título + corpo por slide) para testar o upload."""
+    from pptx import Presentation
+
+    prs = Presentation()
+    for idx, text in deck.slides:
+        slide = prs.slides.add_slide(prs.slide_layouts[1])
+        slide.shapes.title.text = f"{deck.name} ({idx})"
+        slide.placeholders[1].text = text.split(": ", 1)[1]
+    buf = io.BytesIO()
+    prs.save(buf)
+    return buf.getvalue()
+
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class HashEmbedder(Embedder):
+    """Feature hashing das palavras (crc32, determinístico entre processos)."""
+
+    model_name = "bench-hash"
+
+    def __init__(self, dim: int = 384) -> None:
+        self.dim = dim
+
+    def load(self) -> None:
+        pass
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in _WORD_RE.findall(text.lower()):
+                h = zlib.crc32(word.encode())
+                out[i, h % self.dim] += 1.0 if h & 0x10000 else -1.0
+        return out
+
+    def info(self):
+        return {"backend": "hash", "model": self.model_name, "dim": self.dim}
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import hashlib
+from typing import List
+
+from core.config import RAG_CHUNK_SLIDES, RAG_CHUNK_OVERLAP, RAG_CHUNK_MAX_CHARS
+from core.extractors import SlideText
+from core.rag_engine import KnowledgeDoc
+
+
+def content_hash(text: str) -> str:
+    """Hash do conteúdo usado para detectar decks/chunks que não mudaram."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def deck_hash(slides: List[SlideText]) -> str:
+    return content_hash("\n".join(f"{idx}\t{text}" for idx, text in slides))
+
+
+def chunk_slides(
+    parent_id: str,
+    step: str,
+    title: str,
+    slides: List[SlideText],
+    window: int = RAG_CHUNK_SLIDES,
+    overlap: int = RAG_CHUNK_OVERLAP,
+    max_chars: int = RAG_CHUNK_MAX_CHARS,
+) -> List[KnowledgeDoc]:
+    """
+    Quebra um deck em janelas de slides sobrepostas.
+    Cada chunk guarda o id do deck (parent_id) e o intervalo de slides,
+    para que a busca consiga deduplicar trechos do mesmo deck.
+    Uma janela é encurtada quando passaria de max_chars (mínimo 1 slide).
+    Cada chunk leva o hash do próprio texto e o hash do deck inteiro.
+    """
+    window = max(1, window)
+    overlap = max(0, min(overlap, window - 1))
+
+    chunks: List[KnowledgeDoc] = []
+    parent_hash = deck_hash(slides)
+    n = len(slides)
+    i = 0
+    while i < n:
+        j = i
+        size = 0
+        while j < n and j - i < window:
+            slide_len = len(slides[j][1])
+            if j > i and size + slide_len > max_chars:
+                break
+            size += slide_len
+            j += 1
+
+        window_slides = slides[i:j]
+        first, last = window_slides[0][0], window_slides[-1][0]
+        text = "\n".join(t for _, t in window_slides)
+        chunks.append(
+            KnowledgeDoc(
+                id=f"{parent_id}#slides-{first}-{last}",
+                step=step,
+                title=title,
+                text=text,
+                parent_id=parent_id,
+                slide_start=first,
+                slide_end=last,
+                content_hash=content_hash(text),
+                parent_hash=parent_hash,
+            )
+        )
+
+        if j >= n:
+            break
+        # avança mantendo `overlap` slides em comum, mas sempre progride
+        i = max(i + 1, j - overlap)
+
+    return chunks
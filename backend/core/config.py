@@ -13,8 +13,191 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 RAG_EMBEDDING_MODEL = os.getenv("RAG_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
 
-DATA_DIR = BASE_DIR / "data"
-DATA_DIR.mkdir(exist_ok=True)
-KNOWLEDGE_PATH = DATA_DIR / "knowledge.json"
+# Cliente OpenAI: URL alternativa (proxy ou servidor compatível, ex.: o mock dos
+# benchmarks), modelo de fallback e timeout total de cada chamada (segundos).
+# Fallback vazio ou igual ao modelo chamado desliga o fallback e o hedging
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "").strip()
+OPENAI_FALLBACK_MODEL = os.getenv("OPENAI_FALLBACK_MODEL", "gpt-4o-mini").strip()
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "25"))
+# Pool de conexões HTTP (keep-alive) compartilhado por todas as chamadas
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+# HTTP/2 precisa do pacote h2 (httpx[http2]); sem ele o cliente usa HTTP/1.1
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "true").strip().lower() in ("1", "true", "yes")
+# Retries de erros transitórios (conexão, 408/409/429/5xx) com backoff exponencial e jitter
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+OPENAI_RETRY_BASE = float(os.getenv("OPENAI_RETRY_BASE", "0.25"))
+OPENAI_RETRY_MAX = float(os.getenv("OPENAI_RETRY_MAX", "4"))
+# Circuit breaker por modelo: abre após N falhas seguidas e testa de novo após X segundos
+OPENAI_BREAKER_FAILURES = int(os.getenv("OPENAI_BREAKER_FAILURES", "5"))
+OPENAI_BREAKER_COOLDOWN = float(os.getenv("OPENAI_BREAKER_COOLDOWN", "30"))
+# Hedging: se o modelo principal não responder até o percentil OPENAI_HEDGE_QUANTILE
+# da sua latência recente, dispara o fallback em paralelo e fica com a primeira resposta
+OPENAI_HEDGE = os.getenv("OPENAI_HEDGE", "false").strip().lower() in ("1", "true", "yes")
+OPENAI_HEDGE_QUANTILE = float(os.getenv("OPENAI_HEDGE_QUANTILE", "0.95"))
+# espera usada enquanto não há OPENAI_HEDGE_MIN_SAMPLES latências medidas
+OPENAI_HEDGE_DELAY = float(os.getenv("OPENAI_HEDGE_DELAY", "3"))
+OPENAI_HEDGE_MIN_SAMPLES = int(os.getenv("OPENAI_HEDGE_MIN_SAMPLES", "20"))
+
+# Carregamento do modelo: RAG_PRELOAD=true carrega no import do main.py
+# (com gunicorn --preload, uma vez no master antes do fork dos workers).
+# Com RAG_EMBEDDER_SOCKET definido, os workers usam o sidecar
+# (python -m core.embedder_server) em vez de carregar o modelo.
+RAG_PRELOAD = os.getenv("RAG_PRELOAD", "false").strip().lower() in ("1", "true", "yes")
+RAG_EMBEDDER_SOCKET = os.getenv("RAG_EMBEDDER_SOCKET", "").strip()
+RAG_EMBEDDER_TIMEOUT = float(os.getenv("RAG_EMBEDDER_TIMEOUT", "30"))
+# Load em segundo plano que falhou é tentado de novo, com backoff de MIN até MAX segundos
+RAG_LOAD_RETRY_MIN = float(os.getenv("RAG_LOAD_RETRY_MIN", "2"))
+RAG_LOAD_RETRY_MAX = float(os.getenv("RAG_LOAD_RETRY_MAX", "60"))
+# Execução do modelo de embedding (local ou no sidecar): torch (float32),
+# torch-int8 (quantização dinâmica, CPU) ou onnx (ONNX Runtime, se instalado).
+# RAG_EMBEDDING_THREADS=0 deixa o padrão da biblioteca (todos os núcleos).
+# Encodes em lote usam lotes de até RAG_EMBEDDING_BATCH_TOKENS tokens
+# (0 = lotes de tamanho fixo)
+RAG_EMBEDDING_RUNTIME = os.getenv("RAG_EMBEDDING_RUNTIME", "torch").strip().lower()
+RAG_EMBEDDING_THREADS = int(os.getenv("RAG_EMBEDDING_THREADS", "0"))
+RAG_EMBEDDING_BATCH_TOKENS = int(os.getenv("RAG_EMBEDDING_BATCH_TOKENS", "8192"))
+# arquivo .onnx dentro do repositório do modelo (ex.: onnx/model_qint8_avx512_vnni.onnx);
+# vazio = onnx/model.onnx, exportado na hora se o modelo não tiver
+RAG_EMBEDDING_ONNX_FILE = os.getenv("RAG_EMBEDDING_ONNX_FILE", "").strip()
+
+# Chunking: janelas de slides sobrepostas por deck
+RAG_CHUNK_SLIDES = int(os.getenv("RAG_CHUNK_SLIDES", "3"))
+RAG_CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "1"))
+RAG_CHUNK_MAX_CHARS = int(os.getenv("RAG_CHUNK_MAX_CHARS", "1500"))
+RAG_MAX_CHUNKS_PER_PARENT = int(os.getenv("RAG_MAX_CHUNKS_PER_PARENT", "2"))
+
+# Índice vetorial: "exact" (varredura completa, padrão) ou "ivf" (aproximado)
+RAG_INDEX_BACKEND = os.getenv("RAG_INDEX_BACKEND", "exact").strip().lower()
+RAG_IVF_NLIST = int(os.getenv("RAG_IVF_NLIST", "0"))  # 0 = automático (~2*sqrt(n))
+RAG_IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "8"))
+RAG_IVF_MIN_ROWS = int(os.getenv("RAG_IVF_MIN_ROWS", "5000"))
+
+# Busca híbrida: BM25 sobre o texto dos chunks fundido com a busca densa (RRF)
+RAG_HYBRID = os.getenv("RAG_HYBRID", "true").strip().lower() in ("1", "true", "yes")
+RAG_BM25_K1 = float(os.getenv("RAG_BM25_K1", "1.2"))
+RAG_BM25_B = float(os.getenv("RAG_BM25_B", "0.75"))
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+# >0: a busca densa só pontua os N melhores candidatos do BM25 (bases grandes)
+RAG_LEXICAL_PREFILTER = int(os.getenv("RAG_LEXICAL_PREFILTER", "0"))
+
+# Tipo dos embeddings em disco: float32 (padrão), float16 (metade da RAM/disco)
+# ou int8 com escala por linha (~1/4)
+RAG_EMBEDDING_DTYPE = os.getenv("RAG_EMBEDDING_DTYPE", "float32").strip().lower()
+# float16/int8: guarda também uma cópia float32 em disco e reordena os candidatos com ela
+RAG_EXACT_RERANK = os.getenv("RAG_EXACT_RERANK", "true").strip().lower() in ("1", "true", "yes")
+# Compacta a base quando a fração de linhas removidas (re-uploads) passa disso
+RAG_COMPACT_RATIO = float(os.getenv("RAG_COMPACT_RATIO", "0.25"))
+# Cada worker verifica o manifesto da base a cada N segundos e carrega o que
+# outro worker publicou (0 desativa; POST /admin/reload continua funcionando)
+RAG_RELOAD_INTERVAL = float(os.getenv("RAG_RELOAD_INTERVAL", "1.0"))
+
+# Cache de embeddings de perguntas (0 desativa); em disco é compartilhado entre workers
+RAG_QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_CACHE_SIZE", "2048"))
+RAG_QUERY_CACHE_TTL = int(os.getenv("RAG_QUERY_CACHE_TTL", str(60 * 60 * 24)))
+RAG_QUERY_CACHE_DISK = os.getenv("RAG_QUERY_CACHE_DISK", "true").strip().lower() in ("1", "true", "yes")
+
+# Encoder de perguntas fora do event loop: micro-lotes de até N perguntas / X ms
+RAG_ENCODER_MAX_BATCH = int(os.getenv("RAG_ENCODER_MAX_BATCH", "32"))
+RAG_ENCODER_MAX_WAIT_MS = float(os.getenv("RAG_ENCODER_MAX_WAIT_MS", "5"))
+RAG_ENCODER_THREADS = int(os.getenv("RAG_ENCODER_THREADS", "1"))
+
+# Re-ranking com cross-encoder: os RAG_RERANK_CANDIDATES melhores da busca são
+# reordenados pelo modelo e só RAG_RERANK_TOP_K vão para o prompt. Passou de
+# RAG_RERANK_BUDGET_MS, a busca fica com a ordem do bi-encoder (e o top_k pedido)
+RAG_RERANK = os.getenv("RAG_RERANK", "false").strip().lower() in ("1", "true", "yes")
+RAG_RERANK_MODEL = os.getenv("RAG_RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+# etapas com re-ranking, com top_k opcional por etapa: "icp,persona:3,swot" (vazio = todas)
+RAG_RERANK_STEPS = os.getenv("RAG_RERANK_STEPS", "")
+RAG_RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", "20"))
+RAG_RERANK_TOP_K = int(os.getenv("RAG_RERANK_TOP_K", "4"))
+RAG_RERANK_BUDGET_MS = float(os.getenv("RAG_RERANK_BUDGET_MS", "250"))
+RAG_RERANK_BATCH = int(os.getenv("RAG_RERANK_BATCH", "8"))
+RAG_RERANK_THREADS = int(os.getenv("RAG_RERANK_THREADS", "2"))
+RAG_RERANK_MAX_LENGTH = int(os.getenv("RAG_RERANK_MAX_LENGTH", "256"))
+
+# Ingestão em segundo plano: processos de parsing, lote de embeddings, jobs guardados
+RAG_INGEST_PROCESSES = int(os.getenv("RAG_INGEST_PROCESSES", "2"))
+RAG_INGEST_BATCH_SIZE = int(os.getenv("RAG_INGEST_BATCH_SIZE", "64"))
+RAG_INGEST_MAX_JOBS = int(os.getenv("RAG_INGEST_MAX_JOBS", "100"))
+# Bases privadas das startups (claim "startup" do JWT), em DATA_DIR/tenants:
+# carregadas no primeiro uso, no máximo RAG_TENANT_MAX_LOADED por worker (LRU),
+# descarregadas após RAG_TENANT_IDLE_SECONDS sem uso; até RAG_TENANT_MAX_CHUNKS por startup
+RAG_TENANT_MAX_LOADED = int(os.getenv("RAG_TENANT_MAX_LOADED", "32"))
+RAG_TENANT_IDLE_SECONDS = float(os.getenv("RAG_TENANT_IDLE_SECONDS", "900"))
+RAG_TENANT_MAX_CHUNKS = int(os.getenv("RAG_TENANT_MAX_CHUNKS", "5000"))
+
+# Uploads: gravados em disco em blocos (DATA_DIR/uploads) até a ingestão terminar;
+# acima dos limites o upload é recusado com 413
+UPLOAD_MAX_FILE_MB = float(os.getenv("UPLOAD_MAX_FILE_MB", "50"))
+UPLOAD_MAX_TOTAL_MB = float(os.getenv("UPLOAD_MAX_TOTAL_MB", "200"))
+
+# Orçamento de tokens do prompt (entrada): total, contexto RAG e histórico da conversa
+PROMPT_MAX_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", "4000"))
+PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", "1800"))
+PROMPT_HISTORY_TOKENS = int(os.getenv("PROMPT_HISTORY_TOKENS", "1200"))
+
+# Sessões de conversa no servidor: "memory" (por worker) ou "sqlite" (compartilhado)
+SESSION_STORE = os.getenv("SESSION_STORE", "memory").strip().lower()
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(60 * 60 * 24)))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "5000"))
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "100"))
+
+# Rate limit por usuário do JWT: memory (por worker) ou sqlite (compartilhado entre workers)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "sqlite").strip().lower()
+RATE_LIMIT_ASK = os.getenv("RATE_LIMIT_ASK", "20/minute").strip()
+# uploads de material próprio pelos founders (POST /agent/knowledge/upload)
+RATE_LIMIT_UPLOAD = os.getenv("RATE_LIMIT_UPLOAD", "10/hour").strip()
+
+# Avaliação em lote (POST /admin/eval, python -m services.evaluation):
+# perguntas por arquivo, perguntas por lote de busca e gerações simultâneas
+EVAL_MAX_ITEMS = int(os.getenv("EVAL_MAX_ITEMS", "2000"))
+EVAL_BATCH_SIZE = int(os.getenv("EVAL_BATCH_SIZE", "64"))
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", "4"))
+
+# Controle de admissão do LLM (por worker): chamadas simultâneas, fila e espera máxima (s)
+LLM_MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", "16"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))
+
+# Cache semântico de respostas do agente (0 desativa)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(60 * 60 * 6)))
+# similaridade de cosseno mínima entre perguntas para reaproveitar a resposta
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+# só perguntas com até N mensagens de histórico usam o cache
+ANSWER_CACHE_MAX_HISTORY = int(os.getenv("ANSWER_CACHE_MAX_HISTORY", "0"))
+# true = respostas compartilhadas entre startups (a resposta pode citar o nome da startup)
+ANSWER_CACHE_SHARED = os.getenv("ANSWER_CACHE_SHARED", "false").strip().lower() in ("1", "true", "yes")
+
+# Métricas: GET /metrics no formato texto do Prometheus (por worker)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+# se definido, /metrics exige "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "").strip()
+# observações recentes por série usadas nos quantis p50/p95/p99
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "1024"))
+# X-Debug-Timing: 1 na requisição devolve o header Server-Timing com as etapas
+METRICS_DEBUG_HEADER = os.getenv("METRICS_DEBUG_HEADER", "true").strip().lower() in ("1", "true", "yes")
+# loga o detalhamento por etapa de requisições mais lentas que isso (0 desativa)
+METRICS_SLOW_MS = float(os.getenv("METRICS_SLOW_MS", "5000"))
+
+# Diretório da base, caches e sessões (padrão: backend/data)
+DATA_DIR = Path(os.getenv("DATA_DIR", "").strip() or BASE_DIR / "data")
+DATA_DIR.mkdir(parents=True, exist_ok=True)
+# Base versionada: manifest.json aponta para a geração atual em snapshots/gen-N/.
+# Os arquivos na raiz de DATA_DIR são do formato anterior e migrados no load.
+MANIFEST_PATH = DATA_DIR / "manifest.json"
+SNAPSHOTS_DIR = DATA_DIR / "snapshots"
+WRITE_LOCK_PATH = DATA_DIR / ".write.lock"
+KNOWLEDGE_PATH = DATA_DIR / "knowledge.jsonl"
+LEGACY_KNOWLEDGE_PATH = DATA_DIR / "knowledge.json"  # formato mais antigo
 EMBEDDINGS_PATH = DATA_DIR / "embeddings.npy"
+INDEX_PATH = DATA_DIR / "index.npz"
 METADATA_PATH = DATA_DIR / "metadata.json"
+QUERY_CACHE_PATH = DATA_DIR / "query_cache.sqlite3"
+SESSION_DB_PATH = DATA_DIR / "sessions.sqlite3"
+RATE_LIMIT_DB_PATH = DATA_DIR / "rate_limit.sqlite3"
+UPLOADS_DIR = DATA_DIR / "uploads"
+TENANTS_DIR = DATA_DIR / "tenants"
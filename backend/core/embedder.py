@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import json
+import logging
+import socket
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from core.config import (
+    RAG_EMBEDDING_MODEL,
+    RAG_EMBEDDING_RUNTIME,
+    RAG_EMBEDDING_THREADS,
+    RAG_EMBEDDING_BATCH_TOKENS,
+    RAG_EMBEDDING_ONNX_FILE,
+    RAG_EMBEDDER_SOCKET,
+    RAG_EMBEDDER_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+# torch: float32 (referência); torch-int8: camadas Linear quantizadas
+# dinamicamente; onnx: ONNX Runtime (precisa de onnxruntime + optimum)
+EMBEDDING_RUNTIMES = ("torch", "torch-int8", "onnx")
+
+
+# ---------- Protocolo do sidecar ----------
+# Cada mensagem é um frame: 4 bytes (tamanho, big-endian) + conteúdo.
+# Pedido: frame JSON {"op": "encode", "texts": [...], "batch_size": n} ou {"op": "info"}.
+# Resposta: frame JSON {"ok": true, "shape": [...], "dtype": "<f4"} seguido de um
+# frame com os bytes da matriz; em caso de erro, {"ok": false, "error": "..."}.
+_LEN = struct.Struct("!I")
+
+
+def send_frame(sock: socket.socket, payload: bytes) -> None:
+    sock.sendall(_LEN.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        part = sock.recv(n - len(buf))
+        if not part:
+            raise ConnectionError("Conexão com o embedder encerrada")
+        buf += part
+    return bytes(buf)
+
+
+def recv_frame(sock: socket.socket) -> bytes:
+    (size,) = _LEN.unpack(_recv_exact(sock, _LEN.size))
+    return _recv_exact(sock, size)
+
+
+# ---------- Embedders ----------
+class Embedder(ABC):
+    """
+    Quem calcula os embeddings para o RAGEngine.
+    `encode` devolve a matriz crua (sem normalizar); `load` é idempotente
+    e pode ser chamado antes (pré-carga) ou deixado para o primeiro encode.
+    """
+
+    model_name = RAG_EMBEDDING_MODEL
+
+    @abstractmethod
+    def load(self) -> None:
+        ...
+
+    @abstractmethod
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        ...
+
+    @property
+    def cache_namespace(self) -> str:
+        """Parte da chave do cache de perguntas: vetores de runtimes diferentes não se misturam."""
+        return self.model_name
+
+    def info(self) -> Dict[str, Any]:
+        return {"backend": "base", "model": self.model_name}
+
+
+class LocalEmbedder(Embedder):
+    """
+    SentenceTransformer no próprio processo (torch só é importado no load).
+
+    O runtime (RAG_EMBEDDING_RUNTIME) troca só a execução do modelo; a
+    paridade com o float32 é conferida por benchmarks/bench_embedder.py.
+    Nos encodes com vários textos, os textos são ordenados por tamanho e os
+    lotes montados por orçamento de tokens (RAG_EMBEDDING_BATCH_TOKENS):
+    textos curtos vão em lotes grandes, longos em lotes pequenos, e cada
+    lote tem pouco padding.
+    """
+
+    def __init__(
+        self,
+        model_name: str = RAG_EMBEDDING_MODEL,
+        runtime: str = RAG_EMBEDDING_RUNTIME,
+        threads: int = RAG_EMBEDDING_THREADS,
+        batch_tokens: int = RAG_EMBEDDING_BATCH_TOKENS,
+        onnx_file: str = RAG_EMBEDDING_ONNX_FILE,
+    ) -> None:
+        if runtime not in EMBEDDING_RUNTIMES:
+            raise RuntimeError(
+                f"RAG_EMBEDDING_RUNTIME inválido: '{runtime}'. Use um de: {', '.join(EMBEDDING_RUNTIMES)}"
+            )
+        self.model_name = model_name
+        self.runtime = runtime
+        self.threads = threads
+        self.batch_tokens = batch_tokens
+        self.onnx_file = onnx_file
+        self._model = None
+        self._lock = threading.Lock()
+        self._max_tokens = 512
+        # runtime efetivo (onnx sem onnxruntime/optimum instalados cai para torch)
+        self.active_runtime: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+
+    def load(self) -> None:
+        if self._model is not None:
+            return
+        with self._lock:
+            if self._model is not None:
+                return
+            started = time.perf_counter()
+            model = self._build()
+            self._max_tokens = getattr(model, "max_seq_length", None) or self._max_tokens
+            self._model = model
+            self.load_seconds = round(time.perf_counter() - started, 3)
+            logger.info(
+                f"Modelo de embedding '{self.model_name}' ({self.active_runtime}) carregado em {self.load_seconds}s"
+            )
+
+    def _build(self):
+        from sentence_transformers import SentenceTransformer
+
+        if self.runtime == "onnx":
+            try:
+                import onnxruntime
+                import optimum.onnxruntime  # noqa: F401 (backend onnx do sentence-transformers)
+            except ImportError as e:
+                logger.warning(f"Runtime onnx indisponível ({e}): embeddings com torch float32")
+            else:
+                model_kwargs: Dict[str, Any] = {"provider": "CPUExecutionProvider"}
+                if self.onnx_file:
+                    model_kwargs["file_name"] = self.onnx_file
+                if self.threads > 0:
+                    options = onnxruntime.SessionOptions()
+                    options.intra_op_num_threads = self.threads
+                    options.inter_op_num_threads = 1
+                    model_kwargs["session_options"] = options
+                self.active_runtime = "onnx"
+                return SentenceTransformer(self.model_name, backend="onnx", model_kwargs=model_kwargs)
+
+        import torch
+
+        if self.threads > 0:
+            torch.set_num_threads(self.threads)
+        if self.runtime == "torch-int8":
+            model = SentenceTransformer(self.model_name, device="cpu")
+            self.active_runtime = "torch-int8"
+            return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.active_runtime = "torch"
+        return SentenceTransformer(self.model_name)
+
+    def _batches(self, texts: List[str], batch_size: int) -> List[np.ndarray]:
+        """Índices dos textos agrupados em lotes, do texto mais longo ao mais curto."""
+        if self.batch_tokens <= 0:
+            order = np.arange(len(texts))
+            return [order[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        # estimativa barata (~4 caracteres por token), limitada ao que o modelo lê
+        lengths = np.array([min(len(t) // 4 + 2, self._max_tokens) for t in texts])
+        order = np.argsort(-lengths, kind="stable")
+        batches = []
+        start = 0
+        while start < len(order):
+            # o mais longo do lote define o padding de todos
+            size = max(1, self.batch_tokens // int(lengths[order[start]]))
+            batches.append(order[start:start + size])
+            start += size
+        return batches
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """`batch_size` só vale com RAG_EMBEDDING_BATCH_TOKENS=0 (lotes de tamanho fixo)."""
+        self.load()
+        if len(texts) <= 1:
+            return self._model.encode(texts, convert_to_numpy=True, batch_size=1, show_progress_bar=False)
+        out: Optional[np.ndarray] = None
+        for idx in self._batches(texts, max(1, batch_size)):
+            embs = self._model.encode(
+                [texts[i] for i in idx], convert_to_numpy=True, batch_size=len(idx), show_progress_bar=False
+            )
+            if out is None:
+                out = np.empty((len(texts), embs.shape[1]), dtype=embs.dtype)
+            out[idx] = embs
+        return out
+
+    @property
+    def cache_namespace(self) -> str:
+        return f"{self.model_name}\0{self.active_runtime or self.runtime}"
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "backend": "local",
+            "model": self.model_name,
+            "runtime": self.active_runtime or self.runtime,
+            "threads": self.threads or "padrão",
+            "batch_tokens": self.batch_tokens,
+            "loaded": self._model is not None,
+            "load_seconds": self.load_seconds,
+        }
+
+
+class RemoteEmbedder(Embedder):
+    """
+    Cliente do sidecar (python -m core.embedder_server) via socket Unix.
+    Vários workers da API compartilham um único modelo carregado.
+    Cada thread mantém sua própria conexão; uma conexão caída (ex.: sidecar
+    reiniciado) é tentada de novo uma vez com uma conexão nova, dentro do
+    mesmo `timeout` total. Timeout de leitura não é repetido: o sidecar está
+    lento, e uma segunda espera só dobraria a latência da pergunta.
+    """
+
+    def __init__(
+        self,
+        socket_path: str = RAG_EMBEDDER_SOCKET,
+        timeout: float = RAG_EMBEDDER_TIMEOUT,
+        model_name: str = RAG_EMBEDDING_MODEL,
+    ) -> None:
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.model_name = model_name
+        # runtime do sidecar, lido no load()
+        self.runtime: Optional[str] = None
+        self._local = threading.local()
+        self._checked = False
+
+    def _connect(self, timeout: float) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+    def _close(self) -> None:
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            try:
+                sock.close()
+            finally:
+                self._local.sock = None
+
+    def _call(self, request: Dict[str, Any]) -> tuple:
+        payload = json.dumps(request).encode("utf-8")
+        deadline = time.monotonic() + self.timeout
+        for attempt in (1, 2):
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise socket.timeout("prazo esgotado")
+                sock = getattr(self._local, "sock", None)
+                if sock is None:
+                    sock = self._local.sock = self._connect(remaining)
+                else:
+                    sock.settimeout(remaining)
+                send_frame(sock, payload)
+                header = json.loads(recv_frame(sock))
+                body = recv_frame(sock) if header.get("ok") and "shape" in header else b""
+                break
+            except socket.timeout as e:
+                # resposta pela metade na conexão: descarta, e não tenta de novo
+                self._close()
+                raise RuntimeError(f"Embedder em {self.socket_path} não respondeu em {self.timeout}s") from e
+            except (OSError, ConnectionError) as e:
+                self._close()
+                if attempt == 2:
+                    raise RuntimeError(f"Embedder indisponível em {self.socket_path}: {e}") from e
+
+        if not header.get("ok"):
+            raise RuntimeError(f"Erro no embedder: {header.get('error')}")
+        return header, body
+
+    def load(self) -> None:
+        """Confere que o sidecar responde e usa o mesmo modelo."""
+        if self._checked:
+            return
+        header, _ = self._call({"op": "info"})
+        if header.get("model") != self.model_name:
+            raise RuntimeError(
+                f"Embedder em {self.socket_path} usa o modelo '{header.get('model')}', "
+                f"mas RAG_EMBEDDING_MODEL é '{self.model_name}'"
+            )
+        self.runtime = header.get("runtime")
+        self._checked = True
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        header, body = self._call({"op": "encode", "texts": texts, "batch_size": batch_size})
+        return np.frombuffer(body, dtype=header["dtype"]).reshape(header["shape"])
+
+    @property
+    def cache_namespace(self) -> str:
+        return f"{self.model_name}\0{self.runtime or ''}"
+
+    def info(self) -> Dict[str, Any]:
+        return {"backend": "sidecar", "model": self.model_name, "runtime": self.runtime, "socket": self.socket_path}
+
+
+def make_embedder() -> Embedder:
+    """Sidecar se RAG_EMBEDDER_SOCKET estiver definido; senão o modelo local."""
+    if RAG_EMBEDDER_SOCKET:
+        return RemoteEmbedder()
+    return LocalEmbedder()
@@ -0,0 +1,97 @@
+"""
+Sidecar de embeddings: carrega o modelo uma vez e atende os workers da API
+por um socket Unix (protocolo em core/embedder.py).
+
+Uso (a partir de backend/):
+    RAG_EMBEDDER_SOCKET=/tmp/tr4ction-embedder.sock python -m core.embedder_server
+e inicie a API com a mesma RAG_EMBEDDER_SOCKET.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import socketserver
+import threading
+
+from core.config import RAG_EMBEDDER_SOCKET, RAG_EMBEDDING_MODEL, RAG_EMBEDDING_RUNTIME
+from core.embedder import EMBEDDING_RUNTIMES, LocalEmbedder, recv_frame, send_frame
+
+logger = logging.getLogger(__name__)
+
+
+class EmbedderServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, embedder: LocalEmbedder) -> None:
+        self.embedder = embedder
+        # um forward pass por vez: o torch já usa todos os núcleos em cada encode
+        self.encode_lock = threading.Lock()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o660)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    server: EmbedderServer
+
+    def handle(self) -> None:
+        # conexão persistente: vários pedidos por conexão até o cliente fechar
+        while True:
+            try:
+                request = json.loads(recv_frame(self.request))
+            except (ConnectionError, OSError):
+                return
+            try:
+                self._answer(request)
+            except (ConnectionError, OSError):
+                return
+
+    def _answer(self, request: dict) -> None:
+        embedder = self.server.embedder
+        op = request.get("op")
+        if op == "info":
+            send_frame(self.request, json.dumps({"ok": True, **embedder.info()}).encode("utf-8"))
+            return
+        if op != "encode":
+            send_frame(self.request, json.dumps({"ok": False, "error": f"op inválida: {op}"}).encode("utf-8"))
+            return
+
+        try:
+            with self.server.encode_lock:
+                embs = embedder.encode(request["texts"], batch_size=int(request.get("batch_size", 32)))
+        except Exception as e:
+            logger.error(f"Erro no encode ({len(request.get('texts', []))} textos): {e}")
+            send_frame(self.request, json.dumps({"ok": False, "error": str(e)}).encode("utf-8"))
+            return
+
+        header = {"ok": True, "shape": list(embs.shape), "dtype": embs.dtype.str}
+        send_frame(self.request, json.dumps(header).encode("utf-8"))
+        send_frame(self.request, embs.tobytes())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sidecar de embeddings (socket Unix)")
+    parser.add_argument("--socket", default=RAG_EMBEDDER_SOCKET or "/tmp/tr4ction-embedder.sock")
+    parser.add_argument("--model", default=RAG_EMBEDDING_MODEL)
+    parser.add_argument("--runtime", default=RAG_EMBEDDING_RUNTIME, choices=EMBEDDING_RUNTIMES)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    embedder = LocalEmbedder(args.model, runtime=args.runtime)
+    embedder.load()
+    with EmbedderServer(args.socket, embedder) as server:
+        logger.info(f"Embedder '{args.model}' ({embedder.active_runtime}) ouvindo em {args.socket}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+from __future__ import annotations
+
+import json
+import os
+import struct
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from core.scoring import Matrix, QuantizedMatrix, quantize_int8
+
+
+# Cabeçalho .npy de tamanho fixo: permite reescrever o shape in-place a cada append
+# sem deslocar os dados. Continua legível por np.load (formato 1.0).
+NPY_HEADER_SIZE = 128
+SUPPORTED_DTYPES = ("float32", "float16", "int8")
+
+
+def _npy_header(dtype: np.dtype, shape: Tuple[int, ...]) -> bytes:
+    header = {
+        "descr": np.lib.format.dtype_to_descr(dtype),
+        "fortran_order": False,
+        "shape": tuple(shape),
+    }
+    magic = np.lib.format.magic(1, 0)
+    body_len = NPY_HEADER_SIZE - len(magic) - 2
+    body = repr(header).ljust(body_len - 1) + "\n"
+    return magic + struct.pack("<H", body_len) + body.encode("latin1")
+
+
+def _data_offset(path: Path) -> int:
+    """Offset (em bytes) do início dos dados de um arquivo .npy."""
+    with open(path, "rb") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            np.lib.format.read_array_header_1_0(f)
+        else:
+            np.lib.format.read_array_header_2_0(f)
+        return f.tell()
+
+
+def _fsync(f) -> None:
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _write_npy(path: Path, data: np.ndarray) -> None:
+    """Grava um .npy completo com o cabeçalho de tamanho fixo."""
+    with open(path, "wb") as f:
+        f.write(_npy_header(data.dtype, data.shape))
+        f.write(data.tobytes())
+        _fsync(f)
+
+
+def _append_npy(path: Path, data: np.ndarray, old_rows: int) -> None:
+    """Grava `data` a partir da linha old_rows e só então atualiza o shape no cabeçalho."""
+    row_bytes = data.dtype.itemsize * int(np.prod(data.shape[1:], dtype=np.int64))
+    with open(path, "r+b") as f:
+        f.seek(NPY_HEADER_SIZE + old_rows * row_bytes)
+        f.write(data.tobytes())
+        f.truncate()
+        _fsync(f)
+        f.seek(0)
+        f.write(_npy_header(data.dtype, (old_rows + data.shape[0],) + data.shape[1:]))
+        _fsync(f)
+
+
+class EmbeddingStore:
+    """
+    Armazenamento append-only da base de conhecimento.
+
+    - embeddings.npy: matriz (n, dim) float32/float16/int8, já L2-normalizada,
+      com cabeçalho de tamanho fixo. Lida com np.load(mmap_mode="r"), então
+      vários workers compartilham as mesmas páginas do page cache.
+    - embeddings.scales.npy: escala por linha, só no modo int8.
+    - embeddings.f32.npy: cópia float32 (keep_full, modos float16/int8) para
+      o re-rank exato dos candidatos; só as páginas lidas entram na RAM.
+    - knowledge.jsonl: um documento por linha, na mesma ordem das linhas.
+    - deleted.log: números de linha removidos (um por linha). Remoções não
+      reescrevem os arquivos acima; a compactação (rewrite) zera o log.
+
+    Um append grava só os novos documentos e as novas linhas; o cabeçalho do
+    embeddings.npy (com o novo shape) é reescrito por último.
+    Com snapshots (core/snapshots.py) quem define o que está commitado é o
+    manifesto: load() recebe as linhas e os bytes de knowledge.jsonl e de
+    deleted.log publicados e ignora o resto, mesmo que outro worker esteja
+    no meio de um append. Sem manifesto (migração), vale o cabeçalho.
+    Linhas/documentos além do último commit (ex.: queda no meio do append)
+    são ignorados na leitura e sobrescritos no próximo append.
+    """
+
+    def __init__(
+        self,
+        embeddings_path: Path,
+        docs_path: Path,
+        dtype: str = "float32",
+        deleted_path: Optional[Path] = None,
+        keep_full: bool = False,
+    ) -> None:
+        if dtype not in SUPPORTED_DTYPES:
+            raise RuntimeError(
+                f"RAG_EMBEDDING_DTYPE inválido: '{dtype}'. Use um de: {', '.join(SUPPORTED_DTYPES)}"
+            )
+        self.embeddings_path = embeddings_path
+        self.docs_path = docs_path
+        self.deleted_path = deleted_path or docs_path.with_name("deleted.log")
+        self.scales_path = embeddings_path.with_name(embeddings_path.stem + ".scales.npy")
+        self.full_path = embeddings_path.with_name(embeddings_path.stem + ".f32.npy")
+        self.dtype = np.dtype(dtype)
+        self.quantized = self.dtype == np.int8
+        # cópia float32 só faz sentido quando a matriz principal perde precisão
+        self.keep_full = keep_full and self.dtype != np.float32
+
+        self.rows = 0
+        self.dim = 0
+        self._docs_offset = 0  # bytes de knowledge.jsonl já commitados
+        self._deleted_offset = 0  # bytes de deleted.log já commitados
+
+    # ---------- Leitura ----------
+    def exists(self) -> bool:
+        return self.docs_path.exists() and self.embeddings_path.exists()
+
+    def load(
+        self,
+        rows: Optional[int] = None,
+        docs_bytes: Optional[int] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[np.ndarray]]:
+        """
+        Lê os documentos e mapeia os embeddings (somente leitura).
+        `rows`/`docs_bytes` (do manifesto) limitam a leitura ao que foi
+        publicado; sem eles, converte a base se o formato não confere.
+        """
+        if not self.exists() or rows == 0:
+            self.rows, self.dim, self._docs_offset, self._deleted_offset = 0, 0, 0, 0
+            return [], None
+
+        embeddings = np.load(self.embeddings_path, mmap_mode="r")
+        if rows is None:
+            if self.needs_conversion():
+                # outro dtype, gravado por np.save ou arquivos auxiliares faltando:
+                # converte uma única vez, mantendo as remoções pendentes
+                self.rewrite(*self.read_float32(embeddings.shape[0]), keep_deleted=True)
+                embeddings = np.load(self.embeddings_path, mmap_mode="r")
+            rows = embeddings.shape[0]
+        elif embeddings.shape[0] < rows:
+            raise RuntimeError(
+                f"{self.embeddings_path} tem {embeddings.shape[0]} linhas, o manifesto publica {rows}."
+            )
+
+        raws = self._read_docs(limit=rows, max_bytes=docs_bytes)
+        self.rows = len(raws)
+        self.dim = embeddings.shape[1]
+        return raws, self._wrap(embeddings)
+
+    def load_increment(
+        self,
+        rows: int,
+        docs_bytes: int,
+        deleted_bytes: int,
+    ) -> Tuple[List[Dict[str, Any]], Optional[Matrix], Set[int]]:
+        """
+        Só o que foi publicado depois do último load (mesmos arquivos):
+        documentos novos, matriz remapeada e linhas removidas novas.
+        """
+        raws = self.read_docs_between(self._docs_offset, docs_bytes)
+        if self.rows + len(raws) != rows:
+            raise RuntimeError(
+                f"{self.docs_path} tem {self.rows + len(raws)} documentos, o manifesto publica {rows}."
+            )
+        self.rows, self._docs_offset = rows, docs_bytes
+        if self.dim == 0 and rows:
+            self.dim = np.load(self.embeddings_path, mmap_mode="r").shape[1]
+        deleted = self.read_deleted_between(self._deleted_offset, deleted_bytes)
+        self._deleted_offset = deleted_bytes
+        return raws, self.mmap(), deleted
+
+    def read_float32(
+        self,
+        rows: int,
+        docs_bytes: Optional[int] = None,
+    ) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        """Documentos e embeddings float32 das primeiras linhas, em qualquer dtype gravado (conversões)."""
+        embeddings = np.load(self.embeddings_path, mmap_mode="r")
+        raws = self._read_docs(limit=rows, max_bytes=docs_bytes)
+        self.rows = len(raws)
+        self.dim = embeddings.shape[1]
+        return raws, self._float32_rows(embeddings, len(raws))
+
+    def needs_conversion(self) -> bool:
+        """True se os arquivos não estão no dtype/formato configurado (ou faltam auxiliares)."""
+        if not self.exists():
+            return False
+        embeddings = np.load(self.embeddings_path, mmap_mode="r")
+        rows = embeddings.shape[0]
+        return (
+            embeddings.dtype != self.dtype
+            or _data_offset(self.embeddings_path) != NPY_HEADER_SIZE
+            or (self.quantized and self._rows_in(self.scales_path) < rows)
+            or (self.keep_full and self._rows_in(self.full_path) < rows)
+        )
+
+    def committed(self) -> Dict[str, Any]:
+        """O que está gravado e consistente agora (vai para o manifesto)."""
+        return {
+            "rows": self.rows,
+            "dim": self.dim,
+            "dtype": self.dtype.name,
+            "docs_bytes": self._docs_offset,
+            "deleted_bytes": self._deleted_offset,
+        }
+
+    @staticmethod
+    def _rows_in(path: Path) -> int:
+        if not path.exists():
+            return 0
+        return np.load(path, mmap_mode="r").shape[0]
+
+    def _float32_rows(self, embeddings: np.ndarray, n: int) -> np.ndarray:
+        """Melhor versão float32 disponível das n primeiras linhas (para conversões)."""
+        if self._rows_in(self.full_path) >= n:
+            return np.asarray(np.load(self.full_path, mmap_mode="r")[:n], dtype=np.float32)
+        if embeddings.dtype == np.int8:
+            if self._rows_in(self.scales_path) < n:
+                raise RuntimeError(f"Escalas dos embeddings int8 ausentes ou incompletas: {self.scales_path}")
+            return QuantizedMatrix(embeddings, np.load(self.scales_path, mmap_mode="r"))[:n]
+        return np.asarray(embeddings[:n], dtype=np.float32)
+
+    def _wrap(self, embeddings: np.ndarray) -> Matrix:
+        """Linhas commitadas da matriz principal (int8 vem com as escalas)."""
+        embeddings = embeddings[:self.rows]
+        if self.quantized:
+            scales = np.load(self.scales_path, mmap_mode="r")[:self.rows]
+            return QuantizedMatrix(embeddings, scales)
+        return embeddings
+
+    def _read_docs(self, limit: int, max_bytes: Optional[int] = None) -> List[Dict[str, Any]]:
+        raws = self.read_docs_between(0, max_bytes, limit)
+        self._docs_offset = self._last_read_offset
+        return raws
+
+    def read_docs_between(
+        self,
+        start: int,
+        end: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Documentos gravados entre os bytes start e end de knowledge.jsonl (linhas completas)."""
+        raws: List[Dict[str, Any]] = []
+        offset = start
+        with open(self.docs_path, "rb") as f:
+            f.seek(start)
+            for line in f:
+                if (limit is not None and len(raws) >= limit) or not line.endswith(b"\n"):
+                    break  # além do commit ou linha incompleta
+                if end is not None and offset + len(line) > end:
+                    break
+                raws.append(json.loads(line))
+                offset += len(line)
+        self._last_read_offset = offset
+        return raws
+
+    def load_deleted(self, max_bytes: Optional[int] = None) -> Set[int]:
+        """Linhas removidas (tombstones) dentro das linhas commitadas."""
+        deleted = self.read_deleted_between(0, max_bytes)
+        self._deleted_offset = self._last_read_offset
+        return deleted
+
+    def read_deleted_between(self, start: int, end: Optional[int] = None) -> Set[int]:
+        """Linhas removidas registradas entre os bytes start e end de deleted.log."""
+        self._last_read_offset = start
+        if not self.deleted_path.exists():
+            return set()
+        deleted: Set[int] = set()
+        offset = start
+        with open(self.deleted_path, "rb") as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b"\n") or (end is not None and offset + len(line) > end):
+                    break
+                offset += len(line)
+                line = line.strip()
+                if line.isdigit() and int(line) < self.rows:
+                    deleted.add(int(line))
+        self._last_read_offset = offset
+        return deleted
+
+    def mmap(self) -> Optional[Matrix]:
+        if not self.embeddings_path.exists() or self.rows == 0:
+            return None
+        return self._wrap(np.load(self.embeddings_path, mmap_mode="r"))
+
+    def mmap_full(self) -> Optional[np.ndarray]:
+        """Cópia float32 para re-rank (None se keep_full estiver desligado)."""
+        if not self.keep_full or not self.full_path.exists() or self.rows == 0:
+            return None
+        return np.load(self.full_path, mmap_mode="r")[:self.rows]
+
+    def _encode(self, embeddings: np.ndarray) -> Dict[Path, np.ndarray]:
+        """Arrays a gravar por arquivo; a matriz principal vem por último (commit)."""
+        out: Dict[Path, np.ndarray] = {}
+        if self.keep_full:
+            out[self.full_path] = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if self.quantized:
+            codes, scales = quantize_int8(embeddings)
+            out[self.scales_path] = scales
+            out[self.embeddings_path] = codes
+        else:
+            out[self.embeddings_path] = np.ascontiguousarray(embeddings, dtype=self.dtype)
+        return out
+
+    # ---------- Escrita ----------
+    def append(self, raws: List[Dict[str, Any]], embeddings: np.ndarray) -> None:
+        """Acrescenta documentos + embeddings (normalizados) gravando só os dados novos."""
+        if len(raws) != embeddings.shape[0]:
+            raise ValueError("Número de documentos e de embeddings não confere.")
+        if not raws:
+            return
+        if self.rows == 0 or not self.exists():
+            self.rewrite(raws, embeddings)
+            return
+        if embeddings.shape[1] != self.dim:
+            raise ValueError(
+                f"Dimensão dos embeddings ({embeddings.shape[1]}) difere da base ({self.dim})."
+            )
+
+        with open(self.docs_path, "r+b") as f:
+            f.truncate(self._docs_offset)
+            f.seek(self._docs_offset)
+            f.write(self._encode_docs(raws))
+            _fsync(f)
+            docs_offset = f.tell()
+
+        # arquivos auxiliares primeiro; o cabeçalho de embeddings.npy é o commit
+        for path, data in self._encode(embeddings).items():
+            _append_npy(path, data, self.rows)
+
+        self.rows += embeddings.shape[0]
+        self._docs_offset = docs_offset
+
+    def delete(self, rows: List[int]) -> None:
+        """Marca linhas como removidas (append no deleted.log, após o último commit)."""
+        if not rows:
+            return
+        with open(self.deleted_path, "ab") as f:
+            # descarta o que passou do commit (ex.: queda no meio de um delete)
+            f.truncate(self._deleted_offset)
+            f.write("".join(f"{r}\n" for r in rows).encode("ascii"))
+            _fsync(f)
+            self._deleted_offset = f.tell()
+
+    def rewrite(
+        self,
+        raws: List[Dict[str, Any]],
+        embeddings: np.ndarray,
+        keep_deleted: bool = False,
+    ) -> None:
+        """Regrava a base inteira (migração, troca de dtype ou compactação)."""
+        rows, dim = embeddings.shape
+
+        files = self._encode(embeddings)
+        tmp_files = []
+        for path, data in files.items():
+            tmp = path.with_suffix(".npy.tmp")
+            _write_npy(tmp, data)
+            tmp_files.append((tmp, path))
+
+        tmp_docs = self.docs_path.with_suffix(".jsonl.tmp")
+        encoded = self._encode_docs(raws)
+        with open(tmp_docs, "wb") as f:
+            f.write(encoded)
+            _fsync(f)
+
+        os.replace(tmp_docs, self.docs_path)
+        for tmp, path in tmp_files:
+            os.replace(tmp, path)
+        # auxiliares de outro modo (ex.: escalas depois de voltar para float32)
+        for path in (self.scales_path, self.full_path):
+            if path not in files and path.exists():
+                path.unlink()
+        if not keep_deleted and self.deleted_path.exists():
+            self.deleted_path.unlink()
+        self.rows, self.dim, self._docs_offset = rows, dim, len(encoded)
+        self._deleted_offset = self.deleted_path.stat().st_size if self.deleted_path.exists() else 0
+
+    @staticmethod
+    def _encode_docs(raws: List[Dict[str, Any]]) -> bytes:
+        return b"".join(
+            json.dumps(r, ensure_ascii=False).encode("utf-8") + b"\n" for r in raws
+        )
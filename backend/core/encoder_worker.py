@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EncodeFn = Callable[[List[str]], np.ndarray]
+
+
+class BatchedEncoder:
+    """
+    Executa encodes de perguntas fora do event loop, em micro-lotes.
+
+    Requisições concorrentes entram numa fila; um coletor junta até
+    `max_batch` textos (esperando no máximo `max_wait_ms` após o primeiro)
+    e faz um único encode num pool de threads. Enquanto todas as threads
+    estão ocupadas a fila continua crescendo, então o próximo lote sai cheio.
+    """
+
+    def __init__(
+        self,
+        encode_fn: EncodeFn,
+        max_batch: int = 32,
+        max_wait_ms: float = 5.0,
+        workers: int = 1,
+    ) -> None:
+        self.encode_fn = encode_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.workers = max(1, workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="encoder")
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional["asyncio.Queue[Tuple[str, asyncio.Future]]"] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._collector: Optional[asyncio.Task] = None
+        # get() da fila que ficou pendente no fim da espera de um lote
+        self._getter: Optional[asyncio.Task] = None
+
+        self.batches = 0
+        self.encoded = 0
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._collector is not None and not self._collector.done():
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._getter = None
+        self._collector = loop.create_task(self._collect())
+
+    async def encode(self, text: str) -> np.ndarray:
+        """Embedding de um único texto (linha da matriz retornada por encode_fn)."""
+        self._ensure_started()
+        fut = self._loop.create_future()
+        await self._queue.put((text, fut))
+        return await fut
+
+    async def _get(self, timeout: Optional[float] = None) -> Optional[Tuple[str, asyncio.Future]]:
+        """
+        Próximo pedido da fila, ou None se nenhum chegar em `timeout`. O get()
+        pendente não é cancelado no timeout (como faria o wait_for, que pode
+        descartar um pedido já retirado da fila): fica para o próximo lote.
+        """
+        if self._getter is None:
+            if not self._queue.empty():
+                return self._queue.get_nowait()
+            self._getter = self._loop.create_task(self._queue.get())
+        done, _ = await asyncio.wait({self._getter}, timeout=timeout)
+        if not done:
+            return None
+        getter, self._getter = self._getter, None
+        return getter.result()
+
+    async def _collect(self) -> None:
+        while True:
+            await self._slots.acquire()
+            batch = [await self._get()]
+
+            # drena o que já está na fila e espera um pouco pelo resto do lote
+            deadline = self._loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                item = await self._get(max(0.0, deadline - self._loop.time()))
+                if item is None:
+                    break
+                batch.append(item)
+
+            self._loop.create_task(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        texts = [text for text, _ in batch]
+        try:
+            embs = await self._loop.run_in_executor(self._executor, self.encode_fn, texts)
+        except Exception as e:
+            logger.error(f"Erro no encode em lote ({len(texts)} textos): {e}")
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+        else:
+            self.batches += 1
+            self.encoded += len(texts)
+            for i, (_, fut) in enumerate(batch):
+                if not fut.done():
+                    fut.set_result(embs[i])
+        finally:
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "encoded": self.encoded,
+            "avg_batch": round(self.encoded / self.batches, 2) if self.batches else 0.0,
+        }
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import importlib.util
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Tuple
+
+# (número do slide/página/seção, texto já formatado "Slide N: ...")
+SlideText = Tuple[int, str]
+
+# extensão -> função que lê o arquivo do disco e gera os trechos um a um.
+# Módulo leve de propósito: roda em processos do pool de ingestão (spawn),
+# que não devem importar o modelo de embeddings. Por isso os formatos são
+# registrados aqui, no import do módulo, e cada biblioteca de leitura só é
+# importada quando um arquivo daquele formato aparece.
+Extractor = Callable[[Path], Iterator[SlideText]]
+EXTRACTORS: Dict[str, Extractor] = {}
+# pacote necessário por extensão (para recusar o upload antes de aceitar o arquivo)
+_REQUIRES: Dict[str, str] = {}
+# assinatura dos primeiros bytes por extensão
+_MAGIC: Dict[str, bytes] = {}
+
+
+def register_extractor(ext: str, requires: str, magic: bytes = b"") -> Callable[[Extractor], Extractor]:
+    def decorator(fn: Extractor) -> Extractor:
+        EXTRACTORS[ext] = fn
+        _REQUIRES[ext] = requires
+        _MAGIC[ext] = magic
+        return fn
+    return decorator
+
+
+def extension(filename: str) -> str:
+    return Path(filename).suffix.lower()
+
+
+def supported_extensions() -> List[str]:
+    """Extensões com extrator registrado e biblioteca instalada."""
+    return [ext for ext in EXTRACTORS if importlib.util.find_spec(_REQUIRES[ext]) is not None]
+
+
+def check_header(ext: str, head: bytes) -> bool:
+    """Confere os primeiros bytes do arquivo (zip para Office, %PDF para PDF)."""
+    return head.startswith(_MAGIC.get(ext, b""))
+
+
+def _clean(text: str) -> str:
+    return " ".join(text.split())
+
+
+# ---------- PPTX ----------
+def _shape_texts(shapes) -> Iterator[str]:
+    from pptx.shapes.group import GroupShape
+
+    # isinstance, não shape_type: shape_type levanta NotImplementedError em
+    # autoformas sem geometria (nem predefinida nem custom)
+    for shp in shapes:
+        if isinstance(shp, GroupShape):
+            yield from _shape_texts(shp.shapes)
+        elif getattr(shp, "has_table", False) and shp.has_table:
+            # uma linha da tabela por vez, células separadas por " | "
+            for row in shp.table.rows:
+                cells = [_clean(cell.text) for cell in row.cells]
+                if any(cells):
+                    yield " | ".join(cells)
+        elif getattr(shp, "has_text_frame", False) and shp.has_text_frame and shp.text_frame.text:
+            yield shp.text_frame.text
+
+
+@register_extractor(".pptx", requires="pptx", magic=b"PK\x03\x04")
+def iter_pptx_slides(path: Path) -> Iterator[SlideText]:
+    """Texto de cada slide (caixas de texto, tabelas, grupos) e as notas do apresentador."""
+    from pptx import Presentation
+
+    prs = Presentation(str(path))
+    for idx, slide in enumerate(prs.slides, start=1):
+        texts = list(_shape_texts(slide.shapes))
+        if slide.has_notes_slide:
+            notes = slide.notes_slide.notes_text_frame
+            if notes is not None and notes.text.strip():
+                texts.append(f"Notas: {notes.text}")
+        if texts:
+            joined = " ".join(texts).strip()
+            yield idx, f"Slide {idx}: {joined}"
+
+
+# ---------- PDF ----------
+@register_extractor(".pdf", requires="pypdf", magic=b"%PDF")
+def iter_pdf_pages(path: Path) -> Iterator[SlideText]:
+    """Texto de cada página (PDFs escaneados, sem camada de texto, não geram trechos)."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(str(path))
+    for idx, page in enumerate(reader.pages, start=1):
+        text = _clean(page.extract_text() or "")
+        if text:
+            yield idx, f"Página {idx}: {text}"
+
+
+# ---------- DOCX ----------
+# seções do DOCX: quebra nos títulos e quando o texto acumulado passa disto
+DOCX_SECTION_CHARS = 1200
+
+
+@register_extractor(".docx", requires="docx", magic=b"PK\x03\x04")
+def iter_docx_sections(path: Path) -> Iterator[SlideText]:
+    """
+    DOCX não tem páginas: o texto (parágrafos e tabelas, na ordem do
+    documento) é dividido em seções nos títulos ou a cada ~DOCX_SECTION_CHARS.
+    """
+    from docx import Document
+    from docx.table import Table
+
+    doc = Document(str(path))
+    idx = 0
+    parts: List[str] = []
+    size = 0
+
+    def flush() -> Iterator[SlideText]:
+        nonlocal idx, parts, size
+        if parts:
+            idx += 1
+            yield idx, f"Seção {idx}: " + " ".join(parts)
+        parts, size = [], 0
+
+    for block in doc.iter_inner_content():
+        if isinstance(block, Table):
+            lines = [" | ".join(_clean(c.text) for c in row.cells) for row in block.rows]
+            text = " ".join(line for line in lines if line.strip(" |"))
+            heading = False
+        else:
+            text = _clean(block.text)
+            heading = block.style is not None and block.style.name.lower().startswith(("heading", "título", "title"))
+        if not text:
+            continue
+        if heading or size + len(text) > DOCX_SECTION_CHARS:
+            yield from flush()
+        parts.append(text)
+        size += len(text)
+    yield from flush()
+
+
+def extract_file(path: str, filename: str) -> List[SlideText]:
+    """
+    Trechos de um arquivo salvo em disco, pelo extrator da extensão.
+    Chamada nos processos do pool: só os textos voltam para o processo
+    principal; o arquivo e a árvore de objetos ficam no processo filho.
+    """
+    ext = extension(filename)
+    extractor = EXTRACTORS.get(ext)
+    if extractor is None:
+        raise ValueError(f"Formato não suportado: {ext or filename}")
+    return list(extractor(Path(path)))
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import math
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from core.config import RAG_BM25_K1, RAG_BM25_B
+from core.scoring import _top_k_indices
+
+
+# ---------- Tokenização ----------
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# palavras muito frequentes nos decks que não ajudam a ranquear
+STOPWORDS = frozenset(
+    """
+    a ao aos as com como da das de do dos e em entre era esse essa esta este eu
+    foi ha isso isto ja la mais mas me mesmo muito na nas nao no nos o os ou para
+    pela pelas pelo pelos por qual quando que se sem ser seu sua sao so tambem te
+    tem um uma umas uns voce
+    the and of to in for is on with
+    """.split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Minúsculas, sem acentos ("métricas" == "metricas"), sem stopwords."""
+    text = text.lower()
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    return [t for t in _TOKEN_RE.findall(text) if t not in STOPWORDS]
+
+
+# ---------- BM25 ----------
+class BM25Index:
+    """
+    Índice invertido BM25 sobre o texto dos chunks, em arrays NumPy.
+
+    Postings guardados como três arrays paralelos (termo, linha, tf)
+    ordenados por termo e linha, mais os offsets de cada termo (CSR).
+    Um add ordena só os postings novos e intercala com os existentes.
+    Linhas removidas (delete) saem do idf (frequência por termo) e do
+    tamanho médio dos documentos; os postings delas ficam até a compactação,
+    que reconstrói o índice. Não é persistido: é reconstruído no load.
+    """
+
+    def __init__(self, k1: float = RAG_BM25_K1, b: float = RAG_BM25_B) -> None:
+        self.k1 = k1
+        self.b = b
+        self.vocab: Dict[str, int] = {}
+        self.doc_len = np.empty(0, dtype=np.int32)
+        self._terms = np.empty(0, dtype=np.int32)
+        self._rows = np.empty(0, dtype=np.int32)
+        self._tf = np.empty(0, dtype=np.float32)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        # estatísticas só das linhas vivas
+        self._alive = np.empty(0, dtype=bool)
+        self._df = np.empty(0, dtype=np.int32)
+        self._alive_count = 0
+        self._alive_len = 0
+
+    @property
+    def rows(self) -> int:
+        return self.doc_len.shape[0]
+
+    def _refresh_stats(self) -> None:
+        live = self._alive[self._rows]
+        self._df = np.bincount(self._terms[live], minlength=len(self.vocab)).astype(np.int32)
+        self._alive_count = int(self._alive.sum())
+        self._alive_len = int(self.doc_len[self._alive].sum())
+
+    def delete(self, rows: Iterable[int]) -> None:
+        """Tira as linhas das estatísticas do BM25 (e das buscas)."""
+        rows = np.fromiter(rows, dtype=np.int64)
+        rows = rows[rows < self.rows]
+        if rows.size == 0:
+            return
+        alive = self._alive.copy()
+        alive[rows] = False
+        self._alive = alive
+        self._refresh_stats()
+
+    def add(self, texts: Iterable[str], start: int) -> None:
+        """Indexa os textos como linhas start, start + 1, ... (substitui o que houver a partir de start)."""
+        vocab = dict(self.vocab)
+        ids: List[int] = []
+        lens: List[int] = []
+        for text in texts:
+            tokens = tokenize(text)
+            lens.append(len(tokens))
+            ids.extend([vocab.setdefault(t, len(vocab)) for t in tokens])
+
+        # (termo, linha) -> tf com um único np.unique; o resultado já sai
+        # ordenado por termo e linha, como os postings existentes
+        end = start + len(lens)
+        token_rows = np.repeat(np.arange(start, end, dtype=np.int64), lens)
+        pairs, tf = np.unique(np.asarray(ids, dtype=np.int64) * end + token_rows, return_counts=True)
+        new_terms = (pairs // end).astype(np.int32)
+        new_rows = (pairs % end).astype(np.int32)
+        keep = self._rows < start
+
+        # duas sequências já ordenadas: o sort estável (timsort) só as intercala
+        all_terms = np.concatenate([self._terms[keep], new_terms])
+        order = np.argsort(all_terms, kind="stable")
+        self._terms = all_terms[order]
+        self._rows = np.concatenate([self._rows[keep], new_rows])[order]
+        self._tf = np.concatenate([self._tf[keep], tf.astype(np.float32)])[order]
+        counts = np.bincount(self._terms, minlength=len(vocab))
+        self._offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        self.vocab = vocab
+        self.doc_len = np.concatenate([self.doc_len[:start], np.asarray(lens, dtype=np.int32)])
+        self._alive = np.concatenate([self._alive[:start], np.ones(len(lens), dtype=bool)])
+        self._refresh_stats()
+
+    def scores(self, query: str) -> Optional[np.ndarray]:
+        """Score BM25 de cada linha (None se nenhum termo da pergunta está no índice)."""
+        term_ids = sorted({self.vocab[t] for t in tokenize(query) if t in self.vocab})
+        if not term_ids or self._alive_count == 0:
+            return None
+
+        post_rows, post_tf, offsets, df = self._rows, self._tf, self._offsets, self._df
+        n = self._alive_count
+        avgdl = self._alive_len / n or 1.0
+        scores = np.zeros(self.rows, dtype=np.float32)
+        for t in term_ids:
+            r = post_rows[offsets[t]:offsets[t + 1]]
+            tf = post_tf[offsets[t]:offsets[t + 1]]
+            idf = math.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_len[r] / avgdl)
+            scores[r] += idf * tf * (self.k1 + 1) / (tf + norm)
+        scores[~self._alive] = 0
+        return scores
+
+    def search(self, query: str, top_k: int, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Linhas com score > 0, em ordem decrescente, restritas a `rows` se informado."""
+        scores = self.scores(query)
+        if scores is None:
+            return np.empty(0, dtype=np.int64)
+        hits = np.flatnonzero(scores > 0) if rows is None else rows[scores[rows] > 0]
+        return hits[_top_k_indices(scores[hits], top_k)]
+
+
+# ---------- Fusão ----------
+def reciprocal_rank_fusion(rankings: List[np.ndarray], k: int = 60) -> np.ndarray:
+    """
+    Reciprocal Rank Fusion: score(linha) = soma de 1 / (k + posição) nas listas.
+    Empates ficam com a menor linha, como no _top_k_indices.
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for pos, row in enumerate(ranking.tolist(), start=1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + pos)
+    if not fused:
+        return np.empty(0, dtype=np.int64)
+    rows = np.fromiter(fused.keys(), dtype=np.int64, count=len(fused))
+    scores = np.fromiter(fused.values(), dtype=np.float64, count=len(fused))
+    return rows[np.lexsort((rows, -scores))]
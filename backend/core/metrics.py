@@ -0,0 +1,301 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from core.config import METRICS_WINDOW, METRICS_DEBUG_HEADER, METRICS_SLOW_MS
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.95, 0.99)
+PREFIX = "tr4ction_"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+# ---------- Formato texto do Prometheus ----------
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in items) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value == value else "NaN"
+
+
+# ---------- Tipos de métrica ----------
+class _Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = PREFIX + name
+        self.help = help_text
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    @abstractmethod
+    def render(self) -> List[str]:
+        ...
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str) -> None:
+        super().__init__(name, help_text)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, value: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(k)} {_number(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, value: float = 1.0, **labels: str) -> None:
+        self.inc(-value, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    @contextmanager
+    def track(self, **labels: str) -> Iterator[None]:
+        """Incrementa enquanto o bloco roda (ex.: requisições em andamento)."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Summary(_Metric):
+    """
+    Quantis (p50/p95/p99) sobre as últimas METRICS_WINDOW observações de
+    cada série, mais _sum e _count acumulados desde o início do processo.
+    """
+
+    kind = "summary"
+
+    def __init__(self, name: str, help_text: str, window: int = METRICS_WINDOW) -> None:
+        super().__init__(name, help_text)
+        self.window = window
+        self._series: Dict[Labels, Tuple[deque, List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = (deque(maxlen=self.window), [0.0, 0])
+            series[0].append(value)
+            series[1][0] += value
+            series[1][1] += 1
+
+    def quantiles(self, **labels: str) -> Dict[float, float]:
+        with self._lock:
+            series = self._series.get(tuple(sorted(labels.items())))
+            samples = sorted(series[0]) if series else []
+        return {q: _quantile(samples, q) for q in QUANTILES}
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, sorted(s[0]), s[1][0], s[1][1]) for k, s in sorted(self._series.items())]
+        lines = self.header()
+        for key, samples, total, count in items:
+            for q in QUANTILES:
+                lines.append(f"{self.name}{_labels(key, ('quantile', str(q)))} {_number(_quantile(samples, q))}")
+            lines.append(f"{self.name}_sum{_labels(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(key)} {count}")
+        return lines
+
+
+def _quantile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# ---------- Registro ----------
+class MetricsRegistry:
+    """
+    Métricas do processo. Com vários workers (gunicorn) cada um tem as
+    suas: o scrape de /metrics mostra o worker que atendeu (label pid).
+    Coletores são chamados no scrape, para valores que já existem em
+    outro lugar (ex.: contadores dos caches).
+    """
+
+    def __init__(self) -> None:
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], List[_Metric]]] = []
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._add(Counter(name, help_text))
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._add(Gauge(name, help_text))
+
+    def summary(self, name: str, help_text: str) -> Summary:
+        return self._add(Summary(name, help_text))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], List[_Metric]]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {PREFIX}worker_info Worker que atendeu o scrape",
+            f"# TYPE {PREFIX}worker_info gauge",
+            f'{PREFIX}worker_info{{pid="{os.getpid()}"}} 1',
+        ]
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                for metric in collector():
+                    lines.extend(metric.render())
+            except Exception as e:
+                logger.error(f"Erro ao coletar métricas: {e}")
+        return "\n".join(lines) + "\n"
+
+
+# Instância global
+metrics = MetricsRegistry()
+
+http_requests = metrics.summary("http_request_duration_seconds", "Duração das requisições HTTP por rota")
+http_in_flight = metrics.gauge("http_requests_in_flight", "Requisições HTTP em andamento por rota")
+stage_seconds = metrics.summary("stage_duration_seconds", "Duração de cada etapa (encode, busca, prompt, LLM, ingestão)")
+llm_in_flight = metrics.gauge("openai_requests_in_flight", "Chamadas à OpenAI em andamento por modelo")
+
+
+# ---------- Spans por requisição ----------
+# Lista (etapa, segundos) da requisição atual; copiada para asyncio.to_thread
+# junto com o contexto, então spans dentro de threads também entram
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+def record(stage: str, seconds: float) -> None:
+    """Registra a duração de uma etapa no histograma global e na requisição atual."""
+    stage_seconds.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Mede o bloco como uma etapa (funciona em código sync e async)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+def detach_request() -> None:
+    """Desliga as etapas seguintes da requisição atual (ex.: tarefas em segundo plano)."""
+    _request_timings.set(None)
+
+
+def _breakdown(timings: List[Tuple[str, float]]) -> Dict[str, float]:
+    """Soma as etapas repetidas (ex.: retries), em ms, na ordem em que apareceram."""
+    out: Dict[str, float] = {}
+    for stage, seconds in timings:
+        out[stage] = out.get(stage, 0.0) + seconds * 1000
+    return out
+
+
+def _server_timing(breakdown: Dict[str, float], total_ms: float) -> str:
+    parts = [f"{stage};dur={ms:.1f}" for stage, ms in breakdown.items()]
+    parts.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(parts)
+
+
+# ---------- Middleware ASGI ----------
+class MetricsMiddleware:
+    """
+    Mede cada requisição HTTP por rota (template, ex.: /admin/jobs/{job_id})
+    e mantém o gauge de requisições em andamento. O tempo vai até o último
+    byte da resposta, então inclui o stream inteiro no /ask/stream.
+
+    Com o header `X-Debug-Timing: 1` a resposta traz `Server-Timing` com as
+    etapas medidas até o início da resposta (em streams, só as anteriores
+    ao primeiro byte). Requisições acima de METRICS_SLOW_MS são logadas
+    com o detalhamento por etapa.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    def _route(self, scope) -> str:
+        from starlette.routing import Match
+
+        for route in scope["app"].routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", "other")
+        return "other"
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = self._route(scope)
+        method = scope["method"]
+        debug = METRICS_DEBUG_HEADER and any(
+            k == b"x-debug-timing" and v not in (b"", b"0") for k, v in scope.get("headers", [])
+        )
+        timings: List[Tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if debug:
+                    total_ms = (time.perf_counter() - started) * 1000
+                    header = _server_timing(_breakdown(timings), total_ms)
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header.encode())]}
+            await send(message)
+
+        try:
+            with http_in_flight.track(route=route):
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_timings.reset(token)
+            elapsed = time.perf_counter() - started
+            http_requests.observe(elapsed, route=route, method=method, status=str(status))
+            if METRICS_SLOW_MS and elapsed * 1000 >= METRICS_SLOW_MS:
+                logger.warning(
+                    f"Requisição lenta {method} {route} ({status}) em {elapsed * 1000:.0f}ms: "
+                    f"{json.dumps({k: round(v, 1) for k, v in _breakdown(timings).items()})}"
+                )
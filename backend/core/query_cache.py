@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(text: str) -> str:
+    """Normaliza a pergunta para a chave do cache (NFC, minúsculas, espaços colapsados)."""
+    return " ".join(unicodedata.normalize("NFC", text).lower().split())
+
+
+class QueryEmbeddingCache:
+    """
+    Cache LRU + TTL de embeddings de perguntas.
+    A chave é o texto normalizado + `namespace` (modelo e runtime de
+    embedding; uma função é chamada a cada chave, porque o runtime
+    efetivo só é conhecido depois do load do modelo).
+
+    Camada 1: memória do processo (OrderedDict, LRU limitado a max_entries).
+    Camada 2 (opcional): SQLite local, compartilhado entre os workers
+    da mesma máquina; acertos no disco sobem para a memória. A conexão é
+    aberta no primeiro uso em cada processo (workers criados por fork
+    não herdam a conexão do master).
+    """
+
+    def __init__(
+        self,
+        namespace: Union[str, Callable[[], str]],
+        max_entries: int = 2048,
+        ttl_seconds: float = 86400,
+        db_path: Optional[Path] = None,
+        max_disk_entries: int = 50000,
+    ) -> None:
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+
+        self._mem: "OrderedDict[str, Tuple[float, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()  # só a camada em memória
+        self._db_lock = threading.Lock()  # conexão SQLite (I/O fora do _lock)
+        self._db_path = db_path if max_entries > 0 else None
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_pid: Optional[int] = None
+        self._puts_since_trim = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # ---------- SQLite ----------
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        """Conexão deste processo (aberta no primeiro uso; None se desativado/indisponível)."""
+        if self._db_path is None:
+            return None
+        if self._db_pid != os.getpid():
+            self._db_pid = os.getpid()
+            self._db = None
+            self._open_db(self._db_path)
+        return self._db
+
+    def _open_db(self, db_path: Path) -> None:
+        try:
+            db = sqlite3.connect(str(db_path), timeout=1.0, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                " key TEXT PRIMARY KEY, created REAL NOT NULL,"
+                " dtype TEXT NOT NULL, emb BLOB NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS idx_qe_created ON query_embeddings(created)")
+            db.commit()
+            self._db = db
+        except sqlite3.Error as e:
+            # cache em disco é opcional: segue só com a memória
+            logger.warning(f"Cache de queries em disco indisponível ({db_path}): {e}")
+
+    def _disk_get(self, key: str, now: float) -> Optional[np.ndarray]:
+        try:
+            row = self._db.execute(
+                "SELECT created, dtype, emb FROM query_embeddings WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Erro lendo cache de queries em disco: {e}")
+            return None
+        if row is None or now - row[0] > self.ttl_seconds:
+            return None
+        return np.frombuffer(row[2], dtype=row[1]).copy()
+
+    def _disk_put(self, key: str, emb: np.ndarray, now: float) -> None:
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO query_embeddings (key, created, dtype, emb) VALUES (?, ?, ?, ?)",
+                (key, now, emb.dtype.str, emb.tobytes()),
+            )
+            self._puts_since_trim += 1
+            if self._puts_since_trim >= 256:
+                self._disk_trim(now)
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Erro gravando cache de queries em disco: {e}")
+
+    def _disk_trim(self, now: float) -> None:
+        self._puts_since_trim = 0
+        self._db.execute("DELETE FROM query_embeddings WHERE created < ?", (now - self.ttl_seconds,))
+        self._db.execute(
+            "DELETE FROM query_embeddings WHERE key IN ("
+            " SELECT key FROM query_embeddings ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,),
+        )
+
+    # ---------- API ----------
+    def _key(self, query: str) -> str:
+        namespace = self.namespace() if callable(self.namespace) else self.namespace
+        raw = f"{namespace}\0{normalize_query(query)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    @property
+    def disk(self) -> bool:
+        return self._db_path is not None
+
+    def get(self, query: str, memory_only: bool = False) -> Optional[np.ndarray]:
+        """
+        Embedding em cache ou None. Com `memory_only`, só a camada em memória
+        (não faz I/O, pode rodar no event loop); se o disco está ligado, o
+        miss não é contado, porque quem chama ainda vai consultar o disco.
+        """
+        if self.max_entries <= 0:
+            return None
+
+        key = self._key(query)
+        now = time.time()
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl_seconds:
+                    self._mem.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._mem[key]
+            if memory_only and self.disk:
+                return None
+
+        emb = None
+        if self.disk:
+            # SQLite fora do lock da memória: leituras de outras threads não esperam o disco
+            with self._db_lock:
+                if self._conn() is not None:
+                    emb = self._disk_get(key, now)
+
+        with self._lock:
+            if emb is None:
+                self.misses += 1
+                return None
+            self._remember(key, emb, now)
+            self.hits += 1
+            self.disk_hits += 1
+            return emb
+
+    def put(self, query: str, emb: np.ndarray, memory_only: bool = False) -> None:
+        """Guarda o embedding; com `memory_only`, o disco fica para put_disk (fora do event loop)."""
+        if self.max_entries <= 0:
+            return
+
+        key = self._key(query)
+        emb = np.asarray(emb, dtype=np.float32)
+        with self._lock:
+            self._remember(key, emb, time.time())
+        if not memory_only:
+            self.put_disk(query, emb)
+
+    def put_disk(self, query: str, emb: np.ndarray) -> None:
+        if self.max_entries <= 0 or not self.disk:
+            return
+        with self._db_lock:
+            if self._conn() is not None:
+                self._disk_put(self._key(query), np.asarray(emb, dtype=np.float32), time.time())
+
+    def _remember(self, key: str, emb: np.ndarray, now: float) -> None:
+        self._mem[key] = (now, emb)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.max_entries > 0,
+            "disk": self._db_path is not None,
+            "size": len(self._mem),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
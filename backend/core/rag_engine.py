@@ -1,20 +1,59 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from functools import cached_property
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable, Tuple, FrozenSet
 
+import asyncio
+import copy
 import json
+import logging
+import os
+import threading
+import time
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 
 from core.config import (
     KNOWLEDGE_PATH,
+    LEGACY_KNOWLEDGE_PATH,
     EMBEDDINGS_PATH,
     METADATA_PATH,
-    RAG_EMBEDDING_MODEL,
+    INDEX_PATH,
+    MANIFEST_PATH,
+    SNAPSHOTS_DIR,
+    WRITE_LOCK_PATH,
+    QUERY_CACHE_PATH,
+    RAG_EMBEDDING_DTYPE,
+    RAG_EXACT_RERANK,
+    RAG_HYBRID,
+    RAG_RRF_K,
+    RAG_LEXICAL_PREFILTER,
+    RAG_MAX_CHUNKS_PER_PARENT,
+    RAG_QUERY_CACHE_SIZE,
+    RAG_QUERY_CACHE_TTL,
+    RAG_QUERY_CACHE_DISK,
+    RAG_ENCODER_MAX_BATCH,
+    RAG_ENCODER_MAX_WAIT_MS,
+    RAG_ENCODER_THREADS,
+    RAG_COMPACT_RATIO,
+    RAG_RELOAD_INTERVAL,
 )
+from core.embedder import Embedder, make_embedder
+from core.embedding_store import EmbeddingStore
+from core.query_cache import QueryEmbeddingCache
+from core.reranker import CrossEncoderReranker
+from core.encoder_worker import BatchedEncoder
+from core.lexical import BM25Index, reciprocal_rank_fusion
+from core.metrics import span
+from core.scoring import Matrix, _normalize_rows, _top_k_indices, _dot, rerank_exact
+from core.snapshots import Manifest, SnapshotStore
+from core.vector_index import VectorIndex, make_index
+
+logger = logging.getLogger(__name__)
+
+# Quantos candidatos buscar por resultado final antes de deduplicar por deck
+CANDIDATES_PER_RESULT = 4
 
 
 @dataclass
@@ -23,100 +62,887 @@ class KnowledgeDoc:
     step: str
     title: str
     text: str
+    # chunks de slides: deck de origem e intervalo de slides (1-based, inclusivo).
+    # Documentos antigos (deck inteiro) ficam com os valores padrão.
+    parent_id: str = ""
+    slide_start: int = 0
+    slide_end: int = 0
+    # hashes do texto do chunk e do deck inteiro (reuso de vetores / re-upload)
+    content_hash: str = ""
+    parent_hash: str = ""
+
+    @property
+    def parent(self) -> str:
+        return self.parent_id or self.id
+
+    def overlaps(self, other: "KnowledgeDoc") -> bool:
+        """True se os dois trechos vêm do mesmo deck e compartilham slides."""
+        if self.parent != other.parent:
+            return False
+        if not (self.slide_start and other.slide_start):
+            return True
+        return self.slide_start <= other.slide_end and other.slide_start <= self.slide_end
+
+
+def _step_rows_for(
+    docs: List[KnowledgeDoc],
+    start: int = 0,
+    base: Optional[Dict[str, np.ndarray]] = None,
+    deleted: FrozenSet[int] = frozenset(),
+) -> Dict[str, np.ndarray]:
+    """
+    Índice step -> linhas (ordenadas), acrescentando [start, start + len(docs)) a `base`.
+    Linhas em `deleted` ficam de fora.
+    """
+    new_rows: Dict[str, List[int]] = {}
+    for offset, doc in enumerate(docs):
+        if start + offset not in deleted:
+            new_rows.setdefault(doc.step, []).append(start + offset)
+
+    step_rows = dict(base or {})
+    for step, rows in new_rows.items():
+        arr = np.asarray(rows, dtype=np.int64)
+        if step in step_rows:
+            arr = np.concatenate([step_rows[step], arr])
+        step_rows[step] = arr
+    return step_rows
+
+
+@dataclass(frozen=True)
+class _KnowledgeView:
+    """
+    Estado lido pelas buscas. Nunca é alterado: cada commit monta um novo
+    e troca a referência de uma vez, então leitores não precisam de lock.
+    """
+    docs: List[KnowledgeDoc]
+    # embeddings já L2-normalizados: cosseno vira um produto escalar.
+    # Mapeados do disco (somente leitura), compartilhados entre workers;
+    # float32, float16 ou int8 com escala por linha (RAG_EMBEDDING_DTYPE).
+    embeddings: Optional[Matrix]
+    # step -> índices (ordenados) das linhas daquele step
+    step_rows: Dict[str, np.ndarray]
+    # índice vetorial (exato ou IVF), escolhido por RAG_INDEX_BACKEND
+    index: VectorIndex
+    # linhas removidas (versões antigas de decks re-enviados) até a próxima compactação
+    deleted: FrozenSet[int] = frozenset()
+    # linhas válidas, só preenchido quando há removidas (None = todas)
+    alive_rows: Optional[np.ndarray] = None
+    # cópia float32 para o re-rank exato dos candidatos (float16/int8 + RAG_EXACT_RERANK)
+    full: Optional[np.ndarray] = None
+    # índice BM25 do texto (None com RAG_HYBRID desligado)
+    lexical: Optional[BM25Index] = None
+    # incrementada a cada publicação (caches derivados da base usam para invalidar)
+    version: int = 0
+    # versão do disco (manifesto) de onde este estado foi lido
+    snapshot: Optional[Manifest] = None
+
+    def alive(self) -> Iterable[Tuple[int, KnowledgeDoc]]:
+        for i, doc in enumerate(self.docs):
+            if i not in self.deleted:
+                yield i, doc
+
+    # mapas do dedup da ingestão: montados uma vez por view, na primeira consulta
+    @cached_property
+    def parent_hashes(self) -> Dict[Tuple[str, str], str]:
+        return {(d.step, d.parent): d.parent_hash for _, d in self.alive()}
+
+    @cached_property
+    def row_of_hash(self) -> Dict[str, int]:
+        rows: Dict[str, int] = {}
+        for i, d in self.alive():
+            rows.setdefault(d.content_hash, i)
+        return rows
+
+
+def _build_lexical(docs: List[KnowledgeDoc], deleted: Iterable[int] = ()) -> Optional[BM25Index]:
+    if not RAG_HYBRID:
+        return None
+    lexical = BM25Index()
+    lexical.add([d.text for d in docs], 0)
+    lexical.delete(deleted)
+    return lexical
+
+
+def _alive_rows(n: int, deleted: FrozenSet[int]) -> Optional[np.ndarray]:
+    if not deleted:
+        return None
+    mask = np.ones(n, dtype=bool)
+    mask[list(deleted)] = False
+    return np.flatnonzero(mask)
 
 
 class RAGEngine:
     """
     Engine simples de RAG em memória.
     Carrega documentos + embeddings e permite buscar contexto por pergunta.
+
+    Construir a engine é barato (não importa torch nem lê a base): o modelo
+    e os dados só são carregados em load(), chamado no startup da API em
+    segundo plano, ou antes do fork dos workers com RAG_PRELOAD.
     """
 
-    def __init__(self) -> None:
-        self.model = SentenceTransformer(RAG_EMBEDDING_MODEL)
-        self.docs: List[KnowledgeDoc] = []
-        self.embeddings: Optional[np.ndarray] = None
+    def __init__(
+        self,
+        embedder: Optional[Embedder] = None,
+        reranker: Optional[CrossEncoderReranker] = None,
+        data_dir: Optional[Path] = None,
+        query_cache: Optional[QueryEmbeddingCache] = None,
+        encoder: Optional[BatchedEncoder] = None,
+    ) -> None:
+        self.embedder = embedder or make_embedder()
+        # segunda etapa opcional da busca (RAG_RERANK)
+        self.reranker = reranker or CrossEncoderReranker()
+        # base versionada em DATA_DIR (ou em `data_dir`, para as bases das
+        # startups em core/shards.py), compartilhada entre workers
+        if data_dir is None:
+            self.snapshots = SnapshotStore(MANIFEST_PATH, SNAPSHOTS_DIR, WRITE_LOCK_PATH)
+            self.metadata_path = METADATA_PATH
+        else:
+            data_dir.mkdir(parents=True, exist_ok=True)
+            self.snapshots = SnapshotStore(data_dir / "manifest.json", data_dir / "snapshots", data_dir / ".write.lock")
+            self.metadata_path = data_dir / "metadata.json"
+        # só a base global migra os arquivos do formato anterior
+        self._migrate_legacy = data_dir is None
+        self.store: Optional[EmbeddingStore] = None  # arquivos da geração carregada
+        self._view = _KnowledgeView([], None, {}, make_index())
+        # serializa escritas (uploads, reload) no processo; entre processos,
+        # snapshots.write_lock(). Buscas não usam lock
+        self._write_lock = threading.Lock()
+        self._watcher_pid: Optional[int] = None
+        # embeddings de perguntas repetidas (evita o forward pass do modelo)
+        self.query_cache = query_cache or QueryEmbeddingCache(
+            lambda: self.embedder.cache_namespace,
+            max_entries=RAG_QUERY_CACHE_SIZE,
+            ttl_seconds=RAG_QUERY_CACHE_TTL,
+            db_path=QUERY_CACHE_PATH if RAG_QUERY_CACHE_DISK else None,
+        )
+        # encodes de perguntas do caminho async: micro-lotes fora do event loop
+        self.encoder = encoder or BatchedEncoder(
+            self._encode_normalized,
+            max_batch=RAG_ENCODER_MAX_BATCH,
+            max_wait_ms=RAG_ENCODER_MAX_WAIT_MS,
+            workers=RAG_ENCODER_THREADS,
+        )
 
-        self._load_from_disk()
+        self._load_lock = threading.Lock()
+        self._ready = False
+        self.load_seconds: Optional[float] = None
+        self.load_error: Optional[str] = None  # última falha do load (mostrada no /ready)
 
-    # ---------- Persistência ----------
-    def _load_from_disk(self) -> None:
-        if KNOWLEDGE_PATH.exists():
-            with open(KNOWLEDGE_PATH, "r", encoding="utf-8") as f:
-                raw = json.load(f)
-            self.docs = [KnowledgeDoc(**d) for d in raw]
-
-        if EMBEDDINGS_PATH.exists():
-            self.embeddings = np.load(EMBEDDINGS_PATH)
-
-    def _save_to_disk(self) -> None:
-        with open(KNOWLEDGE_PATH, "w", encoding="utf-8") as f:
-            json.dump([d.__dict__ for d in self.docs], f, ensure_ascii=False, indent=2)
-
-        if self.embeddings is not None:
-            np.save(EMBEDDINGS_PATH, self.embeddings)
-
-        # metadados simples
-        meta = {
-            "docs": len(self.docs),
-            "steps": sorted(list({d.step for d in self.docs})),
+    # ---------- Inicialização ----------
+    def load(self) -> None:
+        """Carrega modelo e base. Idempotente: chamadas concorrentes esperam a primeira."""
+        if self._ready:
+            return
+        with self._load_lock:
+            if self._ready:
+                return
+            started = time.perf_counter()
+            try:
+                self.embedder.load()
+                self.reranker.load()
+                with self._write_lock:
+                    self._load_from_disk()
+            except Exception as e:
+                self.load_error = str(e)
+                raise
+            self.load_seconds = round(time.perf_counter() - started, 3)
+            self.load_error = None
+            self._ready = True
+            logger.info(f"RAG pronto em {self.load_seconds}s ({self.get_stats()['chunks']} chunks)")
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def readiness(self) -> Dict[str, Any]:
+        return {
+            "ready": self._ready,
+            "load_seconds": self.load_seconds,
+            "load_error": self.load_error,
+            "embedder": self.embedder.info(),
+            "reranker": self.reranker.info(),
+            "snapshot_version": self.snapshot_version,
         }
-        with open(METADATA_PATH, "w", encoding="utf-8") as f:
+
+    def _publish(self, view: _KnowledgeView) -> None:
+        """Troca o estado visto pelas buscas (uma única atribuição)."""
+        self._view = replace(view, version=self._view.version + 1)
+
+    @property
+    def version(self) -> int:
+        """Versão da base; muda a cada upload, remoção, compactação ou reload."""
+        return self._view.version
+
+    @property
+    def snapshot_version(self) -> int:
+        """Versão publicada no manifesto (igual em todos os workers que já a carregaram)."""
+        snapshot = self._view.snapshot
+        return snapshot.version if snapshot else 0
+
+    @property
+    def docs(self) -> List[KnowledgeDoc]:
+        return self._view.docs
+
+    @property
+    def embeddings(self) -> Optional[Matrix]:
+        return self._view.embeddings
+
+    @property
+    def index(self) -> VectorIndex:
+        return self._view.index
+
+    # ---------- Persistência ----------
+    def _open_store(self, generation: int, dtype: str = RAG_EMBEDDING_DTYPE) -> EmbeddingStore:
+        path = self.snapshots.generation_dir(generation)
+        return EmbeddingStore(path / "embeddings.npy", path / "knowledge.jsonl", dtype, keep_full=RAG_EXACT_RERANK)
+
+    def _load_from_disk(self, convert: bool = True) -> None:
+        """
+        Carrega a versão publicada no manifesto, criando ou migrando a base se
+        preciso. Com `convert`, uma base em outro dtype é regravada no configurado.
+        """
+        for attempt in range(3):
+            manifest = self.snapshots.read()
+            if manifest is None or (convert and self._needs_conversion(manifest)):
+                with self.snapshots.write_lock():
+                    manifest = self._prepare_locked()
+                if self._view.snapshot == manifest:
+                    return
+            try:
+                self._load_snapshot(manifest)
+                return
+            except FileNotFoundError:
+                # outro worker compactou e apagou a geração entre a leitura do manifesto e a dos arquivos
+                if attempt == 2:
+                    raise
+                logger.info(f"Geração {manifest.generation} removida durante o load; relendo o manifesto")
+
+    def _needs_conversion(self, manifest: Manifest) -> bool:
+        return manifest.rows > 0 and self._open_store(manifest.generation).needs_conversion()
+
+    def _prepare_locked(self) -> Manifest:
+        """Com o lock de escrita: cria a primeira geração ou converte a atual para o dtype configurado."""
+        manifest = self.snapshots.read()
+        if manifest is None:
+            return self._bootstrap()
+        if self._needs_conversion(manifest):
+            old = self._open_store(manifest.generation, manifest.dtype)
+            raws, embeddings = old.read_float32(manifest.rows, manifest.docs_bytes)
+            deleted = old.load_deleted(manifest.deleted_bytes)
+            keep = [i for i in range(len(raws)) if i not in deleted]
+            logger.info(f"Convertendo a base para {RAG_EMBEDDING_DTYPE} (geração {manifest.generation + 1})")
+            return self._write_generation([raws[i] for i in keep], embeddings[keep], manifest)
+        return manifest
+
+    def _bootstrap(self) -> Manifest:
+        """Primeira geração: base vazia ou migrada dos arquivos na raiz de DATA_DIR."""
+        if not self._migrate_legacy:
+            return self._write_generation([], None, None)
+        legacy = EmbeddingStore(EMBEDDINGS_PATH, KNOWLEDGE_PATH, RAG_EMBEDDING_DTYPE, keep_full=RAG_EXACT_RERANK)
+        raws: List[Dict[str, Any]] = []
+        embeddings: Optional[np.ndarray] = None
+        if legacy.exists():
+            # formato append-only de antes dos snapshots
+            raws, embeddings = legacy.read_float32(np.load(EMBEDDINGS_PATH, mmap_mode="r").shape[0])
+            deleted = legacy.load_deleted()
+            keep = [i for i in range(len(raws)) if i not in deleted]
+            raws, embeddings = [raws[i] for i in keep], embeddings[keep]
+        elif LEGACY_KNOWLEDGE_PATH.exists():
+            raws, embeddings = self._read_legacy_json()
+
+        manifest = self._write_generation(raws, embeddings, None)
+        if raws:
+            logger.info(f"Base migrada para {self.snapshots.generation_dir(manifest.generation)} ({len(raws)} chunks)")
+        for path in (
+            KNOWLEDGE_PATH, legacy.deleted_path, EMBEDDINGS_PATH, legacy.scales_path, legacy.full_path,
+            LEGACY_KNOWLEDGE_PATH, INDEX_PATH,
+        ):
+            path.unlink(missing_ok=True)
+        return manifest
+
+    def _read_legacy_json(self) -> Tuple[List[Dict[str, Any]], Optional[np.ndarray]]:
+        """Lê knowledge.json + embeddings.npy (np.save), o formato mais antigo."""
+        with open(LEGACY_KNOWLEDGE_PATH, "r", encoding="utf-8") as f:
+            raws = json.load(f)
+        if not raws or not EMBEDDINGS_PATH.exists():
+            return [], None
+        embeddings = _normalize_rows(np.load(EMBEDDINGS_PATH))
+        n = min(len(raws), embeddings.shape[0])
+        return raws[:n], embeddings[:n]
+
+    def _write_generation(
+        self,
+        raws: List[Dict[str, Any]],
+        embeddings: Optional[np.ndarray],
+        base: Optional[Manifest],
+    ) -> Manifest:
+        """
+        Grava a base inteira em uma nova geração, publica o manifesto e o
+        novo estado (com o write lock). Leitores da geração anterior não são afetados.
+        """
+        generation = base.generation + 1 if base else 1
+        self.snapshots.new_generation(generation)
+        store = self._open_store(generation)
+        if embeddings is not None:
+            store.rewrite(raws, embeddings)
+        mapped = store.mmap()
+
+        index = make_index()
+        if mapped is not None:
+            index.build(mapped)
+        if base is None:
+            manifest = Manifest(version=1, generation=1, created_at=time.time(), **store.committed())
+        else:
+            manifest = base.next(generation=generation, **store.committed())
+        manifest = replace(manifest, index=self._save_index(index, mapped, manifest))
+        self.snapshots.publish(manifest)
+        self.snapshots.cleanup(manifest)
+
+        docs = [KnowledgeDoc(**d) for d in raws]
+        self.store = store
+        self._publish(_KnowledgeView(
+            docs, mapped, _step_rows_for(docs), index,
+            full=store.mmap_full(),
+            lexical=_build_lexical(docs),
+            snapshot=manifest,
+        ))
+        return manifest
+
+    def _load_snapshot(self, manifest: Manifest) -> None:
+        # lê no dtype em que a geração foi gravada (workers ainda não reiniciados com outro)
+        store = self._open_store(manifest.generation, manifest.dtype)
+        raws, embeddings = store.load(manifest.rows, manifest.docs_bytes)
+        docs = [KnowledgeDoc(**d) for d in raws]
+        deleted = frozenset(store.load_deleted(manifest.deleted_bytes))
+
+        index = make_index()
+        if embeddings is not None:
+            if manifest.index:
+                index.load(self.snapshots.generation_dir(manifest.generation) / manifest.index, embeddings)
+            else:
+                index.build(embeddings)
+        self.store = store
+        self._publish(_KnowledgeView(
+            docs=docs,
+            embeddings=embeddings,
+            step_rows=_step_rows_for(docs, deleted=deleted),
+            index=index,
+            deleted=deleted,
+            alive_rows=_alive_rows(len(docs), deleted),
+            full=store.mmap_full(),
+            lexical=_build_lexical(docs, deleted),
+            snapshot=manifest,
+        ))
+
+    def _save_index(self, index: VectorIndex, embeddings: Optional[Matrix], manifest: Manifest) -> str:
+        """Grava o índice desta versão num arquivo próprio (nunca sobrescreve o que leitores usam)."""
+        if embeddings is None:
+            return ""
+        name = f"index-{manifest.version:08d}.npz"
+        path = self.snapshots.generation_dir(manifest.generation) / name
+        index.save(path)
+        return name if path.exists() else ""
+
+    def _save_metadata(self) -> None:
+        """Estatísticas da base para consulta (GET /admin/metadata)."""
+        meta = self.get_stats()
+        tmp = self.metadata_path.with_name(f"{self.metadata_path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
             json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.metadata_path)
+
+    # ---------- Sincronização entre workers ----------
+    def refresh(self) -> bool:
+        """Carrega a versão publicada por outro worker, se houver. True se a base mudou."""
+        if not self._ready:
+            return False
+        manifest = self.snapshots.read()
+        if manifest is None or manifest == self._view.snapshot:
+            return False
+        with self._write_lock:
+            return self._sync_locked()
+
+    def _sync_locked(self) -> bool:
+        """
+        Alcança o manifesto atual (com o write lock). Appends e remoções na
+        mesma geração são lidos incrementalmente; outra geração recarrega tudo.
+        """
+        manifest = self.snapshots.read()
+        current = self._view.snapshot
+        if manifest is None or manifest == current:
+            return False
+        if (
+            current is not None
+            and manifest.generation == current.generation
+            and manifest.version > current.version
+            and manifest.rows >= current.rows
+        ):
+            try:
+                self._apply_increment(manifest)
+                return True
+            except (FileNotFoundError, RuntimeError) as e:
+                logger.warning(f"Falha ao ler a versão {manifest.version} incrementalmente ({e}); recarregando")
+        self._load_from_disk(convert=False)
+        return True
+
+    def _apply_increment(self, manifest: Manifest) -> None:
+        view = self._view
+        raws, mapped, removed = self.store.load_increment(manifest.rows, manifest.docs_bytes, manifest.deleted_bytes)
+        self._publish(self._extended(
+            view,
+            [KnowledgeDoc(**d) for d in raws],
+            mapped if raws else view.embeddings,
+            self.store.mmap_full() if raws else view.full,
+            removed,
+            manifest,
+        ))
+
+    def _extended(
+        self,
+        view: _KnowledgeView,
+        docs: List[KnowledgeDoc],
+        mapped: Optional[Matrix],
+        full: Optional[np.ndarray],
+        removed: Iterable[int],
+        snapshot: Optional[Manifest],
+    ) -> _KnowledgeView:
+        """Novo estado: `docs` (já gravados em `mapped`) no final e `removed` marcados como removidos."""
+        start = len(view.docs)
+        index = view.index
+        lexical = view.lexical
+        if docs:
+            index = copy.copy(view.index)
+            if start == 0:
+                index.build(mapped)
+            else:
+                index.add(mapped, start)
+            if lexical is not None:
+                lexical = copy.copy(lexical)
+                lexical.add([d.text for d in docs], start)
+        removed = frozenset(removed) - view.deleted
+        if removed and lexical is not None:
+            if lexical is view.lexical:
+                lexical = copy.copy(lexical)
+            lexical.delete(removed)
+
+        all_docs = view.docs + list(docs)
+        deleted = view.deleted | removed
+        if deleted != view.deleted:
+            step_rows = _step_rows_for(all_docs, deleted=deleted)
+        else:
+            step_rows = _step_rows_for(docs, start, view.step_rows)
+
+        return _KnowledgeView(
+            docs=all_docs,
+            embeddings=mapped,
+            step_rows=step_rows,
+            index=index,
+            deleted=deleted,
+            alive_rows=_alive_rows(len(all_docs), deleted),
+            full=full,
+            lexical=lexical,
+            snapshot=snapshot,
+        )
+
+    # ---------- Hot reload ----------
+    def start_watcher(self, interval: float = RAG_RELOAD_INTERVAL) -> None:
+        """
+        Thread que acompanha o manifesto (um stat por intervalo) e carrega as
+        versões publicadas por outros workers. Uma por processo: chamar
+        depois do fork (lifespan da API).
+        """
+        if interval <= 0 or self._watcher_pid == os.getpid():
+            return
+        self._watcher_pid = os.getpid()
+        threading.Thread(target=self._watch, args=(interval,), name="rag-reload", daemon=True).start()
+
+    def _watch(self, interval: float) -> None:
+        last = None
+        while True:
+            time.sleep(interval)
+            signature = self.snapshots.signature()
+            if signature == last or not self._ready:
+                continue
+            try:
+                if self.refresh():
+                    snapshot = self._view.snapshot
+                    logger.info(f"Base recarregada: versão {snapshot.version} (geração {snapshot.generation})")
+                last = signature
+            except Exception as e:
+                logger.error(f"Erro ao recarregar a base: {e}")
 
     # ---------- Atualização ----------
-    def add_documents(self, docs: List[KnowledgeDoc]) -> None:
-        if not docs:
+    def embed_documents(self, docs: List[KnowledgeDoc], batch_size: int = 32) -> np.ndarray:
+        """Embeddings normalizados dos documentos (não altera a base)."""
+        texts = [d.text for d in docs]
+        return _normalize_rows(self.embedder.encode(texts, batch_size=batch_size))
+
+    def add_documents(
+        self,
+        docs: List[KnowledgeDoc],
+        embeddings: Optional[np.ndarray] = None,
+        replace_parents: Iterable[Tuple[str, str]] = (),
+        max_chunks: Optional[int] = None,
+    ) -> None:
+        """
+        Adiciona documentos à base. `embeddings` (normalizados) pode vir
+        pronto de embed_documents, para que o encode rode fora do commit.
+        `replace_parents` são pares (step, deck) cujos chunks atuais saem da
+        base no mesmo commit (re-upload de um deck). `max_chunks` limita o
+        total de chunks da base depois do commit (ValueError se passar),
+        conferido sob os write locks, contra a base que de fato vai mudar.
+        As buscas só passam a ver as mudanças no final, de uma vez; os
+        outros workers, na próxima verificação do manifesto.
+        """
+        replace_set = set(replace_parents)
+        if not docs and not replace_set:
             return
+        self.load()
+        if docs and embeddings is None:
+            embeddings = self.embed_documents(docs)
+
+        with self._write_lock, self.snapshots.write_lock():
+            # outro worker pode ter publicado depois do último refresh
+            self._sync_locked()
+            docs, embeddings = self._skip_published(list(docs), embeddings, replace_set)
+            view = self._view
+            removed = [i for i, d in view.alive() if (d.step, d.parent) in replace_set]
+            if not docs and not removed:
+                return
+            if max_chunks is not None:
+                total = len(view.docs) - len(view.deleted) - len(removed) + len(docs)
+                if total > max_chunks:
+                    raise ValueError(f"Limite de {max_chunks} trechos na base excedido ({total} com este envio).")
+
+            # grava só as linhas novas e remapeia o arquivo (sem np.vstack em memória)
+            mapped, full = view.embeddings, view.full
+            if docs:
+                self.store.append([d.__dict__ for d in docs], embeddings)
+                mapped = self.store.mmap()
+                full = self.store.mmap_full()
+            # versões antigas saem depois que as novas estão gravadas
+            self.store.delete(removed)
+
+            new_view = self._extended(view, docs, mapped, full, removed, None)
+            manifest = view.snapshot.next(**self.store.committed())
+            manifest = replace(manifest, index=self._save_index(new_view.index, mapped, manifest))
+            self.snapshots.publish(manifest)
+            self._publish(replace(new_view, snapshot=manifest))
 
-        new_texts = [d.text for d in docs]
-        new_embs = self.model.encode(new_texts, convert_to_numpy=True)
+            if len(new_view.deleted) > RAG_COMPACT_RATIO * len(new_view.docs):
+                self._compact()
+            else:
+                self.snapshots.cleanup(manifest)
+            self._save_metadata()
 
-        if self.embeddings is None or len(self.docs) == 0:
-            self.embeddings = new_embs
-            self.docs = docs
+    def _skip_published(
+        self,
+        docs: List[KnowledgeDoc],
+        embeddings: Optional[np.ndarray],
+        replace_set: set,
+    ) -> Tuple[List[KnowledgeDoc], Optional[np.ndarray]]:
+        """
+        Decks que já estão na base com o mesmo hash (ex.: o mesmo arquivo
+        enviado a dois workers) não são gravados de novo; com outro hash,
+        a versão atual é substituída.
+        """
+        published = {(d.step, d.parent): d.parent_hash for _, d in self._view.alive() if d.parent_hash}
+        keep = []
+        for i, doc in enumerate(docs):
+            key = (doc.step, doc.parent)
+            if not doc.parent_hash or key not in published:
+                keep.append(i)
+            elif published[key] == doc.parent_hash:
+                replace_set.discard(key)
+            else:
+                replace_set.add(key)
+                keep.append(i)
+        if len(keep) == len(docs):
+            return docs, embeddings
+        return [docs[i] for i in keep], (embeddings[keep] if embeddings is not None else None)
+
+    def _compact(self) -> None:
+        """Regrava a base sem as linhas removidas em uma nova geração (chamado com os write locks)."""
+        view = self._view
+        keep = [i for i, _ in view.alive()]
+        source = view.full if view.full is not None else view.embeddings
+        if keep:
+            embeddings = np.asarray(source[keep], dtype=np.float32)
         else:
-            self.embeddings = np.vstack([self.embeddings, new_embs])
-            self.docs.extend(docs)
+            embeddings = np.empty((0, view.embeddings.shape[1]), dtype=np.float32)
+        self._write_generation([view.docs[i].__dict__ for i in keep], embeddings, view.snapshot)
 
-        self._save_to_disk()
+    # ---------- Deduplicação ----------
+    def parent_hashes(self) -> Dict[Tuple[str, str], str]:
+        """(step, deck) -> hash do deck, para os decks atualmente na base (somente leitura)."""
+        return self._view.parent_hashes
+
+    def vectors_by_hash(self, hashes: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Embeddings já calculados para chunks com estes hashes de conteúdo."""
+        view = self._view
+        rows = view.row_of_hash
+        found = {h: rows[h] for h in set(hashes) if h in rows}
+        source = view.full if view.full is not None else view.embeddings
+        return {h: np.asarray(source[i], dtype=np.float32) for h, i in found.items()}
 
     def reload(self) -> None:
-        """Recarrega do disco (caso outra rotina tenha atualizado os arquivos)."""
-        self._load_from_disk()
+        """Recarrega do disco a versão publicada no manifesto (sem esperar o watcher)."""
+        if not self._ready:
+            self.load()
+            return
+        with self._write_lock:
+            self._load_from_disk()
 
     # ---------- Busca ----------
+    def _encode_normalized(self, texts: List[str]) -> np.ndarray:
+        return _normalize_rows(self.embedder.encode(texts, batch_size=len(texts)))
+
+    def encode_query(self, query: str) -> np.ndarray:
+        """Embedding normalizado da pergunta, passando pelo cache LRU/TTL (fora do event loop)."""
+        with span("rag.encode"):
+            q_emb = self.query_cache.get(query)
+            if q_emb is None:
+                q_emb = self._encode_normalized([query])[0]
+                self.query_cache.put(query, q_emb)
+        return q_emb
+
+    async def aencode_query(self, query: str) -> np.ndarray:
+        """
+        Versão async de encode_query: misses vão para o encoder em lote.
+        No event loop só a camada em memória do cache; o SQLite roda em thread.
+        """
+        cache = self.query_cache
+        with span("rag.encode"):
+            q_emb = cache.get(query, memory_only=True)
+            if q_emb is None and cache.disk:
+                q_emb = await asyncio.to_thread(cache.get, query)
+            if q_emb is None:
+                q_emb = await self.encoder.encode(query)
+                cache.put(query, q_emb, memory_only=True)
+                if cache.disk:
+                    # gravação no disco não atrasa a resposta
+                    asyncio.get_running_loop().run_in_executor(None, cache.put_disk, query, q_emb)
+        return q_emb
+
+    async def asearch(
+        self,
+        query: str,
+        top_k: int = 5,
+        step_filter: Optional[str] = None,
+        max_per_parent: int = RAG_MAX_CHUNKS_PER_PARENT,
+    ) -> List[KnowledgeDoc]:
+        """Mesma busca de search(), sem bloquear o event loop."""
+        if self.embeddings is None or not self.docs:
+            return []
+        q_emb = await self.aencode_query(query)
+        return await asyncio.to_thread(
+            self.search_by_embedding, q_emb, top_k, step_filter, max_per_parent, query
+        )
+
     def search(
         self,
         query: str,
         top_k: int = 5,
         step_filter: Optional[str] = None,
+        max_per_parent: int = RAG_MAX_CHUNKS_PER_PARENT,
     ) -> List[KnowledgeDoc]:
+        """
+        Retorna os top_k chunks mais similares, deduplicados por deck:
+        chunks que se sobrepõem a outro já escolhido do mesmo deck são
+        descartados, e cada deck contribui com no máximo max_per_parent trechos.
+        """
         if self.embeddings is None or not self.docs:
             return []
+        return self.search_by_embedding(
+            self.encode_query(query), top_k, step_filter, max_per_parent, query
+        )
+
+    def search_by_embedding(
+        self,
+        q_emb: np.ndarray,
+        top_k: int = 5,
+        step_filter: Optional[str] = None,
+        max_per_parent: int = RAG_MAX_CHUNKS_PER_PARENT,
+        query: Optional[str] = None,
+        dense_scores: Optional[np.ndarray] = None,
+        view: Optional[_KnowledgeView] = None,
+    ) -> List[KnowledgeDoc]:
+        """
+        Busca densa pelo embedding; com `query` (texto) e RAG_HYBRID, funde
+        com o ranking BM25 por Reciprocal Rank Fusion. Com RAG_RERANK (na
+        etapa), os RAG_RERANK_CANDIDATES melhores passam pelo cross-encoder.
+        `dense_scores` (similaridade com todas as linhas, de search_batch)
+        substitui a consulta ao índice e vem com a `view` em que foi calculado.
+        """
+        n_results = self.results_for(query, step_filter, top_k)
+        scored = self.search_scored(q_emb, n_results, step_filter, max_per_parent, query, dense_scores, view)
+        return self.rerank_results(query, step_filter, [d for d, _ in scored], top_k)
+
+    def results_for(self, query: Optional[str], step_filter: Optional[str], top_k: int) -> int:
+        """Quantos trechos a primeira etapa entrega (mais, se o cross-encoder vai reordenar)."""
+        if query and self.reranker.applies_to(step_filter):
+            return max(top_k, self.reranker.candidates)
+        return top_k
+
+    def search_scored(
+        self,
+        q_emb: np.ndarray,
+        n_results: int = 5,
+        step_filter: Optional[str] = None,
+        max_per_parent: int = RAG_MAX_CHUNKS_PER_PARENT,
+        query: Optional[str] = None,
+        dense_scores: Optional[np.ndarray] = None,
+        view: Optional[_KnowledgeView] = None,
+    ) -> List[Tuple[KnowledgeDoc, float]]:
+        """
+        Primeira etapa da busca (densa + BM25, dedupe por deck), sem o
+        cross-encoder. Cada trecho vem com o cosseno com a pergunta; a
+        ordem da lista é a da busca híbrida (core/shards.py junta as listas
+        da base global e da base da startup por posição).
+        """
+        if view is None:
+            if dense_scores is not None:
+                raise ValueError("dense_scores exige a view em que foi calculado")
+            view = self._view
+        if view.embeddings is None or not view.docs:
+            return []
+        n_candidates = n_results * CANDIDATES_PER_RESULT
+
+        # aplica filtro por step se houver (só pontua as linhas do step)
+        rows: Optional[np.ndarray] = view.alive_rows
+        if step_filter and step_filter != "todas":
+            rows = view.step_rows.get(step_filter)
+            if rows is None or rows.size == 0:
+                return []
 
-        q_emb = self.model.encode([query], convert_to_numpy=True)
-        sims = cosine_similarity(q_emb, self.embeddings)[0]
+        lexical = np.empty(0, dtype=np.int64)
+        dense_rows = rows
+        if view.lexical is not None and query:
+            with span("rag.lexical"):
+                if RAG_LEXICAL_PREFILTER > 0:
+                    # base grande: a busca densa só pontua os melhores candidatos do BM25
+                    lexical = view.lexical.search(query, RAG_LEXICAL_PREFILTER, rows)
+                    if lexical.size >= n_candidates:
+                        dense_rows = np.sort(lexical)
+                    lexical = lexical[:n_candidates]
+                else:
+                    lexical = view.lexical.search(query, n_candidates, rows)
 
-        # aplica filtro por step se houver
-        scored: List[tuple[float, int]] = []
-        for idx, doc in enumerate(self.docs):
-            if step_filter and step_filter != "todas" and doc.step != step_filter:
+        with span("rag.dense"):
+            if dense_scores is not None:
+                if dense_rows is None:
+                    candidates = _top_k_indices(dense_scores, n_candidates)
+                else:
+                    candidates = dense_rows[_top_k_indices(dense_scores[dense_rows], n_candidates)]
+            else:
+                candidates = view.index.search(view.embeddings, q_emb, n_candidates, dense_rows)
+        if view.full is not None:
+            # matriz principal em float16/int8: reordena os candidatos com os vetores originais
+            with span("rag.rerank"):
+                candidates = rerank_exact(view.full, q_emb, candidates)
+        with span("rag.fusion"):
+            if lexical.size:
+                candidates = reciprocal_rank_fusion([candidates, lexical], RAG_RRF_K)
+            selected = self._dedupe_by_parent([view.docs[i] for i in candidates], n_results, max_per_parent)
+        if not selected:
+            return []
+
+        row_of = {id(view.docs[i]): i for i in candidates}
+        rows_selected = np.asarray([row_of[id(d)] for d in selected], dtype=np.int64)
+        source = view.full if view.full is not None else view.embeddings
+        scores = np.asarray(source[rows_selected], dtype=np.float32) @ q_emb
+        return list(zip(selected, scores.tolist()))
+
+    def rerank_results(
+        self,
+        query: Optional[str],
+        step_filter: Optional[str],
+        selected: List[KnowledgeDoc],
+        top_k: int,
+    ) -> List[KnowledgeDoc]:
+        """Segunda etapa: cross-encoder nos trechos da primeira, se ligado na etapa."""
+        if not (query and self.reranker.applies_to(step_filter)):
+            return selected[:top_k]
+        order = self.reranker.rerank(query, [d.text for d in selected])
+        if order is None:
+            # orçamento estourado ou pool ocupado: ordem da busca, como sem re-ranking
+            return selected[:top_k]
+        return [selected[i] for i in order[:self.reranker.top_k_for(step_filter, top_k)]]
+
+    def search_batch(
+        self,
+        queries: List[str],
+        steps: List[Optional[str]],
+        top_k: int = 5,
+        max_per_parent: int = RAG_MAX_CHUNKS_PER_PARENT,
+    ) -> List[Tuple[List[KnowledgeDoc], float]]:
+        """
+        Várias buscas de uma vez (avaliação em lote): um único encode para
+        todas as perguntas e, com o índice exato, um único produto de
+        matrizes com a base. O resto (BM25, dedupe, re-ranking) é o mesmo
+        de search(). Devolve, por pergunta, os documentos e os segundos
+        gastos, com a parte em lote rateada entre as perguntas.
+        """
+        view = self._view
+        if view.embeddings is None or not view.docs or not queries:
+            return [([], 0.0) for _ in queries]
+
+        started = time.perf_counter()
+        with span("rag.encode"):
+            q_embs = self._encode_normalized(list(queries))
+        scores = None
+        if view.index.name == "exact":
+            with span("rag.dense"):
+                # (linhas, perguntas) -> uma linha contígua por pergunta
+                scores = np.ascontiguousarray(_dot(view.embeddings, np.ascontiguousarray(q_embs.T)).T)
+        shared = (time.perf_counter() - started) / len(queries)
+
+        out: List[Tuple[List[KnowledgeDoc], float]] = []
+        for i, (query, step) in enumerate(zip(queries, steps)):
+            item_started = time.perf_counter()
+            docs = self.search_by_embedding(
+                q_embs[i], top_k, step, max_per_parent, query,
+                dense_scores=None if scores is None else scores[i], view=view,
+            )
+            out.append((docs, shared + time.perf_counter() - item_started))
+        return out
+
+    @staticmethod
+    def _dedupe_by_parent(
+        ranked: List[KnowledgeDoc],
+        top_k: int,
+        max_per_parent: int,
+    ) -> List[KnowledgeDoc]:
+        selected: List[KnowledgeDoc] = []
+        per_parent: Dict[str, List[KnowledgeDoc]] = {}
+
+        for doc in ranked:
+            chosen = per_parent.setdefault(doc.parent, [])
+            if len(chosen) >= max_per_parent:
+                continue
+            if any(doc.overlaps(other) for other in chosen):
                 continue
-            scored.append((sims[idx], idx))
+            chosen.append(doc)
+            selected.append(doc)
+            if len(selected) >= top_k:
+                break
 
-        scored.sort(reverse=True, key=lambda x: x[0])
-        top = scored[:top_k]
-        return [self.docs[i] for _, i in top]
+        return selected
 
     # ---------- Info ----------
     def get_stats(self) -> Dict[str, Any]:
-        if not self.docs:
-            return {"docs": 0, "steps": []}
+        view = self._view
+        alive = [d for _, d in view.alive()]
+        if not alive:
+            return {"docs": 0, "chunks": 0, "steps": []}
         return {
-            "docs": len(self.docs),
-            "steps": sorted(list({d.step for d in self.docs})),
+            "docs": len({(d.step, d.parent) for d in alive}),
+            "chunks": len(alive),
+            "steps": sorted(view.step_rows),
         }
 
 
-# Instância global (padrão indústria simples para projeto pequeno)
+# Instância global (padrão indústria simples para projeto pequeno).
+# Só é carregada em rag_engine.load() (ver main.py).
 rag_engine = RAGEngine()
@@ -0,0 +1,344 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional, Tuple
+
+from fastapi import Depends, HTTPException
+
+from core.auth import verify_founder
+from core.config import (
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_BACKEND,
+    RATE_LIMIT_DB_PATH,
+    LLM_MAX_CONCURRENT,
+    LLM_MAX_QUEUE,
+    LLM_QUEUE_TIMEOUT,
+)
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+rate_limited = metrics.counter("rate_limited_total", "Requisições recusadas pelo rate limit, por limite")
+admission_rejected = metrics.counter(
+    "llm_admission_rejected_total", "Chamadas ao LLM recusadas pelo controle de admissão (motivo: queue_full, timeout)"
+)
+admission_queue = metrics.gauge("llm_admission_queue", "Chamadas ao LLM esperando vaga neste worker")
+admission_active = metrics.gauge("llm_admission_active", "Chamadas ao LLM em andamento neste worker")
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_rate(spec: str) -> Tuple[int, float]:
+    """'20/minute' -> (20, 60.0): até 20 de uma vez, repostos ao longo de um minuto."""
+    try:
+        amount, _, period = spec.strip().partition("/")
+        return int(amount), float(_PERIODS[period.strip().lower().rstrip("s")])
+    except (ValueError, KeyError):
+        raise RuntimeError(f"Limite inválido: '{spec}'. Use N/second, N/minute, N/hour ou N/day.")
+
+
+# ---------- Token bucket ----------
+class BucketStore(ABC):
+    """
+    Baldes de tokens por chave: capacidade `burst`, repostos a `rate` por
+    segundo. take() consome `cost` tokens se houver e devolve
+    (permitido, segundos até haver tokens suficientes).
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> Tuple[bool, float]:
+        ...
+
+    @staticmethod
+    def _refill(tokens: float, updated: float, now: float, rate: float, burst: int) -> float:
+        return min(float(burst), tokens + max(0.0, now - updated) * rate)
+
+
+class MemoryBucketStore(BucketStore):
+    """Baldes na memória do processo (cada worker tem os seus: limite efetivo × workers)."""
+
+    name = "memory"
+
+    def __init__(self, max_keys: int = 100_000) -> None:
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (float(burst), now))
+            tokens = self._refill(tokens, updated, now, rate, burst)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+
+class SQLiteBucketStore(BucketStore):
+    """
+    Baldes num SQLite local (WAL), compartilhados entre os workers da máquina.
+    Cada take() é uma transação BEGIN IMMEDIATE (lê, repõe e grava o balde
+    sem corrida entre processos). Conexão aberta no primeiro uso em cada processo.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, db_path: Path = RATE_LIMIT_DB_PATH) -> None:
+        self.db_path = db_path
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._takes_since_purge = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db_pid != os.getpid():
+            db = sqlite3.connect(str(self.db_path), timeout=5.0, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                " key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self._db, self._db_pid = db, os.getpid()
+        return self._db
+
+    def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> Tuple[bool, float]:
+        # relógio de parede: o balde é lido por vários processos
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+                tokens = self._refill(row[0], row[1], now, rate, burst) if row else float(burst)
+                allowed = tokens >= cost
+                if allowed:
+                    tokens -= cost
+                db.execute(
+                    "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                    (key, tokens, now),
+                )
+                self._takes_since_purge += 1
+                if self._takes_since_purge >= 1024:
+                    # baldes parados há um dia já estariam cheios: não precisam existir
+                    self._takes_since_purge = 0
+                    db.execute("DELETE FROM rate_buckets WHERE updated < ?", (now - 86400,))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+
+def make_bucket_store(backend: str = RATE_LIMIT_BACKEND) -> BucketStore:
+    backends = {"memory": MemoryBucketStore, "sqlite": SQLiteBucketStore}
+    if backend not in backends:
+        raise RuntimeError(f"RATE_LIMIT_BACKEND inválido: '{backend}'. Use um de: {', '.join(backends)}")
+    return backends[backend]()
+
+
+class RateLimiter:
+    """
+    Rate limit por usuário (claims role/sub/startup do JWT), não por IP: atrás
+    do nginx todos chegam do mesmo endereço, e com vários workers o balde
+    precisa ser o mesmo (RATE_LIMIT_BACKEND=sqlite).
+    """
+
+    def __init__(self, store: BucketStore, enabled: bool = RATE_LIMIT_ENABLED) -> None:
+        self.store = store
+        self.enabled = enabled
+
+    @staticmethod
+    def key_for(claims: Dict[str, Any]) -> str:
+        return "\0".join([claims.get("role", ""), claims.get("sub", ""), claims.get("startup", "") or ""])
+
+    def check(self, name: str, spec: str, claims: Dict[str, Any]) -> None:
+        """Consome um token do balde `name` do usuário; sem tokens, HTTP 429 com Retry-After."""
+        if not self.enabled:
+            return
+        burst, period = parse_rate(spec)
+        try:
+            allowed, retry_after = self.store.take(f"{name}\0{self.key_for(claims)}", burst / period, burst)
+        except sqlite3.Error as e:
+            # o limite protege o serviço; não pode derrubá-lo
+            logger.error(f"Erro no rate limit ({name}): {e}")
+            return
+        if not allowed:
+            rate_limited.inc(limit=name)
+            raise HTTPException(
+                status_code=429,
+                detail=f"Limite de requisições excedido ({spec}). Tente novamente em instantes.",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+
+    def limit(self, name: str, spec: str) -> Callable[..., dict]:
+        """
+        Dependency do FastAPI: `founder: dict = Depends(rate_limiter.limit("ask", "20/minute"))`.
+        Devolve as claims do JWT (substitui o Depends(verify_founder)).
+        """
+        parse_rate(spec)  # limite inválido falha no import, não na primeira requisição
+
+        def dependency(founder: dict = Depends(verify_founder)) -> dict:
+            self.check(name, spec, founder)
+            return founder
+
+        return dependency
+
+
+# ---------- Controle de admissão do LLM ----------
+class AdmissionRejected(Exception):
+    """Sem vaga para chamar o LLM (fila cheia ou espera longa demais)."""
+
+    def __init__(self, reason: str, retry_after: float) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    """
+    Limita as chamadas simultâneas ao LLM neste worker (`max_concurrent`).
+    Quem não tem vaga espera numa fila justa: as vagas liberadas vão para
+    os usuários em rodízio, então quem dispara muitas perguntas não passa
+    na frente dos outros. Com a fila cheia (`max_queue`) ou após
+    `queue_timeout` segundos de espera, a chamada é recusada na hora
+    (AdmissionRejected -> HTTP 429 com Retry-After) em vez de acumular timeouts.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = LLM_MAX_CONCURRENT,
+        max_queue: int = LLM_MAX_QUEUE,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT,
+    ) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        # usuário -> fila de espera dele; a ordem das chaves é o rodízio
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        # média móvel de quanto tempo uma vaga fica ocupada (estimativa do Retry-After)
+        self._hold_seconds = 5.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0
+
+    def retry_after(self) -> float:
+        """Estimativa de quando a fila atual terá andado."""
+        rounds = (self.waiting + 1) / max(1, self.max_concurrent)
+        return max(1.0, rounds * self._hold_seconds)
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        admission_rejected.inc(reason=reason)
+        return AdmissionRejected(reason, self.retry_after())
+
+    async def acquire(self, key: str) -> None:
+        if not self.enabled:
+            return
+        if self.active < self.max_concurrent and not self.waiting:
+            self._enter()
+            return
+        if self.waiting >= self.max_queue:
+            raise self._reject("queue_full")
+
+        fut = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(key, deque()).append(fut)
+        self.waiting += 1
+        admission_queue.set(self.waiting)
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled():
+                # a vaga chegou junto com o timeout/cancelamento: devolve
+                self.release(held=0.0)
+            else:
+                fut.cancel()
+                self._forget(key, fut)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise self._reject("timeout")
+
+    def _enter(self) -> None:
+        self.active += 1
+        admission_active.set(self.active)
+
+    def _forget(self, key: str, fut: asyncio.Future) -> None:
+        queue = self._queues.get(key)
+        if queue is not None and fut in queue:
+            queue.remove(fut)
+            self.waiting -= 1
+            admission_queue.set(self.waiting)
+            if not queue:
+                del self._queues[key]
+
+    def release(self, held: Optional[float] = None) -> None:
+        if not self.enabled:
+            return
+        if held:
+            self._hold_seconds = 0.9 * self._hold_seconds + 0.1 * held
+        self.active -= 1
+        # passa a vaga para o próximo usuário do rodízio
+        while self._queues and self.active < self.max_concurrent:
+            key, queue = next(iter(self._queues.items()))
+            fut = queue.popleft()
+            self.waiting -= 1
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            if not fut.done():
+                fut.set_result(None)
+                self._enter()
+        admission_queue.set(self.waiting)
+        admission_active.set(self.active)
+
+    @asynccontextmanager
+    async def slot(self, key: str) -> AsyncIterator[None]:
+        await self.acquire(key)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "users_waiting": len(self._queues),
+            "avg_hold_seconds": round(self._hold_seconds, 3),
+        }
+
+
+def admission_error(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="O agente está com muitas perguntas em andamento. Tente novamente em instantes.",
+        headers={"Retry-After": str(math.ceil(e.retry_after))},
+    )
+
+
+# Instâncias globais
+rate_limiter = RateLimiter(make_bucket_store())
+llm_gate = AdmissionGate()
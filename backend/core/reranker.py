@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from core.config import (
+    RAG_RERANK,
+    RAG_RERANK_MODEL,
+    RAG_RERANK_STEPS,
+    RAG_RERANK_CANDIDATES,
+    RAG_RERANK_TOP_K,
+    RAG_RERANK_BUDGET_MS,
+    RAG_RERANK_BATCH,
+    RAG_RERANK_THREADS,
+    RAG_RERANK_MAX_LENGTH,
+)
+from core.metrics import metrics, span
+
+logger = logging.getLogger(__name__)
+
+rerank_fallbacks = metrics.counter(
+    "rerank_fallbacks_total", "Buscas que ficaram com a ordem do bi-encoder (motivo: budget, busy, error)"
+)
+
+
+def parse_steps(spec: str, default_top_k: int) -> Optional[Dict[str, int]]:
+    """
+    "icp,persona:3,swot" -> {"icp": 4, "persona": 3, "swot": 4} (top_k padrão
+    onde não informado). Vazio = todas as etapas (None).
+    """
+    spec = spec.strip()
+    if not spec:
+        return None
+    steps: Dict[str, int] = {}
+    for item in spec.split(","):
+        name, _, k = item.strip().partition(":")
+        if not name:
+            continue
+        try:
+            steps[name.strip()] = int(k) if k.strip() else default_top_k
+        except ValueError:
+            raise RuntimeError(f"RAG_RERANK_STEPS inválido: '{item}'. Use etapa ou etapa:top_k.")
+    return steps
+
+
+class _RerankCall:
+    """Lotes de uma busca: `left` ainda não terminados; `abandoned` depois que o orçamento estourou."""
+
+    __slots__ = ("left", "abandoned")
+
+    def __init__(self, batches: int) -> None:
+        self.left = batches
+        self.abandoned = False
+
+
+class CrossEncoderReranker:
+    """
+    Segunda etapa da busca: um cross-encoder pequeno pontua (pergunta, trecho)
+    para os candidatos da busca barata (bi-encoder + BM25) e devolve os
+    melhores. Os candidatos vão em lotes para um pool de threads próprio
+    (o uso de CPU fica limitado a `threads` lotes ao mesmo tempo) e cada
+    busca tem um orçamento de tempo: estourou, a busca fica com a ordem
+    original. Com todas as threads ocupadas nem tenta (motivo "busy").
+    Lotes de buscas que já desistiram não contam como ocupação: os que
+    ainda não começaram são pulados, e os que estão rodando terminam sem
+    segurar o contador.
+    """
+
+    def __init__(
+        self,
+        model_name: str = RAG_RERANK_MODEL,
+        enabled: bool = RAG_RERANK,
+        steps: str = RAG_RERANK_STEPS,
+        candidates: int = RAG_RERANK_CANDIDATES,
+        top_k: int = RAG_RERANK_TOP_K,
+        budget_ms: float = RAG_RERANK_BUDGET_MS,
+        batch_size: int = RAG_RERANK_BATCH,
+        threads: int = RAG_RERANK_THREADS,
+        max_length: int = RAG_RERANK_MAX_LENGTH,
+    ) -> None:
+        self.model_name = model_name
+        self.enabled = enabled
+        self.steps = parse_steps(steps, top_k)
+        self.candidates = max(1, candidates)
+        self.top_k = top_k
+        self.budget = max(0.0, budget_ms) / 1000
+        self.batch_size = max(1, batch_size)
+        self.threads = max(1, threads)
+        self.max_length = max_length
+
+        self._model = None
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # lotes aguardando ou rodando no pool para buscas que ainda esperam por eles
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self.load_seconds: Optional[float] = None
+
+    # ---------- Configuração ----------
+    def applies_to(self, step: Optional[str]) -> bool:
+        if not self.enabled:
+            return False
+        return self.steps is None or (step or "todas") in self.steps
+
+    def top_k_for(self, step: Optional[str], requested: int) -> int:
+        """Quantos trechos devolver depois do re-ranking (nunca mais que o pedido)."""
+        k = self.top_k if self.steps is None else self.steps.get(step or "todas", self.top_k)
+        return min(requested, k) if k > 0 else requested
+
+    # ---------- Modelo ----------
+    def load(self) -> None:
+        if self._model is not None or not self.enabled:
+            return
+        with self._lock:
+            if self._model is not None:
+                return
+            started = time.perf_counter()
+            from sentence_transformers import CrossEncoder
+
+            self._model = CrossEncoder(self.model_name, max_length=self.max_length)
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="rerank")
+            self.load_seconds = round(time.perf_counter() - started, 3)
+            logger.info(f"Cross-encoder '{self.model_name}' carregado em {self.load_seconds}s")
+
+    def _score_batch(self, call: _RerankCall, pairs: List[List[str]]) -> Optional[np.ndarray]:
+        with self._pending_lock:
+            if call.abandoned:
+                # a busca já seguiu com a ordem original: não gasta CPU com o lote
+                return None
+        try:
+            return np.asarray(self._model.predict(pairs, batch_size=len(pairs), show_progress_bar=False))
+        finally:
+            with self._pending_lock:
+                call.left -= 1
+                if not call.abandoned:
+                    self._pending -= 1
+
+    def _abandon(self, call: _RerankCall) -> None:
+        """Orçamento estourado: os lotes que faltam deixam de contar como ocupação."""
+        with self._pending_lock:
+            if not call.abandoned:
+                call.abandoned = True
+                self._pending -= call.left
+
+    # ---------- Re-ranking ----------
+    def rerank(self, query: str, texts: Sequence[str]) -> Optional[np.ndarray]:
+        """
+        Ordem dos `texts` pelo cross-encoder (índices, do mais relevante ao
+        menos) ou None se o orçamento estourou, o pool está ocupado ou deu erro.
+        """
+        if not texts:
+            return np.empty(0, dtype=np.int64)
+        self.load()
+
+        batches = [
+            [[query, t] for t in texts[i:i + self.batch_size]]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        with self._pending_lock:
+            if self._pending >= self.threads:
+                # outras buscas já ocupam todas as threads: esperar só estouraria o orçamento
+                rerank_fallbacks.inc(reason="busy")
+                return None
+            self._pending += len(batches)
+        call = _RerankCall(len(batches))
+
+        with span("rag.crossencoder"):
+            futures = [self._executor.submit(self._score_batch, call, b) for b in batches]
+            done, not_done = wait(futures, timeout=self.budget or None, return_when=FIRST_EXCEPTION)
+            if not_done:
+                self._abandon(call)
+                for fut in not_done:
+                    fut.cancel()
+                failed = any(f.exception() for f in done)
+                rerank_fallbacks.inc(reason="error" if failed else "budget")
+                return None
+            try:
+                scores = np.concatenate([f.result() for f in futures])
+            except Exception as e:
+                logger.error(f"Erro no cross-encoder: {e}")
+                rerank_fallbacks.inc(reason="error")
+                return None
+        # estável: empates mantêm a ordem da busca original
+        return np.argsort(-scores, kind="stable")
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "model": self.model_name,
+            "loaded": self._model is not None,
+            "load_seconds": self.load_seconds,
+            "steps": self.steps or "todas",
+            "candidates": self.candidates,
+            "top_k": self.top_k,
+            "budget_ms": self.budget * 1000,
+            "pending_batches": self._pending,
+        }
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+from typing import Tuple, Union
+
+import numpy as np
+
+
+# ---------- Normalização e top-k ----------
+def _normalize_rows(embs: np.ndarray) -> np.ndarray:
+    """L2-normaliza cada linha (linhas zeradas continuam zeradas, como no sklearn)."""
+    embs = np.asarray(embs, dtype=np.float32)
+    norms = np.linalg.norm(embs, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embs / norms
+
+
+def _top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    Índices dos top_k maiores scores, em ordem decrescente.
+    Usa argpartition (O(n)) e desempata pelo menor índice, reproduzindo
+    a ordenação estável usada antes (sort reverso sobre a lista completa).
+    """
+    n = scores.shape[0]
+    if top_k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+
+    if top_k < n:
+        part = np.argpartition(-scores, top_k - 1)[:top_k]
+        # inclui todos os empatados com o k-ésimo score para o desempate ser determinístico
+        kth = scores[part].min()
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(n)
+
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order[:top_k]]
+
+
+# ---------- Quantização int8 ----------
+def quantize_int8(embs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Quantização simétrica por linha: codes int8 em [-127, 127] e escala
+    float32 tal que linha ≈ codes * escala. Linhas zeradas ficam com escala 0.
+    """
+    embs = np.asarray(embs, dtype=np.float32)
+    scales = np.abs(embs).max(axis=1) / 127.0
+    safe = np.where(scales > 0, scales, 1.0)[:, None]
+    codes = np.clip(np.rint(embs / safe), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class QuantizedMatrix:
+    """
+    Matriz int8 com uma escala por linha (linha i ≈ codes[i] * scales[i]).
+    Indexar devolve as linhas já em float32; `dot` pontua em blocos sem
+    descomprimir a matriz inteira. Ocupa ~1/4 da versão float32.
+    """
+
+    def __init__(self, codes: np.ndarray, scales: np.ndarray) -> None:
+        if codes.shape[0] != scales.shape[0]:
+            raise ValueError("Número de linhas e de escalas não confere.")
+        self.codes = codes
+        self.scales = scales
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.codes.dtype
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scales.nbytes
+
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+
+    def __getitem__(self, idx) -> np.ndarray:
+        codes = np.asarray(self.codes[idx], dtype=np.float32)
+        scales = np.asarray(self.scales[idx], dtype=np.float32)
+        return codes * (scales[..., None] if codes.ndim == 2 else scales)
+
+    def dot(self, query: np.ndarray) -> np.ndarray:
+        """codes @ query com as escalas; `query` pode ser um vetor ou uma matriz (dim, m)."""
+        out = np.empty((self.codes.shape[0],) + query.shape[1:], dtype=np.float32)
+        for i in range(0, self.codes.shape[0], SCORE_BLOCK_ROWS):
+            block = self.codes[i:i + SCORE_BLOCK_ROWS].astype(np.float32)
+            scales = self.scales[i:i + SCORE_BLOCK_ROWS]
+            out[i:i + SCORE_BLOCK_ROWS] = (block @ query) * (scales[:, None] if query.ndim == 2 else scales)
+        return out
+
+
+Matrix = Union[np.ndarray, QuantizedMatrix]
+
+
+# ---------- Produto escalar ----------
+# Blocos de linhas convertidos para float32 por vez ao pontuar matrizes float16/int8.
+# Pequenos o bastante para o bloco convertido caber no cache da CPU (~1.5 MB com dim 384).
+SCORE_BLOCK_ROWS = 1024
+
+
+def _dot(embeddings: Matrix, query: np.ndarray) -> np.ndarray:
+    """
+    embeddings @ query em float32, sem converter a matriz inteira de uma vez.
+    `query` pode ser uma matriz (dim, m): pontua m perguntas numa passada pela base.
+    """
+    if isinstance(embeddings, QuantizedMatrix):
+        return embeddings.dot(query)
+    if embeddings.dtype == np.float32:
+        return embeddings @ query
+    out = np.empty((embeddings.shape[0],) + query.shape[1:], dtype=np.float32)
+    for i in range(0, embeddings.shape[0], SCORE_BLOCK_ROWS):
+        out[i:i + SCORE_BLOCK_ROWS] = embeddings[i:i + SCORE_BLOCK_ROWS].astype(np.float32) @ query
+    return out
+
+
+def rerank_exact(full: np.ndarray, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """Reordena `rows` pelos vetores float32 originais (desempate pelo menor índice)."""
+    if rows.size == 0:
+        return rows
+    scores = np.asarray(full[rows], dtype=np.float32) @ query
+    return rows[np.lexsort((rows, -scores))]
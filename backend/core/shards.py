@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import (
+    TENANTS_DIR,
+    RAG_TENANT_MAX_LOADED,
+    RAG_TENANT_IDLE_SECONDS,
+    RAG_MAX_CHUNKS_PER_PARENT,
+    RAG_RRF_K,
+)
+from core.lexical import reciprocal_rank_fusion
+from core.metrics import metrics, span
+from core.rag_engine import RAGEngine, KnowledgeDoc, rag_engine
+
+logger = logging.getLogger(__name__)
+
+tenant_loads = metrics.counter("rag_tenant_loads_total", "Bases de startups carregadas do disco")
+tenant_evictions = metrics.counter("rag_tenant_evictions_total", "Bases de startups descarregadas (motivo: lru, idle)")
+
+_UNSAFE = re.compile(r"[^a-z0-9_-]+")
+
+
+@dataclass
+class _Shard:
+    engine: RAGEngine
+    # identidade do manifesto na última verificação (publicações de outros workers)
+    signature: Optional[Tuple[int, int, int]]
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class KnowledgeShards:
+    """
+    Base global (trilha FCJ, `rag_engine`) + uma base privada por startup
+    (claim "startup" do JWT), cada uma com seu manifesto, gerações, arquivo
+    de embeddings e índice em DATA_DIR/tenants/<startup>/.
+
+    As bases das startups são carregadas no primeiro uso e ficam no máximo
+    `max_loaded` em memória (LRU); sem uso por `idle_seconds`, saem também.
+    Todas compartilham o modelo, o cross-encoder e o cache de perguntas da
+    global. Uma busca consulta a base global e a da startup (scatter-gather)
+    e junta os melhores trechos pelo cosseno com a pergunta; o cross-encoder,
+    se ligado, roda uma vez sobre o resultado já junto. Startups sem material
+    próprio só consultam a global, como antes.
+    """
+
+    def __init__(
+        self,
+        global_engine: RAGEngine,
+        tenants_dir: Path = TENANTS_DIR,
+        max_loaded: int = RAG_TENANT_MAX_LOADED,
+        idle_seconds: float = RAG_TENANT_IDLE_SECONDS,
+    ) -> None:
+        self.global_engine = global_engine
+        self.tenants_dir = tenants_dir
+        self.max_loaded = max(1, max_loaded)
+        self.idle_seconds = idle_seconds
+
+        self._shards: "OrderedDict[str, _Shard]" = OrderedDict()
+        self._lock = threading.Lock()
+        # um load por startup ao mesmo tempo (chamadas concorrentes esperam o primeiro)
+        self._load_locks: Dict[str, threading.Lock] = {}
+
+    # ---------- Bases das startups ----------
+    @staticmethod
+    def tenant_key(startup: str) -> str:
+        """Nome do diretório da startup: legível e sem colisão entre nomes parecidos."""
+        slug = _UNSAFE.sub("-", startup.strip().lower()).strip("-")[:40] or "startup"
+        return f"{slug}-{hashlib.sha1(startup.encode('utf-8')).hexdigest()[:10]}"
+
+    def tenant_dir(self, startup: str) -> Path:
+        return self.tenants_dir / self.tenant_key(startup)
+
+    def has_tenant(self, startup: Optional[str]) -> bool:
+        """True se a startup já enviou material (existe base publicada em disco)."""
+        return bool(startup) and (self.tenant_dir(startup) / "manifest.json").exists()
+
+    def tenant(self, startup: str, create: bool = False) -> Optional[RAGEngine]:
+        """
+        Base da startup, carregada se preciso (None se ela não tem material e
+        `create` é falso). Chamar fora do event loop: o load lê o disco.
+        """
+        key = self.tenant_key(startup)
+        with self._lock:
+            self._evict_idle_locked()
+            shard = self._shards.get(key)
+            if shard is not None:
+                self._shards.move_to_end(key)
+                shard.last_used = time.monotonic()
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        if shard is not None:
+            # upload da startup publicado por outro worker: um stat por busca
+            signature = shard.engine.snapshots.signature()
+            if signature != shard.signature:
+                shard.engine.refresh()
+                shard.signature = signature
+            return shard.engine
+
+        if not create and not self.has_tenant(startup):
+            return None
+        with load_lock:
+            with self._lock:
+                shard = self._shards.get(key)
+            if shard is not None:
+                return shard.engine
+            engine = RAGEngine(
+                self.global_engine.embedder,
+                self.global_engine.reranker,
+                data_dir=self.tenant_dir(startup),
+                query_cache=self.global_engine.query_cache,
+                encoder=self.global_engine.encoder,
+            )
+            engine.load()
+            tenant_loads.inc()
+            with self._lock:
+                self._shards[key] = _Shard(engine, engine.snapshots.signature())
+                self._evict_lru_locked()
+            logger.info(f"Base da startup '{startup}' carregada ({engine.get_stats()['chunks']} chunks)")
+            return engine
+
+    def _evict_lru_locked(self) -> None:
+        while len(self._shards) > self.max_loaded:
+            key, _ = self._shards.popitem(last=False)
+            tenant_evictions.inc(reason="lru")
+            logger.info(f"Base da startup {key} descarregada (LRU)")
+
+    def _evict_idle_locked(self) -> None:
+        if self.idle_seconds <= 0:
+            return
+        cutoff = time.monotonic() - self.idle_seconds
+        # ordem de uso: as mais antigas ficam no começo
+        while self._shards:
+            key, shard = next(iter(self._shards.items()))
+            if shard.last_used >= cutoff:
+                break
+            del self._shards[key]
+            tenant_evictions.inc(reason="idle")
+            logger.info(f"Base da startup {key} descarregada (sem uso)")
+
+    def tenant_version(self, startup: Optional[str]) -> Optional[int]:
+        """Versão publicada da base da startup (None se ela não tem material)."""
+        engine = self.tenant(startup) if startup else None
+        return engine.snapshot_version if engine is not None else None
+
+    # ---------- Busca ----------
+    def search_by_embedding(
+        self,
+        q_emb: np.ndarray,
+        top_k: int = 5,
+        step_filter: Optional[str] = None,
+        max_per_parent: int = RAG_MAX_CHUNKS_PER_PARENT,
+        query: Optional[str] = None,
+        startup: Optional[str] = None,
+    ) -> List[KnowledgeDoc]:
+        """
+        Busca na base global e na da startup. As listas de cada base (já na
+        ordem híbrida densa + BM25) são juntadas por Reciprocal Rank Fusion,
+        como a densa e a BM25 dentro de cada base, e o limite por deck é
+        aplicado de novo na lista final.
+        """
+        tenant = self.tenant(startup) if startup else None
+        if tenant is None:
+            return self.global_engine.search_by_embedding(q_emb, top_k, step_filter, max_per_parent, query)
+
+        n_results = self.global_engine.results_for(query, step_filter, top_k)
+        gathered: List[KnowledgeDoc] = []
+        rankings: List[np.ndarray] = []
+        with span("rag.scatter"):
+            for engine in (self.global_engine, tenant):
+                docs = [doc for doc, _ in engine.search_scored(q_emb, n_results, step_filter, max_per_parent, query)]
+                # posições na lista `gathered`: empates no RRF ficam com a base global, que vem primeiro
+                rankings.append(np.arange(len(gathered), len(gathered) + len(docs)))
+                gathered.extend(docs)
+        with span("rag.fusion"):
+            fused = [gathered[i] for i in reciprocal_rank_fusion(rankings, RAG_RRF_K)]
+            merged = RAGEngine._dedupe_by_parent(fused, n_results, max_per_parent)
+        return self.global_engine.rerank_results(query, step_filter, merged, top_k)
+
+    # ---------- Info ----------
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            loaded = {key: shard.engine.get_stats()["chunks"] for key, shard in self._shards.items()}
+        return {
+            "tenants_loaded": len(loaded),
+            "max_loaded": self.max_loaded,
+            "idle_seconds": self.idle_seconds,
+            "chunks_loaded": sum(loaded.values()),
+        }
+
+
+# Instância global, como rag_engine
+knowledge = KnowledgeShards(rag_engine)
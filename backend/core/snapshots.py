@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows (só desenvolvimento local, um processo)
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_GEN_RE = re.compile(r"^gen-(\d+)$")
+
+
+@dataclass(frozen=True)
+class Manifest:
+    """
+    Versão publicada da base. Tudo que um leitor precisa para abrir um
+    snapshot consistente: a geração (diretório) e até onde ler cada arquivo.
+    """
+    version: int
+    generation: int
+    rows: int = 0
+    dim: int = 0
+    dtype: str = "float32"
+    docs_bytes: int = 0
+    deleted_bytes: int = 0
+    # arquivo do índice vetorial dentro da geração ("" = reconstruir no load)
+    index: str = ""
+    created_at: float = 0.0
+
+    def next(self, **changes) -> "Manifest":
+        return replace(self, version=self.version + 1, created_at=time.time(), **changes)
+
+
+def _fsync_dir(path: Path) -> None:
+    if os.name != "posix":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class SnapshotStore:
+    """
+    Diretório da base compartilhado entre workers (uvicorn --workers N,
+    gunicorn) e hosts com o mesmo volume:
+
+    - manifest.json: versão atual, trocado atomicamente (tmp + os.replace).
+      É o commit: leitores só enxergam o que ele publica.
+    - snapshots/gen-N/: arquivos de uma geração. Appends e remoções ficam na
+      mesma geração; compactação e troca de dtype criam a próxima, então
+      leitores da anterior continuam com seus arquivos intactos.
+    - .write.lock: flock exclusivo, uma escrita por vez entre processos.
+    """
+
+    # gerações mantidas em disco: a atual e a anterior (leitores em andamento)
+    KEEP_GENERATIONS = 2
+    # arquivos de índice mantidos por geração
+    KEEP_INDEXES = 2
+
+    def __init__(self, manifest_path: Path, snapshots_dir: Path, lock_path: Path) -> None:
+        self.manifest_path = manifest_path
+        self.snapshots_dir = snapshots_dir
+        self.lock_path = lock_path
+        # flock vale por descritor; o lock de thread evita reentrância no mesmo processo
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_fd: Optional[int] = None
+
+    # ---------- Manifesto ----------
+    def signature(self) -> Optional[Tuple[int, int, int]]:
+        """Identidade barata do manifesto atual (um stat), para detectar publicações."""
+        try:
+            st = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def read(self) -> Optional[Manifest]:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        fields = Manifest.__dataclass_fields__
+        return Manifest(**{k: v for k, v in data.items() if k in fields})
+
+    def publish(self, manifest: Manifest) -> None:
+        """Grava o manifesto em um arquivo temporário e troca de uma vez."""
+        tmp = self.manifest_path.with_name(f"{self.manifest_path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(asdict(manifest), f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.manifest_path)
+        _fsync_dir(self.manifest_path.parent)
+
+    # ---------- Gerações ----------
+    def generation_dir(self, generation: int) -> Path:
+        return self.snapshots_dir / f"gen-{generation:06d}"
+
+    def new_generation(self, generation: int) -> Path:
+        """Diretório vazio para uma nova geração (restos de tentativas anteriores são apagados)."""
+        path = self.generation_dir(generation)
+        if path.exists():
+            shutil.rmtree(path)
+        path.mkdir(parents=True)
+        return path
+
+    def generations(self) -> List[int]:
+        if not self.snapshots_dir.exists():
+            return []
+        found = (_GEN_RE.match(p.name) for p in self.snapshots_dir.iterdir())
+        return sorted(int(m.group(1)) for m in found if m)
+
+    def cleanup(self, manifest: Manifest) -> None:
+        """Apaga gerações e índices antigos (chamado com o write lock, após publicar)."""
+        for generation in self.generations():
+            if generation <= manifest.generation - self.KEEP_GENERATIONS or generation > manifest.generation:
+                shutil.rmtree(self.generation_dir(generation), ignore_errors=True)
+
+        indexes = sorted(self.generation_dir(manifest.generation).glob("index-*.npz"))
+        keep = set(indexes[-self.KEEP_INDEXES:]) | {self.generation_dir(manifest.generation) / manifest.index}
+        for path in indexes:
+            if path not in keep:
+                path.unlink(missing_ok=True)
+
+    # ---------- Lock entre processos ----------
+    @contextmanager
+    def write_lock(self) -> Iterator[None]:
+        """Exclusão mútua das escritas entre workers (reentrante na mesma thread)."""
+        with self._thread_lock:
+            if self._lock_depth == 0 and fcntl is not None:
+                fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                self._lock_fd = fd
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and self._lock_fd is not None:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+                    os.close(self._lock_fd)
+                    self._lock_fd = None
@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from core.config import (
+    RAG_INDEX_BACKEND,
+    RAG_IVF_NLIST,
+    RAG_IVF_NPROBE,
+    RAG_IVF_MIN_ROWS,
+)
+from core.scoring import Matrix, _normalize_rows, _top_k_indices, _dot
+
+
+# ---------- Índices ----------
+class VectorIndex(ABC):
+    """
+    Interface dos índices vetoriais do RAGEngine.
+    O índice não guarda os vetores: recebe a matriz de embeddings
+    (já normalizada) em cada chamada e devolve números de linha.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def build(self, embeddings: Matrix) -> None:
+        ...
+
+    @abstractmethod
+    def add(self, embeddings: Matrix, start: int) -> None:
+        """Indexa as linhas embeddings[start:] (recém-adicionadas)."""
+
+    @abstractmethod
+    def search(
+        self,
+        embeddings: Matrix,
+        query: np.ndarray,
+        top_k: int,
+        rows: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """Linhas dos top_k vetores mais similares, restritas a `rows` (ordenado) se informado."""
+
+    def save(self, path: Path) -> None:
+        pass
+
+    def load(self, path: Path, embeddings: Matrix) -> None:
+        self.build(embeddings)
+
+
+class ExactIndex(VectorIndex):
+    """Varredura exata (produto escalar em todas as linhas). Padrão."""
+
+    name = "exact"
+
+    def build(self, embeddings: Matrix) -> None:
+        pass
+
+    def add(self, embeddings: Matrix, start: int) -> None:
+        pass
+
+    def search(
+        self,
+        embeddings: Matrix,
+        query: np.ndarray,
+        top_k: int,
+        rows: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        if rows is None:
+            return _top_k_indices(_dot(embeddings, query), top_k)
+        if rows.size == 0:
+            return rows
+        if rows.size * 2 > embeddings.shape[0]:
+            # filtro cobre a maior parte da base: pontuar tudo evita copiar as linhas
+            return rows[_top_k_indices(_dot(embeddings, query)[rows], top_k)]
+        return rows[_top_k_indices(_dot(embeddings[rows], query), top_k)]
+
+
+class IVFIndex(VectorIndex):
+    """
+    Índice IVF (inverted file) em NumPy puro.
+    Um k-means esférico particiona os vetores em `nlist` listas; a busca
+    pontua só as `nprobe` listas cujos centróides são mais próximos da query.
+    Novas linhas são atribuídas ao centróide mais próximo sem retreinar;
+    o k-means é refeito quando a base cresce 4x desde o último treino.
+    Abaixo de `min_rows` linhas a busca é exata (mais rápida nessa escala).
+    As listas são montadas no build/add (escrita); a busca, que roda em
+    várias threads, só lê o estado sob o lock.
+    """
+
+    name = "ivf"
+    RETRAIN_GROWTH = 4
+    KMEANS_ITERS = 12
+    SAMPLE_PER_LIST = 64
+
+    def __init__(
+        self,
+        nlist: int = RAG_IVF_NLIST,
+        nprobe: int = RAG_IVF_NPROBE,
+        min_rows: int = RAG_IVF_MIN_ROWS,
+        seed: int = 0,
+    ) -> None:
+        self.nlist_config = nlist
+        self.nprobe = nprobe
+        self.min_rows = min_rows
+        self.seed = seed
+
+        self.centroids: Optional[np.ndarray] = None
+        self.assign = np.empty(0, dtype=np.int32)
+        self.trained_rows = 0
+        # listas em formato CSR: (linhas ordenadas por lista, offsets).
+        # Sempre substituídas por arrays novos, nunca alteradas in-place,
+        # para que cópias rasas do índice (commit da engine) fiquem independentes.
+        self._lists = (np.empty(0, dtype=np.int64), np.zeros(1, dtype=np.int64))
+        self._lock = threading.Lock()
+
+    # ---------- Treino ----------
+    def _nlist_for(self, n: int) -> int:
+        if self.nlist_config > 0:
+            return min(self.nlist_config, n)
+        return max(1, min(int(np.sqrt(n)) * 2, 4096, n))
+
+    def _kmeans(self, embeddings: Matrix, nlist: int) -> np.ndarray:
+        rng = np.random.default_rng(self.seed)
+        n = embeddings.shape[0]
+        sample_size = min(n, nlist * self.SAMPLE_PER_LIST)
+        sample = embeddings[np.sort(rng.choice(n, sample_size, replace=False))]
+        sample = np.asarray(sample, dtype=np.float32)
+
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(self.KMEANS_ITERS):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            if empty.any():
+                # lista vazia: reinicia com pontos aleatórios da amostra
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = _normalize_rows(sums)
+        return centroids
+
+    @staticmethod
+    def _assign(embeddings: Matrix, centroids: np.ndarray, batch: int = 8192) -> np.ndarray:
+        out = np.empty(embeddings.shape[0], dtype=np.int32)
+        for i in range(0, embeddings.shape[0], batch):
+            block = np.asarray(embeddings[i:i + batch], dtype=np.float32)
+            out[i:i + batch] = np.argmax(block @ centroids.T, axis=1)
+        return out
+
+    def build(self, embeddings: Matrix) -> None:
+        n = embeddings.shape[0]
+        if n < self.min_rows:
+            self._set(None, np.empty(0, dtype=np.int32), 0)
+            return
+
+        centroids = self._kmeans(embeddings, self._nlist_for(n))
+        self._set(centroids, self._assign(embeddings, centroids), n)
+
+    def add(self, embeddings: Matrix, start: int) -> None:
+        n = embeddings.shape[0]
+        if self.centroids is None or n >= self.trained_rows * self.RETRAIN_GROWTH:
+            self.build(embeddings)
+            return
+        assign = np.concatenate([self.assign[:start], self._assign(embeddings[start:], self.centroids)])
+        self._set(self.centroids, assign, self.trained_rows)
+
+    def _set(self, centroids: Optional[np.ndarray], assign: np.ndarray, trained_rows: int) -> None:
+        """Troca centróides, atribuições e listas de uma vez."""
+        if centroids is None:
+            lists = (np.empty(0, dtype=np.int64), np.zeros(1, dtype=np.int64))
+        else:
+            list_rows = np.argsort(assign, kind="stable").astype(np.int64)
+            counts = np.bincount(assign, minlength=centroids.shape[0])
+            lists = (list_rows, np.concatenate([[0], np.cumsum(counts)]).astype(np.int64))
+        with self._lock:
+            self.centroids = centroids
+            self.assign = assign
+            self.trained_rows = trained_rows
+            self._lists = lists
+
+    # ---------- Busca ----------
+    def search(
+        self,
+        embeddings: Matrix,
+        query: np.ndarray,
+        top_k: int,
+        rows: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        exact = ExactIndex()
+        with self._lock:
+            centroids, assign, (list_rows, offsets) = self.centroids, self.assign, self._lists
+        if centroids is None or assign.shape[0] != embeddings.shape[0]:
+            return exact.search(embeddings, query, top_k, rows)
+
+        nprobe = min(self.nprobe, centroids.shape[0])
+        probes = _top_k_indices(centroids @ query, nprobe)
+        parts: List[np.ndarray] = [list_rows[offsets[c]:offsets[c + 1]] for c in probes]
+        candidates = np.sort(np.concatenate(parts))
+
+        if rows is not None:
+            # filtro pequeno: mais barato varrer só as linhas do filtro
+            if rows.size <= candidates.size:
+                return exact.search(embeddings, query, top_k, rows)
+            pos = np.searchsorted(rows, candidates)
+            pos[pos >= rows.size] = 0
+            candidates = candidates[rows[pos] == candidates]
+
+        if candidates.size < top_k:
+            return exact.search(embeddings, query, top_k, rows)
+        return candidates[_top_k_indices(_dot(embeddings[candidates], query), top_k)]
+
+    # ---------- Persistência ----------
+    def save(self, path: Path) -> None:
+        if self.centroids is None:
+            if path.exists():
+                path.unlink()
+            return
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                assign=self.assign,
+                trained_rows=np.array(self.trained_rows),
+            )
+
+    def load(self, path: Path, embeddings: Matrix) -> None:
+        if not path.exists():
+            self.build(embeddings)
+            return
+
+        with np.load(path) as data:
+            self._set(data["centroids"], data["assign"], int(data["trained_rows"]))
+
+        n_indexed = self.assign.shape[0]
+        if n_indexed > embeddings.shape[0] or self.centroids.shape[1] != embeddings.shape[1]:
+            # arquivo de índice não corresponde aos embeddings: reconstrói
+            self.build(embeddings)
+        elif n_indexed < embeddings.shape[0]:
+            self.add(embeddings, n_indexed)
+
+
+def make_index(backend: str = RAG_INDEX_BACKEND) -> VectorIndex:
+    backends = {"exact": ExactIndex, "ivf": IVFIndex}
+    if backend not in backends:
+        raise RuntimeError(
+            f"RAG_INDEX_BACKEND inválido: '{backend}'. Use um de: {', '.join(backends)}"
+        )
+    return backends[backend]()
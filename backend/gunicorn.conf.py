@@ -0,0 +1,13 @@
+# Produção com vários workers compartilhando o modelo:
+#   cd backend && gunicorn main:app -c gunicorn.conf.py
+# preload_app importa o main no master (RAG_PRELOAD carrega modelo e base
+# uma vez) e os workers são criados por fork, herdando as páginas.
+import os
+
+os.environ.setdefault("RAG_PRELOAD", "true")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = 120
@@ -1,14 +1,25 @@
+import time
+
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
+from fastapi.responses import JSONResponse, PlainTextResponse
+import asyncio
 import os
 import logging
 
 from api.agent import router as agent_router
 from api.admin import router as admin_router
 from api.auth import router as auth_router
+from core.config import RAG_PRELOAD, RAG_LOAD_RETRY_MIN, RAG_LOAD_RETRY_MAX, METRICS_ENABLED, METRICS_TOKEN
+from core.metrics import metrics, MetricsMiddleware, Counter, Gauge
+from core.rag_engine import rag_engine
+from core.shards import knowledge
+from services.answer_cache import answer_cache
+from services.openai_client import close_client
 
 # Configurar logging
 logging.basicConfig(
@@ -17,19 +28,48 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Rate limiter
-limiter = Limiter(key_func=get_remote_address)
+IMPORT_SECONDS = round(time.perf_counter() - _import_started, 3)
+logger.info(f"Módulos da API importados em {IMPORT_SECONDS}s")
+
+# Com gunicorn --preload o main é importado no master: o modelo e a base
+# carregam uma vez e os workers herdam as páginas por copy-on-write.
+if RAG_PRELOAD:
+    rag_engine.load()
+
+
+async def _load_rag() -> None:
+    # falha no load (sidecar ainda subindo, disco, download do modelo) não é
+    # definitiva: tenta de novo com backoff até conseguir
+    delay = RAG_LOAD_RETRY_MIN
+    while True:
+        try:
+            await asyncio.to_thread(rag_engine.load)
+            return
+        except Exception as e:
+            logger.error(f"Falha ao carregar o RAG: {e}; nova tentativa em {delay:g}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, RAG_LOAD_RETRY_MAX)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Carrega modelo e base em segundo plano: a porta abre na hora e
+    # /ready responde 503 até terminar (no-op se já pré-carregado).
+    loading = asyncio.create_task(_load_rag())
+    # cada worker acompanha as versões da base publicadas pelos outros
+    rag_engine.start_watcher()
+    yield
+    loading.cancel()
+    await close_client()
+
 
 app = FastAPI(
     title="TR4CTION Agent Backend",
     version="1.0.0",
     description="Backend FastAPI com RAG + OpenAI para o agente TR4CTION.",
+    lifespan=lifespan,
 )
 
-# Adicionar rate limiter ao app
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-
 # CORS - Configurado para produção e desenvolvimento
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "http://localhost:5500,http://127.0.0.1:5500").split(",")
 ALLOWED_ORIGINS = [origin.strip() for origin in ALLOWED_ORIGINS]  # Remove espaços extras
@@ -42,8 +82,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+if METRICS_ENABLED:
+    # depois do CORS: o add_middleware empilha, este fica por fora e mede tudo
+    app.add_middleware(MetricsMiddleware)
+
 app.include_router(auth_router)
 app.include_router(agent_router)
 app.include_router(admin_router)
@@ -52,3 +97,51 @@ app.include_router(admin_router)
 @app.get("/")
 def root():
     return {"status": "ok", "message": "TR4CTION backend operacional"}
+
+
+@app.get("/ready")
+def ready():
+    """Readiness: 200 quando modelo e base estão carregados, 503 enquanto carregam."""
+    info = {**rag_engine.readiness(), "import_seconds": IMPORT_SECONDS}
+    return JSONResponse(status_code=200 if info["ready"] else 503, content=info)
+
+
+def _cache_metrics():
+    """Contadores dos caches e estado do RAG, lidos na hora do scrape."""
+    hits = Counter("cache_hits_total", "Acertos dos caches")
+    misses = Counter("cache_misses_total", "Faltas dos caches")
+    hit_ratio = Gauge("cache_hit_ratio", "Taxa de acerto dos caches desde o início do worker")
+    entries = Gauge("cache_entries", "Entradas em memória nos caches")
+    for name, stats in (("query_embeddings", rag_engine.query_cache.stats()), ("answers", answer_cache.stats())):
+        if not stats.get("enabled", True):
+            continue
+        hits.inc(stats["hits"], cache=name)
+        misses.inc(stats["misses"], cache=name)
+        hit_ratio.set(stats["hit_rate"], cache=name)
+        entries.set(stats["size"], cache=name)
+
+    rag = Gauge("rag_ready", "1 quando modelo e base estão carregados")
+    rag.set(1 if rag_engine.ready else 0)
+    chunks = Gauge("rag_chunks", "Chunks na base de conhecimento")
+    chunks.set(rag_engine.get_stats()["chunks"] if rag_engine.ready else 0)
+    snapshot = Gauge("rag_snapshot_version", "Versão da base (manifesto) carregada neste worker")
+    snapshot.set(rag_engine.snapshot_version)
+    shards = knowledge.stats()
+    tenants = Gauge("rag_tenants_loaded", "Bases de startups em memória neste worker")
+    tenants.set(shards["tenants_loaded"])
+    tenant_chunks = Gauge("rag_tenant_chunks_loaded", "Chunks das bases de startups em memória")
+    tenant_chunks.set(shards["chunks_loaded"])
+    return [hits, misses, hit_ratio, entries, rag, chunks, snapshot, tenants, tenant_chunks]
+
+
+metrics.add_collector(_cache_metrics)
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics(request: Request):
+    """Métricas deste worker no formato texto do Prometheus."""
+    if not METRICS_ENABLED:
+        return JSONResponse(status_code=404, content={"detail": "Not Found"})
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        return JSONResponse(status_code=401, content={"detail": "Token de métricas inválido."})
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
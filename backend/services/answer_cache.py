@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import (
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_TTL,
+    ANSWER_CACHE_THRESHOLD,
+)
+
+# (step, ids dos documentos recuperados, modelo, escopo)
+CacheKey = Tuple[str, Tuple[str, ...], str, str]
+
+
+@dataclass
+class _Entry:
+    key: CacheKey
+    q_emb: np.ndarray
+    answer: str
+    created: float
+
+
+class SemanticAnswerCache:
+    """
+    Cache de respostas do modelo na frente do chat_completion.
+
+    Uma resposta é reaproveitada quando step, documentos recuperados, modelo
+    e escopo (startup, ou "" se compartilhado) são iguais e a pergunta tem
+    similaridade de cosseno >= threshold com a pergunta original.
+    LRU limitado a max_entries, com TTL, e invalidado inteiro quando a
+    versão da base de conhecimento muda (upload, reload). Respostas geradas
+    sobre uma versão anterior à atual (reload no meio da geração) não entram.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_SIZE,
+        ttl_seconds: float = ANSWER_CACHE_TTL,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._by_key: Dict[CacheKey, List[int]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._kb_version: Optional[int] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _check_version(self, kb_version: int) -> bool:
+        """Avança para kb_version se ela é nova; False se é anterior à atual."""
+        if self._kb_version is not None and kb_version < self._kb_version:
+            return False
+        if self._kb_version != kb_version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._by_key.clear()
+            self._kb_version = kb_version
+        return True
+
+    def _drop(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        ids = self._by_key.get(entry.key)
+        if ids is not None:
+            ids.remove(entry_id)
+            if not ids:
+                del self._by_key[entry.key]
+
+    def lookup(self, key: CacheKey, q_emb: np.ndarray, kb_version: int) -> Optional[str]:
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            if not self._check_version(kb_version):
+                self.misses += 1
+                return None
+
+            best_id, best_sim = None, self.threshold
+            for entry_id in list(self._by_key.get(key, ())):
+                entry = self._entries[entry_id]
+                if now - entry.created > self.ttl_seconds:
+                    self._drop(entry_id)
+                    continue
+                sim = float(entry.q_emb @ q_emb)
+                if sim >= best_sim:
+                    best_id, best_sim = entry_id, sim
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id].answer
+
+    def store(self, key: CacheKey, q_emb: np.ndarray, answer: str, kb_version: int) -> None:
+        if not self.enabled or not answer:
+            return
+
+        with self._lock:
+            if not self._check_version(kb_version):
+                return
+
+            entry_id = next(self._ids)
+            self._entries[entry_id] = _Entry(key, np.asarray(q_emb, dtype=np.float32), answer, time.time())
+            self._by_key.setdefault(key, []).append(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_key.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Instância global (por worker)
+answer_cache = SemanticAnswerCache()
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import logging
+import math
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from core.config import (
+    OPENAI_MODEL,
+    PROMPT_CONTEXT_TOKENS,
+    PROMPT_HISTORY_TOKENS,
+    PROMPT_MAX_TOKENS,
+)
+from core.rag_engine import KnowledgeDoc
+
+logger = logging.getLogger(__name__)
+
+# Custo fixo por mensagem no formato de chat da OpenAI (papel + separadores)
+MESSAGE_OVERHEAD = 4
+REPLY_PRIMING = 3
+# Estimativa sem tokenizer: ~4 caracteres por token
+CHARS_PER_TOKEN = 4
+# Espaço mínimo para valer a pena incluir o resumo do histórico antigo
+MIN_SUMMARY_TOKENS = 32
+SUMMARY_LINE_TOKENS = 24
+# Fração do orçamento do histórico reservada ao resumo quando nem tudo cabe
+SUMMARY_SHARE = 0.25
+# A janela do histórico avança de N em N mensagens: entre um corte e outro o
+# começo do prompt (system + resumo + mensagens) não muda, e o cache de
+# prefixo do provedor continua acertando
+HISTORY_TRIM_STEP = 8
+
+
+# ============================================================
+# CONTAGEM DE TOKENS
+# ============================================================
+
+class TokenCounter:
+    """
+    Conta tokens com o tiktoken do modelo configurado.
+    O tiktoken é opcional: se não estiver instalado (ou não conseguir
+    baixar o vocabulário), usa a estimativa de CHARS_PER_TOKEN.
+    O encoder só é carregado na primeira contagem.
+    """
+
+    def __init__(self, model: str = OPENAI_MODEL) -> None:
+        self.model = model
+        self._enc = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _encoder(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._enc = self._load_encoder()
+                    self._loaded = True
+        return self._enc
+
+    def _load_encoder(self):
+        try:
+            import tiktoken
+        except ImportError:
+            logger.warning("tiktoken não instalado: contagem de tokens estimada por caracteres")
+            return None
+        try:
+            try:
+                return tiktoken.encoding_for_model(self.model)
+            except KeyError:
+                return tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.warning(f"Tokenizer indisponível ({e}): contagem de tokens estimada por caracteres")
+            return None
+
+    @property
+    def exact(self) -> bool:
+        return self._encoder() is not None
+
+    def count(self, text: str) -> int:
+        enc = self._encoder()
+        if enc is None:
+            return math.ceil(len(text) / CHARS_PER_TOKEN)
+        return len(enc.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Corta o texto em no máximo max_tokens tokens."""
+        if max_tokens <= 0:
+            return ""
+        enc = self._encoder()
+        if enc is None:
+            return text[:max_tokens * CHARS_PER_TOKEN]
+        tokens = enc.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return enc.decode(tokens[:max_tokens])
+
+    def count_message(self, message: Dict[str, Any]) -> int:
+        return self.count(message.get("content") or "") + MESSAGE_OVERHEAD
+
+    def count_messages(self, messages: Sequence[Dict[str, Any]]) -> int:
+        return sum(self.count_message(m) for m in messages) + REPLY_PRIMING
+
+
+# Instância global
+token_counter = TokenCounter()
+
+
+# ============================================================
+# CONTEXTO RAG
+# ============================================================
+
+@dataclass
+class PackedContext:
+    text: str
+    docs: List[KnowledgeDoc]
+    tokens: int
+
+
+def _doc_block(i: int, doc: KnowledgeDoc, text: str) -> str:
+    slides = f" [slides {doc.slide_start}-{doc.slide_end}]" if doc.slide_start else ""
+    return f"[DOC {i}] ({doc.step}) {doc.title}{slides}\n{text}"
+
+
+def pack_context(
+    docs: Sequence[KnowledgeDoc],
+    budget: int = PROMPT_CONTEXT_TOKENS,
+    counter: TokenCounter = token_counter,
+) -> PackedContext:
+    """
+    Preenche o orçamento com chunks inteiros, na ordem de relevância da busca.
+    Um chunk que não cabe é pulado (os seguintes, menores, ainda podem caber);
+    só o primeiro é truncado, se sozinho já passar do orçamento.
+    """
+    blocks: List[str] = []
+    used_docs: List[KnowledgeDoc] = []
+    used = 0
+    for doc in docs:
+        # blocos separados por uma linha em branco (~1 token)
+        sep = 1 if blocks else 0
+        block = _doc_block(len(blocks) + 1, doc, doc.text or "")
+        cost = counter.count(block)
+        if used + sep + cost > budget:
+            if blocks:
+                continue
+            header_cost = counter.count(_doc_block(1, doc, ""))
+            block = _doc_block(1, doc, counter.truncate(doc.text or "", budget - header_cost))
+            cost = counter.count(block)
+            if cost > budget:
+                continue
+        blocks.append(block)
+        used_docs.append(doc)
+        used += sep + cost
+    return PackedContext("\n\n".join(blocks), used_docs, used)
+
+
+# ============================================================
+# HISTÓRICO
+# ============================================================
+
+def _summarize_dropped(
+    dropped: Sequence[Dict[str, Any]],
+    budget: int,
+    counter: TokenCounter,
+) -> Optional[Dict[str, Any]]:
+    """
+    Resumo extrativo (sem chamar o modelo) das mensagens antigas que não
+    couberam: o começo de cada uma, das mais recentes para as mais antigas,
+    até o orçamento acabar.
+    """
+    header = "Resumo das mensagens anteriores desta conversa (início de cada uma):"
+    used = counter.count(header) + MESSAGE_OVERHEAD
+    if budget - used < MIN_SUMMARY_TOKENS:
+        return None
+
+    lines: List[str] = []
+    for msg in reversed(dropped):
+        who = "Founder" if msg["role"] == "user" else "Agente"
+        snippet = " ".join(counter.truncate(msg.get("content") or "", SUMMARY_LINE_TOKENS).split())
+        line = f"{who}: {snippet}"
+        cost = counter.count(line) + 1
+        if used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+    if not lines:
+        return None
+    return {"role": "system", "content": "\n".join([header, *reversed(lines)])}
+
+
+def fit_history(
+    history: Sequence[Dict[str, Any]],
+    budget: int,
+    counter: TokenCounter = token_counter,
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Mantém as mensagens mais recentes que cabem no orçamento; quando nem
+    todas cabem, parte do orçamento (SUMMARY_SHARE) fica para um resumo
+    curto das mais antigas. O corte é arredondado para múltiplos de
+    HISTORY_TRIM_STEP, para o prefixo do prompt ficar estável entre turnos.
+    Retorna (mensagens, nº de mensagens antigas fora da janela).
+    """
+    costs = [counter.count_message(m) for m in history]
+    recent_budget = budget
+    if sum(costs) > budget:
+        recent_budget = budget - int(budget * SUMMARY_SHARE)
+
+    kept: List[Dict[str, Any]] = []
+    used = 0
+    for msg, cost in zip(reversed(history), reversed(costs)):
+        if used + cost > recent_budget:
+            break
+        kept.append(msg)
+        used += cost
+    kept.reverse()
+
+    start = len(history) - len(kept)
+    rounded = -(-start // HISTORY_TRIM_STEP) * HISTORY_TRIM_STEP
+    if start and rounded < len(history):
+        start = rounded
+        kept = list(history[start:])
+
+    dropped = list(history[:start])
+    if dropped:
+        summary = _summarize_dropped(dropped, budget - used, counter)
+        if summary is not None:
+            kept.insert(0, summary)
+    return kept, len(dropped)
+
+
+def history_budget(fixed_tokens: int) -> int:
+    """Tokens disponíveis para o histórico, dado o custo do resto do prompt."""
+    return max(0, min(PROMPT_HISTORY_TOKENS, PROMPT_MAX_TOKENS - fixed_tokens))
@@ -0,0 +1,257 @@
+"""
+Avaliação em lote do agente: roda um conjunto de perguntas (JSONL) pela
+busca e, opcionalmente, pela geração, e devolve uma linha NDJSON por
+pergunta com latência e recall@k, mais um resumo no final.
+
+Formato de entrada (uma pergunta por linha):
+    {"id": "icp-01", "step": "icp", "question": "Como defino meu ICP?",
+     "expected": ["icp_basico.pptx", "icp_basico.pptx#slides-1-3"]}
+
+`expected` aceita ids de chunk ou nomes de deck (acerta qualquer chunk do
+deck). `id` é opcional (padrão: número da linha).
+
+Uso (a partir de backend/):
+    python -m services.evaluation perguntas.jsonl --top-k 5 --out resultado.ndjson
+    python -m services.evaluation perguntas.jsonl --generate --concurrency 4
+    python -m services.evaluation perguntas.jsonl --url https://api.exemplo.com --token $ADMIN_TOKEN
+    python -m services.evaluation perguntas.jsonl --min-recall 0.8   # sai com 1 se ficar abaixo
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from core.config import EVAL_BATCH_SIZE, EVAL_CONCURRENCY, EVAL_MAX_ITEMS
+from core.rag_engine import rag_engine, KnowledgeDoc
+
+logger = logging.getLogger(__name__)
+
+# (step, pergunta, documentos recuperados) -> resposta do agente
+GenerateFn = Callable[[str, str, List[KnowledgeDoc]], Awaitable[str]]
+
+
+@dataclass
+class EvalItem:
+    id: str
+    step: str
+    question: str
+    expected: List[str] = field(default_factory=list)
+
+
+def parse_items(data: bytes, max_items: int = EVAL_MAX_ITEMS) -> List[EvalItem]:
+    """Lê o JSONL de perguntas; erros apontam a linha (ValueError)."""
+    items: List[EvalItem] = []
+    for n, line in enumerate(data.decode("utf-8-sig").splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            raw = json.loads(line)
+            question = str(raw["question"]).strip()
+        except (json.JSONDecodeError, KeyError, TypeError):
+            raise ValueError(f"Linha {n}: esperado um objeto JSON com 'question'.")
+        if not question:
+            raise ValueError(f"Linha {n}: pergunta vazia.")
+        expected = raw.get("expected") or []
+        if isinstance(expected, str):
+            expected = [expected]
+        items.append(EvalItem(
+            id=str(raw.get("id") or n),
+            step=str(raw.get("step") or "todas"),
+            question=question,
+            expected=[str(e) for e in expected],
+        ))
+        if len(items) > max_items:
+            raise ValueError(f"Máximo de {max_items} perguntas por avaliação.")
+    if not items:
+        raise ValueError("Nenhuma pergunta no arquivo.")
+    return items
+
+
+def recall_at_k(expected: List[str], docs: List[KnowledgeDoc]) -> Optional[float]:
+    """Fração dos esperados encontrados entre os documentos (por id do chunk ou nome do deck)."""
+    if not expected:
+        return None
+    found = {d.id for d in docs} | {d.parent for d in docs}
+    return sum(1 for e in expected if e in found) / len(expected)
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    return round(float(np.percentile(values, q)), 1) if values else None
+
+
+def _summary(results: List[Dict[str, Any]], top_k: int, elapsed: float) -> Dict[str, Any]:
+    recalls = [r["recall"] for r in results if r.get("recall") is not None]
+    by_step: Dict[str, List[float]] = {}
+    for r in results:
+        if r.get("recall") is not None:
+            by_step.setdefault(r["step"], []).append(r["recall"])
+    # busca com erro não tem tempo medido: fica fora dos percentis
+    retrieval = [r["retrieval_ms"] for r in results if r.get("retrieval_ms") is not None]
+    generation = [r["generation_ms"] for r in results if r.get("generation_ms") is not None]
+    return {
+        "summary": {
+            "items": len(results),
+            "k": top_k,
+            "recall_at_k": round(sum(recalls) / len(recalls), 4) if recalls else None,
+            "hit_rate": round(sum(1 for x in recalls if x > 0) / len(recalls), 4) if recalls else None,
+            "recall_by_step": {s: round(sum(v) / len(v), 4) for s, v in sorted(by_step.items())},
+            "retrieval_ms": {"p50": _percentile(retrieval, 50), "p95": _percentile(retrieval, 95)},
+            "generation_ms": {"p50": _percentile(generation, 50), "p95": _percentile(generation, 95)},
+            "errors": sum(1 for r in results if r.get("error")),
+            "total_seconds": round(elapsed, 3),
+        }
+    }
+
+
+async def evaluate(
+    items: List[EvalItem],
+    top_k: int = 5,
+    generate: Optional[GenerateFn] = None,
+    concurrency: int = EVAL_CONCURRENCY,
+    batch_size: int = EVAL_BATCH_SIZE,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Resultados por pergunta, na ordem em que ficam prontos, e o resumo por último.
+    A busca roda em lotes de `batch_size` (RAGEngine.search_batch, fora do
+    event loop); a geração, com no máximo `concurrency` chamadas ao mesmo
+    tempo, começa assim que cada lote é recuperado.
+    """
+    started = time.perf_counter()
+    done: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+    slots = asyncio.Semaphore(max(1, concurrency))
+    tasks: List[asyncio.Task] = []
+
+    async def answer(result: Dict[str, Any], item: EvalItem, docs: List[KnowledgeDoc]) -> None:
+        async with slots:
+            t0 = time.perf_counter()
+            try:
+                result["answer"] = await generate(item.step, item.question, docs)
+            except Exception as e:
+                result["error"] = f"geração: {e}"
+            result["generation_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        await done.put(result)
+
+    async def retrieve() -> None:
+        for i in range(0, len(items), batch_size):
+            batch = items[i:i + batch_size]
+            try:
+                found = await asyncio.to_thread(
+                    rag_engine.search_batch, [it.question for it in batch], [it.step for it in batch], top_k
+                )
+            except Exception as e:
+                logger.error(f"Erro na busca da avaliação: {e}")
+                for it in batch:
+                    await done.put({"id": it.id, "step": it.step, "retrieval_ms": None, "error": f"busca: {e}"})
+                continue
+            for item, (docs, seconds) in zip(batch, found):
+                result = {
+                    "id": item.id,
+                    "step": item.step,
+                    "question": item.question,
+                    "expected": item.expected,
+                    "retrieved": [d.id for d in docs],
+                    "recall": recall_at_k(item.expected, docs),
+                    "retrieval_ms": round(seconds * 1000, 2),
+                }
+                if generate is None:
+                    await done.put(result)
+                else:
+                    tasks.append(asyncio.create_task(answer(result, item, docs)))
+
+    retriever = asyncio.create_task(retrieve())
+    results: List[Dict[str, Any]] = []
+    try:
+        while len(results) < len(items):
+            result = await done.get()
+            results.append(result)
+            yield result
+        await retriever
+    finally:
+        # cliente desconectou: não deixa gerações órfãs consumindo o LLM
+        retriever.cancel()
+        for task in tasks:
+            task.cancel()
+
+    yield _summary(results, top_k, time.perf_counter() - started)
+
+
+# ---------- CLI ----------
+async def _run_local(args: argparse.Namespace, items: List[EvalItem]) -> AsyncIterator[Dict[str, Any]]:
+    async def generate(step: str, question: str, docs: List[KnowledgeDoc]) -> str:
+        from api.agent import generate_answer
+
+        return await generate_answer("avaliação", step, question, docs, "eval\0cli")
+
+    await asyncio.to_thread(rag_engine.load)
+    async for result in evaluate(items, args.top_k, generate if args.generate else None, args.concurrency):
+        yield result
+
+
+async def _run_remote(args: argparse.Namespace, data: bytes) -> AsyncIterator[Dict[str, Any]]:
+    import httpx
+
+    params = {"top_k": args.top_k, "generate": str(args.generate).lower(), "concurrency": args.concurrency}
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    async with httpx.AsyncClient(timeout=None) as http:
+        async with http.stream(
+            "POST", args.url.rstrip("/") + "/admin/eval",
+            params=params, headers=headers, files={"file": ("perguntas.jsonl", data)},
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise SystemExit(f"Erro {response.status_code}: {response.text}")
+            async for line in response.aiter_lines():
+                if line.strip():
+                    yield json.loads(line)
+
+
+async def _main(args: argparse.Namespace) -> int:
+    with open(args.questions, "rb") as f:
+        data = f.read()
+    items = parse_items(data)
+    results = _run_remote(args, data) if args.url else _run_local(args, items)
+
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    summary: Dict[str, Any] = {}
+    try:
+        async for result in results:
+            if "summary" in result:
+                summary = result["summary"]
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(json.dumps(summary, ensure_ascii=False, indent=2), file=sys.stderr)
+    recall = summary.get("recall_at_k")
+    if args.min_recall is not None and (recall is None or recall < args.min_recall):
+        print(f"recall@{args.top_k} {recall} abaixo do mínimo {args.min_recall}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("questions", help="JSONL com step, question e expected")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--generate", action="store_true", help="gera as respostas com o LLM")
+    parser.add_argument("--concurrency", type=int, default=EVAL_CONCURRENCY, help="gerações simultâneas")
+    parser.add_argument("--url", help="avalia na API (POST /admin/eval) em vez da base local")
+    parser.add_argument("--token", help="JWT de admin para --url")
+    parser.add_argument("--out", help="grava o NDJSON no arquivo (padrão: stdout)")
+    parser.add_argument("--min-recall", type=float, help="sai com 1 se o recall@k médio ficar abaixo")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(_main(args)))
+
+
+if __name__ == "__main__":
+    main()
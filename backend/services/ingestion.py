@@ -0,0 +1,398 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import shutil
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from core.chunking import chunk_slides
+from core.config import (
+    RAG_INGEST_PROCESSES,
+    RAG_INGEST_BATCH_SIZE,
+    RAG_INGEST_MAX_JOBS,
+    RAG_TENANT_MAX_CHUNKS,
+    UPLOADS_DIR,
+)
+from core.extractors import SlideText, extract_file
+from core.metrics import span, record, detach_request
+from core.rag_engine import rag_engine, KnowledgeDoc
+from core.shards import knowledge
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IngestionJob:
+    id: str
+    step: str
+    admin: str
+    filenames: List[str]
+    # startup dona do material (base privada em core/shards.py); None = base global
+    tenant: Optional[str] = None
+    status: str = "queued"  # queued | parsing | embedding | committing | done | error
+    files_parsed: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    error: Optional[str] = None
+    result: Dict[str, Any] = field(default_factory=dict)
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "error")
+
+    def to_dict(self) -> Dict[str, Any]:
+        files_total = len(self.filenames)
+        # parsing = 40% do progresso, embedding = 60%
+        progress = 0.4 * (self.files_parsed / files_total if files_total else 1)
+        if self.chunks_total:
+            progress += 0.6 * self.chunks_embedded / self.chunks_total
+        if self.status == "done":
+            progress = 1.0
+
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "step": self.step,
+            "tenant": self.tenant,
+            "files": self.filenames,
+            "files_total": files_total,
+            "files_parsed": self.files_parsed,
+            "chunks_total": self.chunks_total,
+            "chunks_embedded": self.chunks_embedded,
+            "progress": round(progress, 3),
+            "error": self.error,
+            "result": self.result,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class IngestionQueue:
+    """
+    Fila de ingestão em segundo plano (PPTX, PDF, DOCX; ver core/extractors.py).
+
+    Os arquivos chegam já gravados em disco (spool do upload) e passam um a um
+    pelo pipeline, sem o upload inteiro na memória:
+    - parsing: cada arquivo roda num processo do pool (a leitura é CPU e
+      síncrona), no máximo `processes` por vez; só os textos voltam;
+    - dedup: decks idênticos (mesmo hash) são ignorados, decks alterados substituem
+      a versão anterior e chunks com conteúdo já indexado reaproveitam o vetor;
+    - embedding: só dos chunks novos, em lotes numa thread, assim que cada
+      arquivo é extraído (um lote por vez entre os jobs);
+    - commit: rag_engine.add_documents com os embeddings prontos, que publica
+      as mudanças para as buscas de uma vez só, no final do job.
+    """
+
+    def __init__(
+        self,
+        processes: int = RAG_INGEST_PROCESSES,
+        batch_size: int = RAG_INGEST_BATCH_SIZE,
+        max_jobs: int = RAG_INGEST_MAX_JOBS,
+    ) -> None:
+        self.processes = max(1, processes)
+        self.batch_size = max(1, batch_size)
+        self.max_jobs = max_jobs
+
+        self.jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._embed_lock: Optional[asyncio.Lock] = None
+        # um commit por vez neste processo: o dedup é refeito sob ele
+        self._commit_lock: Optional[asyncio.Lock] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: os processos não herdam as threads do torch do processo principal
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    def _reset_pool(self) -> None:
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def spool_dir() -> Path:
+        """
+        Diretório novo para os arquivos de um upload. Sobras de jobs
+        interrompidos (processo reiniciado) com mais de um dia são apagadas.
+        """
+        UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
+        cutoff = time.time() - 24 * 3600
+        for old in UPLOADS_DIR.iterdir():
+            try:
+                if old.stat().st_mtime < cutoff:
+                    shutil.rmtree(old, ignore_errors=True)
+            except FileNotFoundError:
+                pass
+        path = UPLOADS_DIR / uuid.uuid4().hex
+        path.mkdir()
+        return path
+
+    def submit(
+        self,
+        step: str,
+        admin: str,
+        files: List[Tuple[str, Path]],
+        spool: Optional[Path] = None,
+        tenant: Optional[str] = None,
+    ) -> IngestionJob:
+        """
+        Registra o job e agenda o processamento no event loop atual.
+        `files` são (nome, caminho em disco); `spool` é apagado no fim do job.
+        Com `tenant`, o material vai para a base privada da startup.
+        """
+        job = IngestionJob(
+            id=uuid.uuid4().hex,
+            step=step,
+            admin=admin,
+            filenames=[name for name, _ in files],
+            tenant=tenant,
+        )
+        self.jobs[job.id] = job
+        self._trim_jobs()
+
+        if self._embed_lock is None:
+            self._embed_lock = asyncio.Lock()
+            self._commit_lock = asyncio.Lock()
+        self._tasks[job.id] = asyncio.get_running_loop().create_task(self._run(job, files, spool))
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self.jobs.get(job_id)
+
+    def _trim_jobs(self) -> None:
+        """Mantém só os max_jobs mais recentes (jobs em andamento nunca saem)."""
+        for job_id in list(self.jobs):
+            if len(self.jobs) <= self.max_jobs:
+                break
+            if self.jobs[job_id].finished:
+                del self.jobs[job_id]
+
+    async def _extracted(
+        self, job: IngestionJob, files: List[Tuple[str, Path]]
+    ) -> AsyncIterator[Tuple[str, List[SlideText]]]:
+        """
+        Textos de cada arquivo, na ordem em que a extração termina, com no
+        máximo `processes` arquivos em extração ao mesmo tempo.
+        """
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        pending = list(files)
+        running: Dict[asyncio.Future, Tuple[str, float]] = {}
+        try:
+            while pending or running:
+                while pending and len(running) < self.processes:
+                    name, path = pending.pop(0)
+                    future = loop.run_in_executor(pool, extract_file, str(path), name)
+                    running[future] = (name, time.perf_counter())
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for fut in done:
+                    name, t0 = running.pop(fut)
+                    slides = fut.result()
+                    record("ingest.parse", time.perf_counter() - t0)
+                    job.files_parsed += 1
+                    yield name, slides
+        finally:
+            for fut in running:
+                fut.cancel()
+
+    async def _run(self, job: IngestionJob, files: List[Tuple[str, Path]], spool: Optional[Path] = None) -> None:
+        # roda depois da resposta do upload: as etapas vão só para as métricas globais
+        detach_request()
+        started = time.perf_counter()
+        try:
+            # a base precisa estar carregada para o dedup e o commit
+            await asyncio.to_thread(rag_engine.load)
+            engine = rag_engine
+            if job.tenant is not None:
+                engine = await asyncio.to_thread(knowledge.tenant, job.tenant, True)
+
+            # o último arquivo com o mesmo nome vence
+            files = list(dict(files).items())
+
+            # dedup por hash contra a versão mais recente da base, inclusive a de outros workers
+            await asyncio.to_thread(engine.refresh)
+            # mapas da view: a primeira consulta percorre a base, então fora do event loop
+            existing = await asyncio.to_thread(engine.parent_hashes)
+
+            docs: List[KnowledgeDoc] = []
+            replace: List[Tuple[str, str]] = []
+            vectors: Dict[str, np.ndarray] = {}
+            # hashes embedados por este job (os outros vetores vieram da base)
+            embedded_hashes: Set[str] = set()
+            added = updated = skipped = extracted = embedded = 0
+
+            # 1) parsing nos processos, arquivo a arquivo; cada arquivo segue
+            # para o dedup e o embedding assim que é extraído
+            job.status = "parsing"
+            async for name, slides in self._extracted(job, files):
+                if not slides:
+                    continue
+                extracted += 1
+
+                # 2) dedup: deck idêntico é ignorado; deck alterado substitui o anterior
+                chunks = chunk_slides(name, job.step, name, slides)
+                del slides
+                key = (job.step, name)
+                if key in existing:
+                    if existing[key] == chunks[0].parent_hash:
+                        skipped += 1
+                        continue
+                    replace.append(key)
+                    updated += 1
+                else:
+                    added += 1
+                docs.extend(chunks)
+
+                # chunks com o mesmo conteúdo de algum já indexado (ou já embedado neste job) reaproveitam o vetor
+                known = await asyncio.to_thread(
+                    engine.vectors_by_hash, [d.content_hash for d in chunks if d.content_hash not in vectors]
+                )
+                vectors.update(known)
+                to_embed = list({d.content_hash: d for d in chunks if d.content_hash not in vectors}.values())
+                job.chunks_total += len(to_embed)
+
+                # 3) embedding em lotes; o lock deixa um lote por vez entre os jobs
+                for i in range(0, len(to_embed), self.batch_size):
+                    batch = to_embed[i:i + self.batch_size]
+                    async with self._embed_lock:
+                        job.status = "embedding"
+                        with span("ingest.embed"):
+                            embs = await asyncio.to_thread(engine.embed_documents, batch)
+                    vectors.update((d.content_hash, e) for d, e in zip(batch, embs))
+                    embedded_hashes.update(d.content_hash for d in batch)
+                    job.chunks_embedded += len(batch)
+                    embedded += len(batch)
+                job.status = "parsing"
+
+            if not extracted:
+                raise ValueError("Não foi possível extrair texto dos arquivos enviados.")
+
+            # 4) commit atômico; o dedup é refeito sob o lock, porque outro job
+            # pode ter publicado os mesmos decks enquanto este extraía e embedava.
+            # O limite da base da startup é conferido no add_documents, sob os
+            # write locks (dois uploads simultâneos não passam os dois)
+            async with self._commit_lock:
+                job.status = "committing"
+                await asyncio.to_thread(engine.refresh)
+                published = await asyncio.to_thread(engine.parent_hashes)
+                docs, replace, moved = _recheck_published(published, docs, replace)
+                added -= moved["added"]
+                updated += moved["updated"]
+                skipped += moved["skipped"]
+                if docs or replace:
+                    embeddings = np.vstack([vectors[d.content_hash] for d in docs]) if docs else None
+                    with span("ingest.commit"):
+                        await asyncio.to_thread(
+                            engine.add_documents, docs, embeddings, replace,
+                            RAG_TENANT_MAX_CHUNKS if job.tenant is not None else None,
+                        )
+
+            reused = _count_reused(docs, embedded_hashes)
+            stats = engine.get_stats()
+            job.result = {
+                "added": added,
+                "updated": updated,
+                "skipped": skipped,
+                "chunks_added": len(docs),
+                "chunks_embedded": embedded,
+                "chunks_reused": reused,
+                "docs_total": stats["docs"],
+                "chunks_total": stats["chunks"],
+                "steps": stats["steps"],
+            }
+            job.status = "done"
+            record("ingest.total", time.perf_counter() - started)
+            logger.info(
+                f"Job {job.id} ({job.admin}, etapa '{job.step}'): {added} novos, {updated} atualizados, "
+                f"{skipped} sem mudança; {embedded} chunks embedados, "
+                f"{reused} reaproveitados. Base agora tem {stats['docs']} documentos"
+            )
+
+        except BrokenProcessPool as e:
+            # um processo morreu (ex.: OOM): encerra o que sobrou do pool; o próximo job cria outro
+            self._reset_pool()
+            job.status = "error"
+            job.error = f"Falha no processo de extração: {e}"
+            logger.error(f"Job de ingestão {job.id} falhou: {e}")
+
+        except Exception as e:
+            job.status = "error"
+            job.error = str(e)
+            logger.error(f"Job de ingestão {job.id} falhou: {e}")
+
+        finally:
+            if spool is not None:
+                shutil.rmtree(spool, ignore_errors=True)
+            job.finished_at = time.time()
+            self._tasks.pop(job.id, None)
+
+
+def _count_reused(docs: List[KnowledgeDoc], embedded_hashes: Set[str]) -> int:
+    """
+    Chunks do commit que não usaram um vetor calculado para eles: o vetor
+    veio da base ou de outro chunk igual do mesmo job.
+    """
+    first_use: Set[str] = set()
+    reused = 0
+    for d in docs:
+        if d.content_hash in embedded_hashes and d.content_hash not in first_use:
+            first_use.add(d.content_hash)
+        else:
+            reused += 1
+    return reused
+
+
+def _recheck_published(
+    existing: Dict[Tuple[str, str], str],
+    docs: List[KnowledgeDoc],
+    replace: List[Tuple[str, str]],
+) -> Tuple[List[KnowledgeDoc], List[Tuple[str, str]], Dict[str, int]]:
+    """
+    Refaz o dedup dos decks do job contra a base atual: decks que já estão
+    lá com o mesmo hash saem do commit, e decks novos que outro job publicou
+    com outro conteúdo passam a substituir essa versão. Devolve também os
+    ajustes nos contadores do job.
+    """
+    moved = {"added": 0, "updated": 0, "skipped": 0}
+    hashes = {(d.step, d.parent): d.parent_hash for d in docs}
+    replace_set = set(replace)
+    same = set()
+    for key, parent_hash in hashes.items():
+        if key not in existing:
+            continue
+        if existing[key] == parent_hash:
+            same.add(key)
+            moved["skipped"] += 1
+            if key in replace_set:
+                moved["updated"] -= 1
+                replace_set.discard(key)
+            else:
+                moved["added"] += 1
+        elif key not in replace_set:
+            replace_set.add(key)
+            moved["added"] += 1
+            moved["updated"] += 1
+    if same:
+        docs = [d for d in docs if (d.step, d.parent) not in same]
+    return docs, sorted(replace_set), moved
+
+
+# Instância global, como rag_engine
+ingestion_queue = IngestionQueue()
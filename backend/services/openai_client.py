@@ -1,9 +1,34 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator
+from collections import deque
 from openai import AsyncOpenAI
-from openai import OpenAIError, APIError, APITimeoutError
-from core.config import OPENAI_API_KEY, OPENAI_MODEL
+from openai import OpenAIError, APIError, APIStatusError, APIConnectionError, APITimeoutError
+from core.config import (
+    OPENAI_API_KEY,
+    OPENAI_MODEL,
+    OPENAI_BASE_URL,
+    OPENAI_FALLBACK_MODEL,
+    OPENAI_TIMEOUT,
+    OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE,
+    OPENAI_KEEPALIVE_EXPIRY,
+    OPENAI_HTTP2,
+    OPENAI_MAX_RETRIES,
+    OPENAI_RETRY_BASE,
+    OPENAI_RETRY_MAX,
+    OPENAI_BREAKER_FAILURES,
+    OPENAI_BREAKER_COOLDOWN,
+    OPENAI_HEDGE,
+    OPENAI_HEDGE_QUANTILE,
+    OPENAI_HEDGE_DELAY,
+    OPENAI_HEDGE_MIN_SAMPLES,
+)
+from core.metrics import span, record, llm_in_flight
 import asyncio
+import contextvars
+import httpx
 import logging
+import random
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -15,28 +40,247 @@ if not OPENAI_API_KEY:
 
 
 # ============================================================
-# 🤖 CLIENTE OFICIAL (ASSÍNCRONO)
+# 🤖 CLIENTE OFICIAL (ASSÍNCRONO) COM POOL DE CONEXÕES
 # ============================================================
-client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def build_client(base_url: Optional[str] = OPENAI_BASE_URL or None, http2: bool = OPENAI_HTTP2) -> AsyncOpenAI:
+    """
+    Um único httpx.AsyncClient por processo: as conexões (e o handshake TLS)
+    são reaproveitadas entre chamadas. Os retries do SDK ficam desligados:
+    quem repete é o _create, que conhece o circuit breaker e o deadline.
+    """
+    if http2 and not _http2_available():
+        logger.warning("Pacote h2 não instalado: cliente OpenAI usando HTTP/1.1")
+        http2 = False
+    http_client = httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=5.0),
+    )
+    return AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=base_url, http_client=http_client, max_retries=0)
+
+
+client = build_client()
+
+
+async def close_client() -> None:
+    """Fecha o pool de conexões (shutdown da aplicação)."""
+    close = getattr(client, "close", None)
+    if close is not None:
+        await close()
+
+
+FALLBACK_MODEL = OPENAI_FALLBACK_MODEL
+MAX_TOKENS = 800
+
+# modelo que de fato respondeu a última chamada desta task (principal ou fallback)
+answered_model: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("answered_model", default=None)
 
 
 # ============================================================
-# 🛠 FUNÇÃO PRINCIPAL — CHAT COMPLETION (RESPONSES API)
+# ⚡ CIRCUIT BREAKER E LATÊNCIA POR MODELO
 # ============================================================
-async def chat_completion(
-    messages: List[Dict[str, Any]],
-    temperature: float = 0.2,
-    model: str = OPENAI_MODEL,
-    timeout: int = 25,
-) -> str:
+class CircuitOpenError(Exception):
+    """O circuito do modelo está aberto: a chamada nem é feita."""
+
+
+class CircuitBreaker:
+    """
+    closed -> open após `failures` falhas transitórias seguidas; open -> half_open
+    depois de `cooldown` segundos, liberando uma única chamada de teste:
+    sucesso fecha o circuito, falha abre de novo. Roda só no event loop
+    (sem threads), então não precisa de lock.
+    """
+
+    def __init__(self, failures: int = OPENAI_BREAKER_FAILURES, cooldown: float = OPENAI_BREAKER_COOLDOWN) -> None:
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.cooldown:
+                return False
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "half_open":
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self._consecutive = 0
+        self._probing = False
+
+    def release(self) -> None:
+        """Chamada de teste sem veredito (cancelada, erro do pedido): libera o próximo teste."""
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self._consecutive += 1
+        if self.state == "half_open" or (self.failures > 0 and self._consecutive >= self.failures):
+            if self.state != "open":
+                logger.warning(f"Circuit breaker aberto após {self._consecutive} falha(s) seguidas")
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self._consecutive}
+
+
+class LatencyWindow:
+    """Últimas N latências de chamadas bem-sucedidas, para o delay do hedging."""
+
+    def __init__(self, size: int = 200) -> None:
+        self._samples: deque = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_latency: Dict[str, LatencyWindow] = {}
+
+
+def _breaker(model: str) -> CircuitBreaker:
+    if model not in _breakers:
+        _breakers[model] = CircuitBreaker()
+    return _breakers[model]
+
+
+def _latency_window(model: str) -> LatencyWindow:
+    if model not in _latency:
+        _latency[model] = LatencyWindow()
+    return _latency[model]
+
+
+def client_stats() -> Dict[str, Any]:
+    """Estado dos circuitos e latências recentes por modelo."""
+    models = sorted(set(_breakers) | set(_latency))
+    out: Dict[str, Any] = {}
+    for model in models:
+        window = _latency.get(model)
+        p50 = window.quantile(0.5) if window else None
+        p95 = window.quantile(0.95) if window else None
+        out[model] = {
+            **(_breakers[model].stats() if model in _breakers else {}),
+            "samples": len(window) if window else 0,
+            "p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000) if p95 is not None else None,
+        }
+    return out
+
+
+def reset_stats() -> None:
+    _breakers.clear()
+    _latency.clear()
+
+
+# ============================================================
+# 🔁 RETRIES COM BACKOFF + JITTER
+# ============================================================
+_RETRYABLE_STATUS = {408, 409, 429}
+
+
+def _retryable(e: Exception) -> bool:
+    if isinstance(e, APIConnectionError):  # inclui APITimeoutError
+        return True
+    if isinstance(e, APIStatusError):
+        return e.status_code in _RETRYABLE_STATUS or e.status_code >= 500
+    return False
+
+
+def _retry_delay(e: Exception, attempt: int) -> float:
+    """Full jitter: uniforme em [0, min(máx, base * 2^tentativa)]; respeita Retry-After."""
+    delay = random.uniform(0, min(OPENAI_RETRY_MAX, OPENAI_RETRY_BASE * 2 ** attempt))
+    response = getattr(e, "response", None)
+    if response is not None:
+        try:
+            delay = max(delay, min(OPENAI_RETRY_MAX, float(response.headers.get("retry-after", 0))))
+        except (TypeError, ValueError):
+            pass
+    return delay
+
+
+async def _create(model: str, deadline: float, **kwargs: Any):
     """
-    Chamada robusta ao modelo via Responses API.
-    - Compatível com gpt-5-nano, gpt-4.1, etc.
-    - Timeout automático
-    - Tratamento de exceção
-    - Garantia de retorno limpo
+    client.chat.completions.create com retries e circuit breaker do modelo.
+    Todas as tentativas (e esperas) cabem até `deadline` (relógio do loop);
+    estourar o deadline levanta asyncio.TimeoutError.
     """
+    loop = asyncio.get_running_loop()
+    breaker = _breaker(model)
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuito aberto para o modelo {model}")
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+
+        started = time.perf_counter()
+        try:
+            with llm_in_flight.track(model=model):
+                response = await asyncio.wait_for(
+                    client.chat.completions.create(model=model, max_tokens=MAX_TOKENS, **kwargs),
+                    timeout=remaining,
+                )
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except asyncio.TimeoutError:
+            breaker.record_failure()
+            raise
+        except APIError as e:
+            if not _retryable(e):
+                # erro do pedido (400, 401, ...): não diz nada sobre a saúde do modelo,
+                # então não conta como falha nem como sucesso; só libera o teste do half-open
+                breaker.release()
+                raise
+            breaker.record_failure()
+            delay = _retry_delay(e, attempt)
+            attempt += 1
+            if attempt > OPENAI_MAX_RETRIES or loop.time() + delay >= deadline:
+                raise
+            logger.warning(f"Erro transitório no modelo {model} ({e}); tentativa {attempt + 1} em {delay:.2f}s")
+            await asyncio.sleep(delay)
+            continue
+
+        breaker.record_success()
+        if not kwargs.get("stream"):
+            # stream devolve só com os headers: misturar na janela puxaria o p95
+            # do hedge para baixo e o fallback seria disparado cedo demais
+            _latency_window(model).add(time.perf_counter() - started)
+        return response
 
+
+def _validate_messages(messages: List[Dict[str, Any]]) -> None:
     # ======= 🔍 Sanitização mínima (evita erros comuns) =======
     if not messages or not isinstance(messages, list):
         raise ValueError("O parâmetro 'messages' deve ser uma lista de mensagens.")
@@ -45,18 +289,115 @@ async def chat_completion(
     if messages[0]["role"] != "system":
         raise RuntimeError("A primeira mensagem deve ser 'system'. O estilo TR4CTION exige isso.")
 
+
+# ============================================================
+# 🛠 FUNÇÃO PRINCIPAL — CHAT COMPLETION
+# ============================================================
+def _output_text(response) -> str:
+    if not response.choices or len(response.choices) == 0:
+        raise RuntimeError("A API retornou uma estrutura inesperada (sem choices).")
+
+    output = response.choices[0].message.content or ""
+
+    # Evita retornos nulos ou vazios
+    if not output.strip():
+        raise RuntimeError("A OpenAI retornou uma resposta vazia.")
+
+    return output.strip()
+
+
+def _has_fallback(model: str) -> bool:
+    """Há um fallback configurado e diferente do modelo chamado."""
+    return bool(FALLBACK_MODEL) and model != FALLBACK_MODEL
+
+
+def _hedge_delay(model: str) -> float:
+    """Percentil OPENAI_HEDGE_QUANTILE das latências recentes do modelo (ou o delay fixo)."""
+    window = _latency_window(model)
+    if len(window) < OPENAI_HEDGE_MIN_SAMPLES:
+        return OPENAI_HEDGE_DELAY
+    return window.quantile(OPENAI_HEDGE_QUANTILE)
+
+
+async def _hedged(model: str, timeout: float, **kwargs: Any):
+    """
+    Dispara o modelo principal; se ele não responder até o p95 da sua latência
+    (ou falhar antes disso), dispara o fallback em paralelo. Fica com a primeira
+    resposta boa e cancela a outra. Os dois dividem o mesmo deadline.
+    Devolve (resposta, modelo que respondeu).
+    """
+    deadline = asyncio.get_running_loop().time() + timeout
+    primary = asyncio.create_task(_create(model, deadline, **kwargs))
+    models = {primary: model}
+    errors: Dict[str, BaseException] = {}
+
+    pending = {primary}
+    done, pending = await asyncio.wait(pending, timeout=_hedge_delay(model))
+    for task in done:
+        if task.exception() is None:
+            return task.result(), model
+        errors[models[task]] = task.exception()
+
+    logger.info(f"Hedge: disparando {FALLBACK_MODEL} em paralelo a {model}")
+    backup = asyncio.create_task(_create(FALLBACK_MODEL, deadline, **kwargs))
+    models[backup] = FALLBACK_MODEL
+    pending.add(backup)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if models[task] != model:
+                        logger.info(f"Hedge: resposta de {models[task]}")
+                    return task.result(), models[task]
+                errors[models[task]] = task.exception()
+    finally:
+        for task in pending:
+            task.cancel()
+
+    # os dois falharam: reporta o erro do principal, como no fallback sequencial
+    primary_error = errors.get(model)
+    fallback_error = errors.get(FALLBACK_MODEL)
+    logger.error(f"Hedge: principal e fallback falharam: {primary_error} | {fallback_error}")
+    if isinstance(primary_error, asyncio.TimeoutError) and isinstance(fallback_error, asyncio.TimeoutError):
+        raise primary_error
+    raise RuntimeError(
+        f"Erro ao chamar modelo principal ({model}) e fallback ({FALLBACK_MODEL}). "
+        f"Detalhe do erro principal: {primary_error} | fallback: {fallback_error}"
+    )
+
+
+async def chat_completion(
+    messages: List[Dict[str, Any]],
+    temperature: float = 0.2,
+    model: str = OPENAI_MODEL,
+    timeout: float = OPENAI_TIMEOUT,
+    hedge: Optional[bool] = None,
+) -> str:
+    """
+    Chamada robusta ao modelo via Chat Completions.
+    - Pool de conexões compartilhado, retries com backoff + jitter
+    - Circuit breaker por modelo (circuito aberto vai direto ao fallback)
+    - hedge=True (padrão OPENAI_HEDGE): fallback em paralelo após o p95
+      do principal, em vez de só depois de um erro
+    - Timeout total, tratamento de exceção e retorno limpo
+    """
+
+    _validate_messages(messages)
+    hedge = OPENAI_HEDGE if hedge is None else hedge
+    kwargs = {"messages": messages, "temperature": temperature}
+    answered_model.set(None)
+    used = model
+
     # ======= ⏳ Timeout seguro =======
     try:
-        response = await asyncio.wait_for(
-            client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=800,
-            ),
-            timeout=timeout
-        )
-        logger.info(f"Chat completion bem-sucedido com modelo {model}")
+        with span("llm"):
+            if hedge and _has_fallback(model):
+                response, used = await _hedged(model, timeout, **kwargs)
+            else:
+                deadline = asyncio.get_running_loop().time() + timeout
+                response = await _create(model, deadline, **kwargs)
+        logger.info(f"Chat completion bem-sucedido com modelo {used}")
 
     except asyncio.TimeoutError:
         logger.error(f"Timeout ao chamar OpenAI modelo {model} após {timeout}s")
@@ -66,28 +407,24 @@ async def chat_completion(
         logger.error(f"OpenAI API timeout: {str(e)}")
         raise RuntimeError(f"API OpenAI não respondeu a tempo: {str(e)}")
 
-    except APIError as e:
+    except (APIError, CircuitOpenError) as e:
         logger.error(f"OpenAI API error: {str(e)}")
         # ====== fallback automático ======
-        if model != "gpt-4o-mini":
-            try:
-                logger.info(f"Tentando fallback para gpt-4o-mini")
-                fallback_model = "gpt-4o-mini"
-                response = await client.chat.completions.create(
-                    model=fallback_model,
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=800,
-                )
-                logger.info("Fallback para gpt-4o-mini bem-sucedido")
-            except OpenAIError as fallback_error:
-                logger.error(f"Fallback também falhou: {str(fallback_error)}")
-                raise RuntimeError(
-                    f"Erro ao chamar modelo principal ({model}) e fallback ({fallback_model}). "
-                    f"Detalhe do erro principal: {e} | fallback: {fallback_error}"
-                )
-        else:
+        if not _has_fallback(model):
             raise RuntimeError(f"Erro ao chamar modelo {model}: {e}")
+        try:
+            logger.info(f"Tentando fallback para {FALLBACK_MODEL}")
+            deadline = asyncio.get_running_loop().time() + timeout
+            with span("llm.fallback"):
+                response = await _create(FALLBACK_MODEL, deadline, **kwargs)
+            used = FALLBACK_MODEL
+            logger.info(f"Fallback para {FALLBACK_MODEL} bem-sucedido")
+        except (OpenAIError, CircuitOpenError, asyncio.TimeoutError) as fallback_error:
+            logger.error(f"Fallback também falhou: {str(fallback_error)}")
+            raise RuntimeError(
+                f"Erro ao chamar modelo principal ({model}) e fallback ({FALLBACK_MODEL}). "
+                f"Detalhe do erro principal: {e} | fallback: {fallback_error}"
+            )
 
     except OpenAIError as e:
         logger.error(f"OpenAI error genérico: {str(e)}")
@@ -96,14 +433,102 @@ async def chat_completion(
     # ============================================================
     # 🔁 PROCESSAMENTO DA RESPOSTA
     # ============================================================
+    output = _output_text(response)
+    answered_model.set(used)
+    return output
 
-    if not response.choices or len(response.choices) == 0:
-        raise RuntimeError("A API retornou uma estrutura inesperada (sem choices).")
 
-    output = response.choices[0].message.content or ""
+# ============================================================
+# 📡 STREAMING — TOKENS CHEGANDO CONFORME SÃO GERADOS
+# ============================================================
+async def _open_stream(
+    messages: List[Dict[str, Any]],
+    temperature: float,
+    model: str,
+    timeout: float,
+):
+    deadline = asyncio.get_running_loop().time() + timeout
+    return await _create(model, deadline, messages=messages, temperature=temperature, stream=True)
 
-    # Evita retornos nulos ou vazios
-    if not output.strip():
-        raise RuntimeError("A OpenAI retornou uma resposta vazia.")
 
-    return output.strip()
+async def chat_completion_stream(
+    messages: List[Dict[str, Any]],
+    temperature: float = 0.2,
+    model: str = OPENAI_MODEL,
+    timeout: float = OPENAI_TIMEOUT,
+) -> AsyncIterator[str]:
+    """
+    Mesma chamada de chat_completion, mas devolve os trechos de texto
+    conforme o modelo gera (stream=True).
+    - Retries e circuit breaker valem para a abertura do stream
+    - Fallback só se o erro vier antes do primeiro token (sem hedging:
+      dois streams em paralelo pagariam a geração inteira duas vezes)
+    - `timeout` vale para abrir o stream e para cada intervalo entre trechos
+    - Loga o tempo até o primeiro token (TTFT)
+    """
+    _validate_messages(messages)
+    answered_model.set(None)
+
+    started = time.perf_counter()
+    try:
+        stream = await _open_stream(messages, temperature, model, timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"Timeout ao abrir stream OpenAI modelo {model} após {timeout}s")
+        raise RuntimeError("Tempo limite excedido ao tentar chamar o modelo.")
+    except APITimeoutError as e:
+        logger.error(f"OpenAI API timeout (stream): {str(e)}")
+        raise RuntimeError(f"API OpenAI não respondeu a tempo: {str(e)}")
+    except (APIError, CircuitOpenError) as e:
+        logger.error(f"OpenAI API error (stream): {str(e)}")
+        if not _has_fallback(model):
+            raise RuntimeError(f"Erro ao chamar modelo {model}: {e}")
+        try:
+            logger.info(f"Tentando fallback (stream) para {FALLBACK_MODEL}")
+            model = FALLBACK_MODEL
+            stream = await _open_stream(messages, temperature, model, timeout)
+        except (OpenAIError, CircuitOpenError, asyncio.TimeoutError) as fallback_error:
+            logger.error(f"Fallback também falhou: {str(fallback_error)}")
+            raise RuntimeError(
+                f"Erro ao chamar modelo principal e fallback ({FALLBACK_MODEL}). "
+                f"Detalhe do erro principal: {e} | fallback: {fallback_error}"
+            )
+    except OpenAIError as e:
+        logger.error(f"OpenAI error genérico (stream): {str(e)}")
+        raise RuntimeError(f"Erro ao chamar OpenAI: {str(e)}")
+
+    first_token_at: Optional[float] = None
+    chunks = stream.__aiter__()
+    try:
+        while True:
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=timeout)
+            except StopAsyncIteration:
+                break
+
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                record("llm.first_token", first_token_at - started)
+                logger.info(
+                    f"Stream {model}: primeiro token em {(first_token_at - started) * 1000:.0f}ms"
+                )
+            yield delta
+
+    except asyncio.TimeoutError:
+        logger.error(f"Stream OpenAI modelo {model} parou de responder por {timeout}s")
+        raise RuntimeError("Tempo limite excedido durante a geração da resposta.")
+    except OpenAIError as e:
+        logger.error(f"OpenAI error durante o stream: {str(e)}")
+        _breaker(model).record_failure()
+        raise RuntimeError(f"Erro ao chamar OpenAI: {str(e)}")
+    finally:
+        await stream.close()
+
+    answered_model.set(model)
+    record("llm.stream", time.perf_counter() - started)
+    logger.info(f"Stream {model} concluído em {(time.perf_counter() - started) * 1000:.0f}ms")
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.config import (
+    SESSION_STORE,
+    SESSION_TTL,
+    SESSION_MAX_SESSIONS,
+    SESSION_MAX_MESSAGES,
+    SESSION_DB_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+Message = Dict[str, str]
+
+
+def session_key(claims: Dict[str, Any], startup_id: str, session_id: Optional[str]) -> str:
+    """
+    Chave da sessão a partir do JWT (verify_founder): papel + usuário + startup,
+    mais o id de conversa opcional enviado pelo cliente (uma aba, uma conversa).
+    """
+    startup = claims.get("startup") or startup_id
+    return "\0".join([claims.get("role", ""), claims.get("sub", ""), startup, session_id or ""])
+
+
+class SessionStore(ABC):
+    """
+    Histórico de conversa guardado no servidor: o cliente manda só o turno novo.
+    As mensagens são só as trocas da conversa (pergunta crua + resposta),
+    sem o contexto RAG, em ordem de chegada.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def get(self, key: str) -> List[Message]:
+        ...
+
+    @abstractmethod
+    def append(self, key: str, messages: List[Message]) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self, key: str) -> None:
+        ...
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class MemorySessionStore(SessionStore):
+    """Sessões na memória do processo: LRU por sessão + TTL desde a última mensagem."""
+
+    name = "memory"
+
+    def __init__(
+        self,
+        max_sessions: int = SESSION_MAX_SESSIONS,
+        ttl_seconds: float = SESSION_TTL,
+        max_messages: int = SESSION_MAX_MESSAGES,
+    ) -> None:
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self._sessions: "OrderedDict[str, Tuple[float, List[Message]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> List[Message]:
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                return []
+            if time.time() - entry[0] > self.ttl_seconds:
+                del self._sessions[key]
+                return []
+            self._sessions.move_to_end(key)
+            return list(entry[1])
+
+    def append(self, key: str, messages: List[Message]) -> None:
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(key)
+            history = [] if entry is None or now - entry[0] > self.ttl_seconds else entry[1]
+            history = (history + list(messages))[-self.max_messages:]
+            self._sessions[key] = (now, history)
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def clear(self, key: str) -> None:
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "sessions": len(self._sessions), "max_sessions": self.max_sessions}
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessões num SQLite local (WAL), compartilhadas entre os workers da máquina
+    e preservadas entre restarts. Conexão aberta no primeiro uso em cada processo.
+    """
+
+    name = "sqlite"
+
+    def __init__(
+        self,
+        db_path: Path = SESSION_DB_PATH,
+        ttl_seconds: float = SESSION_TTL,
+        max_messages: int = SESSION_MAX_MESSAGES,
+    ) -> None:
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._appends_since_trim = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db_pid != os.getpid():
+            db = sqlite3.connect(str(self.db_path), timeout=5.0, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS session_messages ("
+                " key TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL,"
+                " content TEXT NOT NULL, created REAL NOT NULL, PRIMARY KEY (key, seq))"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS idx_sm_created ON session_messages(created)")
+            db.commit()
+            self._db, self._db_pid = db, os.getpid()
+        return self._db
+
+    def get(self, key: str) -> List[Message]:
+        with self._lock:
+            db = self._conn()
+            last = db.execute("SELECT MAX(created) FROM session_messages WHERE key = ?", (key,)).fetchone()[0]
+            if last is None or time.time() - last > self.ttl_seconds:
+                return []
+            rows = db.execute(
+                "SELECT role, content FROM ("
+                " SELECT seq, role, content FROM session_messages WHERE key = ? ORDER BY seq DESC LIMIT ?"
+                ") ORDER BY seq",
+                (key, self.max_messages),
+            ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def append(self, key: str, messages: List[Message]) -> None:
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            with db:
+                last = db.execute(
+                    "SELECT MAX(seq), MAX(created) FROM session_messages WHERE key = ?", (key,)
+                ).fetchone()
+                if last[0] is not None and now - last[1] > self.ttl_seconds:
+                    # sessão expirada: recomeça do zero
+                    db.execute("DELETE FROM session_messages WHERE key = ?", (key,))
+                    last = (None, None)
+                seq = (last[0] or 0) + 1
+                db.executemany(
+                    "INSERT INTO session_messages (key, seq, role, content, created) VALUES (?, ?, ?, ?, ?)",
+                    [(key, seq + i, m["role"], m["content"], now) for i, m in enumerate(messages)],
+                )
+                db.execute(
+                    "DELETE FROM session_messages WHERE key = ? AND seq <= ?",
+                    (key, seq + len(messages) - 1 - self.max_messages),
+                )
+                self._appends_since_trim += 1
+                if self._appends_since_trim >= 256:
+                    self._appends_since_trim = 0
+                    db.execute("DELETE FROM session_messages WHERE created < ?", (now - self.ttl_seconds,))
+
+    def clear(self, key: str) -> None:
+        with self._lock:
+            db = self._conn()
+            with db:
+                db.execute("DELETE FROM session_messages WHERE key = ?", (key,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            n = self._conn().execute("SELECT COUNT(DISTINCT key) FROM session_messages").fetchone()[0]
+        return {"backend": self.name, "sessions": n, "path": str(self.db_path)}
+
+
+def make_session_store(backend: str = SESSION_STORE) -> SessionStore:
+    backends = {"memory": MemorySessionStore, "sqlite": SQLiteSessionStore}
+    if backend not in backends:
+        raise RuntimeError(f"SESSION_STORE inválido: '{backend}'. Use um de: {', '.join(backends)}")
+    return backends[backend]()
+
+
+# Instância global
+session_store = make_session_store()
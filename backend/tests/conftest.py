@@ -0,0 +1,4 @@
+import os
+
+# services.openai_client recusa importar sem chave; core.config lê o ambiente no import
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
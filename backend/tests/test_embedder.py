@@ -0,0 +1,112 @@
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from core.embedder import LocalEmbedder
+from core.query_cache import QueryEmbeddingCache
+from core.scoring import _normalize_rows
+
+
+class _SentenceTransformer:
+    def __init__(self, name, **kwargs):
+        self.name = name
+        self.kwargs = kwargs
+
+
+def _fake_modules(monkeypatch, **modules):
+    st = types.ModuleType("sentence_transformers")
+    st.SentenceTransformer = _SentenceTransformer
+    torch = types.ModuleType("torch")
+    torch.set_num_threads = lambda n: None
+    monkeypatch.setitem(sys.modules, "sentence_transformers", st)
+    monkeypatch.setitem(sys.modules, "torch", torch)
+    for name, module in modules.items():
+        # None em sys.modules faz o import levantar ImportError
+        monkeypatch.setitem(sys.modules, name, module)
+
+
+def test_onnx_without_optimum_falls_back_to_torch(monkeypatch):
+    _fake_modules(
+        monkeypatch,
+        onnxruntime=types.ModuleType("onnxruntime"),
+        optimum=None,
+        **{"optimum.onnxruntime": None},
+    )
+    embedder = LocalEmbedder("modelo", runtime="onnx", threads=0)
+    model = embedder._build()
+    assert embedder.active_runtime == "torch"
+    assert "backend" not in model.kwargs
+
+
+def test_onnx_without_onnxruntime_falls_back_to_torch(monkeypatch):
+    _fake_modules(monkeypatch, onnxruntime=None)
+    embedder = LocalEmbedder("modelo", runtime="onnx", threads=0)
+    embedder._build()
+    assert embedder.active_runtime == "torch"
+
+
+def test_batches_cover_every_text_longest_first():
+    embedder = LocalEmbedder("modelo", runtime="torch", batch_tokens=64)
+    texts = ["x" * 200, "curto", "y" * 40, "z" * 120, "ok"]
+    batches = embedder._batches(texts, 32)
+    order = np.concatenate(batches).tolist()
+    assert sorted(order) == list(range(len(texts)))
+    assert order[0] == 0
+    # o lote do texto mais longo (~52 tokens) não cabe com outro no orçamento de 64
+    assert len(batches[0]) == 1
+
+
+def test_query_cache_key_depends_on_runtime():
+    torch_embedder = LocalEmbedder("modelo", runtime="torch")
+    onnx_embedder = LocalEmbedder("modelo", runtime="onnx")
+    torch_cache = QueryEmbeddingCache(lambda: torch_embedder.cache_namespace)
+    onnx_cache = QueryEmbeddingCache(lambda: onnx_embedder.cache_namespace)
+    assert torch_cache._key("Qual o ICP?") != onnx_cache._key("Qual o ICP?")
+
+    # onnx que caiu para torch no load usa as chaves do torch
+    onnx_embedder.active_runtime = "torch"
+    assert torch_cache._key("Qual o ICP?") == onnx_cache._key("Qual o ICP?")
+
+
+# ---------- Paridade dos runtimes (precisa do modelo; pulado sem ele) ----------
+PARITY_TEXTS = [
+    "Quem é o cliente ideal da startup e qual dor ele sente no dia a dia?",
+    "Slide 3: funil de vendas com metas de conversão por etapa no trimestre",
+    "Persona: gestora financeira de PME, 35 anos, usa planilhas e quer automatizar o fechamento",
+    "Análise SWOT: forças, fraquezas, oportunidades e ameaças do mercado de logística",
+    "CAC | LTV | payback em meses",
+    "Notas: revisar o pitch antes da banca",
+    "MRR",
+    "Proposta de valor " * 40,
+]
+MIN_COSINE = 0.99  # mesmo corte padrão do benchmarks/bench_embedder.py
+
+
+@pytest.fixture(scope="module")
+def reference_embeddings():
+    pytest.importorskip("sentence_transformers")
+    pytest.importorskip("torch")
+    reference = LocalEmbedder(runtime="torch", threads=0, batch_tokens=0)
+    try:
+        reference.load()
+    except OSError as e:
+        pytest.skip(f"modelo de embedding indisponível: {e}")
+    return _normalize_rows(np.asarray(reference.encode(PARITY_TEXTS), dtype=np.float32))
+
+
+@pytest.mark.parametrize("runtime", ["torch-int8", "onnx"])
+def test_runtime_parity_with_torch(runtime, reference_embeddings):
+    if runtime == "onnx":
+        pytest.importorskip("onnxruntime")
+        pytest.importorskip("optimum.onnxruntime")
+    candidate = LocalEmbedder(runtime=runtime, threads=0)
+    try:
+        candidate.load()
+    except OSError as e:
+        pytest.skip(f"modelo {runtime} indisponível: {e}")
+    assert candidate.active_runtime == runtime
+    embs = _normalize_rows(np.asarray(candidate.encode(PARITY_TEXTS), dtype=np.float32))
+    cosines = np.sum(reference_embeddings * embs, axis=1)
+    assert cosines.min() >= MIN_COSINE, f"cosseno mínimo {cosines.min():.5f} com {runtime}"
@@ -0,0 +1,40 @@
+import asyncio
+
+import numpy as np
+
+from core.encoder_worker import BatchedEncoder
+
+
+def _encode(texts):
+    return np.asarray([[float(t)] for t in texts])
+
+
+def test_requests_arriving_at_the_wait_boundary_are_not_lost():
+    encoder = BatchedEncoder(_encode, max_batch=4, max_wait_ms=1.0, workers=2)
+
+    async def run():
+        tasks = []
+        for i in range(300):
+            tasks.append(asyncio.create_task(encoder.encode(str(i))))
+            # pedidos chegando antes, no limite e depois da espera do coletor
+            await asyncio.sleep(0.001 * (i % 3) / 2)
+        return await asyncio.wait_for(asyncio.gather(*tasks), 10)
+
+    results = asyncio.run(run())
+    assert [float(r[0]) for r in results] == list(range(300))
+    assert encoder.encoded == 300
+
+
+def test_pending_get_carries_over_to_the_next_batch():
+    encoder = BatchedEncoder(_encode, max_batch=8, max_wait_ms=1.0)
+
+    async def run():
+        first = await encoder.encode("1")
+        # o coletor já esperou o lote e ficou com um get() pendente
+        await asyncio.sleep(0.01)
+        second = await asyncio.wait_for(encoder.encode("2"), 1)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert (float(first[0]), float(second[0])) == (1.0, 2.0)
+    assert encoder.batches == 2
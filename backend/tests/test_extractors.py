@@ -0,0 +1,35 @@
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("pptx")
+
+from pptx import Presentation
+from pptx.enum.shapes import MSO_SHAPE
+from pptx.util import Inches
+
+from core.extractors import iter_pptx_slides
+
+
+def _deck(path: Path) -> None:
+    prs = Presentation()
+    slide = prs.slides.add_slide(prs.slide_layouts[6])
+
+    # autoforma sem geometria: shape_type não é definido para ela
+    bare = slide.shapes.add_shape(MSO_SHAPE.RECTANGLE, Inches(1), Inches(1), Inches(2), Inches(1))
+    bare.text_frame.text = "forma sem geometria"
+    geom = bare._element.spPr.prstGeom
+    geom.getparent().remove(geom)
+    with pytest.raises(NotImplementedError):
+        bare.shape_type
+
+    group = slide.shapes.add_group_shape()
+    box = group.shapes.add_textbox(Inches(1), Inches(3), Inches(2), Inches(1))
+    box.text_frame.text = "texto no grupo"
+    prs.save(str(path))
+
+
+def test_pptx_reads_groups_and_shapes_without_geometry(tmp_path):
+    path = tmp_path / "deck.pptx"
+    _deck(path)
+    assert list(iter_pptx_slides(path)) == [(1, "Slide 1: forma sem geometria texto no grupo")]
@@ -0,0 +1,26 @@
+from core.rag_engine import KnowledgeDoc
+from services.ingestion import _count_reused, _recheck_published
+
+
+def _doc(parent: str, n: int, content_hash: str, parent_hash: str = "") -> KnowledgeDoc:
+    return KnowledgeDoc(
+        id=f"{parent}#{n}", step="icp", title=parent, text=content_hash,
+        parent_id=parent, slide_start=n, slide_end=n,
+        content_hash=content_hash, parent_hash=parent_hash or f"h-{parent}",
+    )
+
+
+def test_reused_counts_base_vectors_and_duplicates_in_the_job():
+    docs = [_doc("a", 1, "x"), _doc("a", 2, "y"), _doc("b", 1, "x"), _doc("b", 2, "z")]
+    # x embedado pelo job (o segundo x reaproveita), y veio da base, z embedado
+    assert _count_reused(docs, {"x", "z"}) == 2
+
+
+def test_reused_only_counts_docs_left_after_recheck():
+    docs = [_doc("a", 1, "x"), _doc("a", 2, "y"), _doc("b", 1, "k")]
+    # outro job publicou o deck "a" igual enquanto este embedava
+    docs, replace, moved = _recheck_published({("icp", "a"): "h-a"}, docs, [])
+    assert [d.parent for d in docs] == ["b"]
+    assert moved == {"added": 1, "updated": 0, "skipped": 1}
+    assert _count_reused(docs, {"x", "y"}) == 1
+    assert _count_reused(docs, {"x", "y", "k"}) == 0
@@ -0,0 +1,34 @@
+import numpy as np
+
+from core.lexical import BM25Index
+
+TEXTS = [
+    "funil de vendas e metas do trimestre",
+    "persona e dores do cliente ideal",
+    "funil funil funil conversão",
+    "marca e posicionamento",
+]
+
+
+def test_deleted_rows_leave_bm25_statistics():
+    index = BM25Index()
+    index.add(TEXTS, 0)
+    index.delete([2])
+
+    # mesma base sem a linha removida (a linha 2 vazia não conta no tamanho médio)
+    fresh = BM25Index()
+    fresh.add([TEXTS[0], TEXTS[1], TEXTS[3]], 0)
+
+    scores = index.scores("funil metas")
+    expected = fresh.scores("funil metas")
+    np.testing.assert_allclose(scores[[0, 1, 3]], expected, rtol=1e-6)
+    assert scores[2] == 0
+    assert 2 not in index.search("funil", 4).tolist()
+
+
+def test_add_after_delete_keeps_rows_removed():
+    index = BM25Index()
+    index.add(TEXTS[:2], 0)
+    index.delete([0])
+    index.add(TEXTS[2:], 2)
+    assert index.search("funil", 4).tolist() == [2]
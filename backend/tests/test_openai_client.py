@@ -0,0 +1,37 @@
+import asyncio
+import types
+
+from services import openai_client as oc
+
+
+class _Completions:
+    def __init__(self, delays):
+        self.delays = delays
+
+    async def create(self, model, stream=False, **kwargs):
+        await asyncio.sleep(self.delays["stream" if stream else "full"])
+        return object()
+
+
+def test_stream_opens_leave_hedge_delay_unchanged(monkeypatch):
+    delays = {"full": 0.03, "stream": 0.0}
+    fake = types.SimpleNamespace(chat=types.SimpleNamespace(completions=_Completions(delays)))
+    monkeypatch.setattr(oc, "client", fake)
+    monkeypatch.setattr(oc, "OPENAI_HEDGE_MIN_SAMPLES", 3)
+    oc.reset_stats()
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        for _ in range(5):
+            await oc._create("modelo", loop.time() + 5, messages=[])
+        before = oc._hedge_delay("modelo")
+        for _ in range(50):
+            await oc._create("modelo", loop.time() + 5, messages=[], stream=True)
+        return before, oc._hedge_delay("modelo")
+
+    try:
+        before, after = asyncio.run(run())
+    finally:
+        oc.reset_stats()
+    assert before >= 0.03
+    assert after == before
@@ -0,0 +1,75 @@
+"""
+Busca com a matriz int8 (escala por linha) + re-rank exato em float32,
+como no RAGEngine, contra a busca exata em float32.
+"""
+import numpy as np
+import pytest
+
+from core.embedding_store import EmbeddingStore
+from core.rag_engine import CANDIDATES_PER_RESULT
+from core.scoring import _normalize_rows, rerank_exact
+from core.vector_index import ExactIndex
+
+K = 6
+MIN_RECALL = 0.95
+
+
+def clustered(rows: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, rows)
+    return _normalize_rows(centers[labels] + rng.standard_normal((rows, dim)).astype(np.float32) * 0.6)
+
+
+@pytest.fixture(scope="module")
+def data():
+    embeddings = clustered(4000, 96, 60)
+    rng = np.random.default_rng(1)
+    queries = embeddings[rng.choice(len(embeddings), 100, replace=False)]
+    queries = _normalize_rows(queries + rng.standard_normal(queries.shape).astype(np.float32) * 0.05)
+    exact = ExactIndex()
+    truth = [exact.search(embeddings, q, K) for q in queries]
+    return embeddings, queries, truth
+
+
+@pytest.fixture
+def int8_store(tmp_path, data):
+    embeddings, _, _ = data
+    store = EmbeddingStore(tmp_path / "embeddings.npy", tmp_path / "knowledge.jsonl", "int8", keep_full=True)
+    store.append([{"id": str(i)} for i in range(len(embeddings))], embeddings)
+    return store
+
+
+def recall(found, expected) -> float:
+    return len(np.intersect1d(found, expected)) / K
+
+
+def test_int8_with_float32_rerank_matches_float32_top_k(int8_store, data):
+    _, queries, truth = data
+    matrix, full = int8_store.mmap(), int8_store.mmap_full()
+    assert full is not None and full.dtype == np.float32
+
+    index = ExactIndex()
+    recalls = [
+        recall(rerank_exact(full, q, index.search(matrix, q, K * CANDIDATES_PER_RESULT))[:K], expected)
+        for q, expected in zip(queries, truth)
+    ]
+    assert np.mean(recalls) >= MIN_RECALL
+
+
+def test_reranked_scores_are_exact(int8_store, data):
+    embeddings, queries, _ = data
+    matrix, full = int8_store.mmap(), int8_store.mmap_full()
+    q = queries[0]
+    rows = rerank_exact(full, q, ExactIndex().search(matrix, q, K * CANDIDATES_PER_RESULT))
+    scores = embeddings[rows] @ q
+    # ordem final pelo cosseno float32, não pelo aproximado
+    assert np.all(np.diff(scores) <= 1e-6)
+    np.testing.assert_allclose(np.asarray(full[rows]), embeddings[rows], atol=1e-6)
+
+
+def test_int8_rows_keep_direction(int8_store, data):
+    embeddings, _, _ = data
+    approx = _normalize_rows(np.asarray(int8_store.mmap()[np.arange(200)], dtype=np.float32))
+    cosines = np.sum(approx * embeddings[:200], axis=1)
+    assert cosines.min() >= 0.99
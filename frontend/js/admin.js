@@ -49,17 +49,17 @@ document.addEventListener("DOMContentLoaded", () => {
   // ===========================================================
   async function handleUpload() {
     if (!fileInput || !fileInput.files || fileInput.files.length === 0) {
-      uploadStatus.textContent = "Selecione ao menos um arquivo PPTX.";
+      uploadStatus.textContent = "Selecione ao menos um arquivo (PPTX, PDF ou DOCX).";
       return;
     }
 
     const files = Array.from(fileInput.files); // <-- pega todos os arquivos
     const step = stepSelect ? stepSelect.value : "diagnostico";
 
-    // Validação (todos precisam ser .pptx)
-    const invalid = files.some(f => !f.name.toLowerCase().endsWith(".pptx"));
+    // Validação (todos precisam ser .pptx, .pdf ou .docx)
+    const invalid = files.some(f => !/\.(pptx|pdf|docx)$/i.test(f.name));
     if (invalid) {
-      uploadStatus.textContent = "Todos os arquivos devem ser PPTX.";
+      uploadStatus.textContent = "Todos os arquivos devem ser PPTX, PDF ou DOCX.";
       return;
     }
 
@@ -81,16 +81,16 @@ function setupAdmin() {
 
   async function handleUpload() {
     if (!fileInput || !fileInput.files || fileInput.files.length === 0) {
-      uploadStatus.textContent = "Selecione ao menos um arquivo PPTX.";
+      uploadStatus.textContent = "Selecione ao menos um arquivo (PPTX, PDF ou DOCX).";
       return;
     }
 
     const files = Array.from(fileInput.files);
     const step = stepSelect ? stepSelect.value : "diagnostico";
 
-    const invalid = files.some(f => !f.name.toLowerCase().endsWith(".pptx"));
+    const invalid = files.some(f => !/\.(pptx|pdf|docx)$/i.test(f.name));
     if (invalid) {
-      uploadStatus.textContent = "Todos os arquivos devem ser PPTX.";
+      uploadStatus.textContent = "Todos os arquivos devem ser PPTX, PDF ou DOCX.";
       return;
     }
 
@@ -122,9 +122,15 @@ function setupAdmin() {
         return;
       }
 
-      const data = await res.json();
+      const queued = await res.json();
+      uploadStatus.textContent = "Arquivos recebidos. Processando...";
+
+      const data = await waitForJob(queued.job_id);
+      if (!data) return;
+
       uploadStatus.textContent =
-        `Upload concluído. ${data.added} arquivo(s) processado(s). ` +
+        `Upload concluído. ${data.added} novo(s), ${data.updated} atualizado(s), ` +
+        `${data.skipped} sem mudança (${data.chunks_embedded} trecho(s) processado(s)). ` +
         `Total na base: ${data.docs_total}.`;
 
       await refreshStats();
@@ -136,6 +142,33 @@ function setupAdmin() {
     }
   }
 
+  // Acompanha o job de ingestão até terminar; retorna o resultado ou null em caso de erro
+  async function waitForJob(jobId) {
+    while (true) {
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+
+      const res = await fetch(`${BACKEND_URL}/admin/jobs/${jobId}`, {
+        headers: getAuthHeaders(),
+      });
+
+      if (res.status === 401 || res.status === 403) {
+        logout();
+        return null;
+      }
+      if (!res.ok) throw new Error(`HTTP ${res.status}`);
+
+      const job = await res.json();
+      if (job.status === "done") return job.result;
+      if (job.status === "error") {
+        uploadStatus.textContent = `Erro ao processar os arquivos: ${job.error}`;
+        return null;
+      }
+
+      const pct = Math.round((job.progress || 0) * 100);
+      uploadStatus.textContent = `Processando arquivos... ${pct}%`;
+    }
+  }
+
   async function handleReload() {
     if (reloadStatus) reloadStatus.textContent = "Recarregando...";
 
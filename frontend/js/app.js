@@ -10,6 +10,7 @@ const BACKEND_URL = isProduction ? 'http://3.235.65.249/api' : 'http://127.0.0.1
 
 // 🚀 ROTA CORRETA DO BACKEND
 const CHAT_ENDPOINT = `${BACKEND_URL}/agent/ask`;
+const CHAT_STREAM_ENDPOINT = `${BACKEND_URL}/agent/ask/stream`;
 const KNOWLEDGE_ENDPOINT = `${BACKEND_URL}/admin/knowledge`;
 
 document.addEventListener("DOMContentLoaded", () => {
@@ -171,7 +172,8 @@ function setupChat() {
 
   let isSending = false;
   let typingEl = null;
-  let history = [];
+  // O histórico fica no servidor: cada carregamento da página é uma conversa nova
+  const sessionId = newSessionId();
 
   async function handleSend() {
     const text = chatInput.value.trim();
@@ -182,8 +184,6 @@ function setupChat() {
     addMessage(chatWindow, text, "user");
     chatInput.value = "";
 
-    history.push({ role: "user", content: text });
-
     typingEl = addTypingIndicator(chatWindow);
     isSending = true;
     sendBtn.disabled = true;
@@ -192,29 +192,46 @@ function setupChat() {
       const payload = {
         startup_id: config.startup || "Minha Startup",
         step: config.step || "todas",
-        history: history,
+        session_id: sessionId,
         user_input: text,
       };
 
-      const res = await fetch(CHAT_ENDPOINT, {
+      const res = await fetch(CHAT_STREAM_ENDPOINT, {
         method: "POST",
         headers: getAuthHeaders(),
         body: JSON.stringify(payload),
       });
 
-      if (!res.ok) throw new Error(`HTTP ${res.status}`);
-
-      const data = await res.json();
-      const answer = data.response || "O backend não retornou resposta.";
-
-      removeTypingIndicator(chatWindow, typingEl);
-      typingEl = null;
+      if (!res.ok || !res.body) throw new Error(`HTTP ${res.status}`);
+
+      // Resposta via Server-Sent Events: o texto aparece conforme é gerado
+      let answer = "";
+      let bubble = null;
+
+      await readEventStream(res, (event, data) => {
+        if (event === "token") {
+          if (!bubble) {
+            removeTypingIndicator(chatWindow, typingEl);
+            typingEl = null;
+            bubble = addMessage(chatWindow, "", "agent");
+          }
+          answer += data.text;
+          bubble.textContent = answer;
+          chatWindow.scrollTop = chatWindow.scrollHeight;
+        } else if (event === "error") {
+          throw new Error(data.detail || "Erro no stream");
+        }
+      });
 
-      addMessage(chatWindow, answer, "agent");
-      history.push({ role: "assistant", content: answer });
+      if (!bubble) {
+        removeTypingIndicator(chatWindow, typingEl);
+        typingEl = null;
+        answer = "O backend não retornou resposta.";
+        addMessage(chatWindow, answer, "agent");
+      }
 
     } catch (err) {
-      if (!IS_PRODUCTION) console.error("Erro ao chamar backend /agent/ask:", err);
+      if (!IS_PRODUCTION) console.error("Erro ao chamar backend /agent/ask/stream:", err);
       removeTypingIndicator(chatWindow, typingEl);
       typingEl = null;
 
@@ -239,6 +256,11 @@ function setupChat() {
   });
 }
 
+function newSessionId() {
+  if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
 // Mensagens -------------------------------------------------
 
 function addMessage(container, text, sender = "user") {
@@ -256,6 +278,34 @@ function addMessage(container, text, sender = "user") {
   wrapper.appendChild(bubble);
   container.appendChild(wrapper);
   container.scrollTop = container.scrollHeight;
+  return bubble;
+}
+
+// Lê uma resposta text/event-stream e chama onEvent(evento, dadosJSON) a cada evento
+async function readEventStream(res, onEvent) {
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let sep;
+    while ((sep = buffer.indexOf("\n\n")) !== -1) {
+      const raw = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+
+      let event = "message";
+      let data = "";
+      raw.split("\n").forEach((line) => {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      });
+      if (data) onEvent(event, JSON.parse(data));
+    }
+  }
 }
 
 function addTypingIndicator(container) {